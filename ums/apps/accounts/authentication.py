@@ -0,0 +1,33 @@
+from django.conf import settings
+from django.core.cache import cache
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.settings import api_settings
+
+CACHE_PREFIX = 'accounts:jwt-user:'
+
+
+def user_cache_key(user_id):
+    return f'{CACHE_PREFIX}{user_id}'
+
+
+class CachedJWTAuthentication(JWTAuthentication):
+    """
+    按 token 中的 user id（USER_ID_FIELD，即 phone_number）缓存用户，JWT_USER_CACHE_TIMEOUT 秒过期，
+    OCTUser 保存、删除时由 signals 失效。
+    """
+
+    def get_user(self, validated_token):
+        user_id = validated_token.get(api_settings.USER_ID_CLAIM)
+        if user_id is None:
+            return super().get_user(validated_token)
+        key = user_cache_key(user_id)
+        user = cache.get(key)
+        if user is None:
+            # 用户不存在或已停用时 super() 抛出 AuthenticationFailed，不写缓存
+            user = super().get_user(validated_token)
+            cache.set(key, user, getattr(settings, 'JWT_USER_CACHE_TIMEOUT', 60))
+        return user
+
+
+def invalidate_user(*user_ids):
+    cache.delete_many([user_cache_key(user_id) for user_id in user_ids if user_id])
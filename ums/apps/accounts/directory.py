@@ -0,0 +1,47 @@
+"""
+选人控件使用的角色目录缓存。
+
+按角色分组的 {value, label} 列表由一次 values_list 查询生成，缓存在 django cache 中，
+OCTUser 保存、删除时失效（signals.py），ROLE_DIRECTORY_CACHE_TIMEOUT 为兜底过期时间。
+"""
+import hashlib
+import json
+
+from django.conf import settings
+from django.core.cache import cache
+
+from .models import OCTUser
+from .utils import RoleChoices
+
+CACHE_KEY = 'accounts:role-directory'
+
+DIRECTORY_ROLES = {
+    'sponsor': (RoleChoices.PROJECT_SPONSOR.value,),
+    'approver': (RoleChoices.APPROVAL_LEADER.value,),
+    'member': (RoleChoices.PROJECT_SPONSOR.value, RoleChoices.PROJECT_WORKER.value,
+               RoleChoices.SECRETARY.value, RoleChoices.ADMIN.value),
+}
+
+
+def _build():
+    roles = {role for values in DIRECTORY_ROLES.values() for role in values}
+    rows = list(OCTUser.objects.filter(role__in=roles).order_by('id').values_list('id', 'name', 'role'))
+    directory = {}
+    for key, values in DIRECTORY_ROLES.items():
+        items = [{'value': uid, 'label': str(name)} for uid, name, role in rows if role in values]
+        etag = hashlib.sha1(json.dumps(items, ensure_ascii=False).encode('utf-8')).hexdigest()
+        directory[key] = {'etag': f'"{etag}"', 'items': items}
+    return directory
+
+
+def get_directory(key):
+    """返回 {'etag': ..., 'items': [{'value': id, 'label': name}, ...]}"""
+    directory = cache.get(CACHE_KEY)
+    if directory is None:
+        directory = _build()
+        cache.set(CACHE_KEY, directory, getattr(settings, 'ROLE_DIRECTORY_CACHE_TIMEOUT', 300))
+    return directory[key]
+
+
+def invalidate():
+    cache.delete(CACHE_KEY)
@@ -0,0 +1,31 @@
+from django_filters import rest_framework as filters
+
+from .models import OCTUser
+
+
+class StrictFilterSet(filters.FilterSet):
+    """未声明的查询参数返回 400，避免任意字段、跨表过滤"""
+    # 非过滤用途的通用参数
+    allowed_params = ('format',)
+
+    def is_valid(self):
+        valid = super().is_valid()
+        unknown = sorted(set(self.data) - set(self.filters) - set(self.allowed_params))
+        if unknown:
+            self.form.add_error(None, f"不支持的查询参数: {', '.join(unknown)}")
+            return False
+        return valid
+
+
+class UserFilter(StrictFilterSet):
+    """只允许按有索引的字段过滤"""
+
+    class Meta:
+        model = OCTUser
+        fields = {
+            'id': ['exact', 'in'],
+            'username': ['exact'],
+            'role': ['exact', 'in'],
+            'department': ['exact'],
+            'phone_number': ['exact'],
+        }
@@ -0,0 +1,29 @@
+# Generated by Django 4.0.3 on 2026-10-18 17:19
+
+import django.core.validators
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='octuser',
+            name='department',
+            field=models.CharField(blank=True, db_index=True, max_length=150, verbose_name='department'),
+        ),
+        migrations.AlterField(
+            model_name='octuser',
+            name='phone_number',
+            field=models.CharField(blank=True, db_index=True, max_length=17, validators=[django.core.validators.RegexValidator(message="Phone number must be entered in the format: '+999999999'. Up to 15 digits allowed.", regex='^\\+?1?\\d{9,15}$')]),
+        ),
+        migrations.AlterField(
+            model_name='octuser',
+            name='role',
+            field=models.IntegerField(choices=[(1, 'Secretary'), (2, 'Project Worker'), (3, 'Project Sponsor'), (4, 'Approval Leader'), (5, 'Admin'), (6, 'Dev'), (7, 'Leader'), (-1, 'Anon')], db_index=True, null=True, verbose_name='role'),
+        ),
+    ]
@@ -0,0 +1,46 @@
+import django.core.validators
+from django.db import migrations, models
+from django.db.models import Count
+
+PHONE_VALIDATOR = django.core.validators.RegexValidator(
+    message="Phone number must be entered in the format: '+999999999'. Up to 15 digits allowed.",
+    regex='^\\+?1?\\d{9,15}$'
+)
+
+
+def empty_to_null(apps, schema_editor):
+    """空手机号改为 NULL；存在重复手机号时中止，需先人工处理"""
+    OCTUser = apps.get_model('accounts', 'OCTUser')
+    OCTUser.objects.filter(phone_number='').update(phone_number=None)
+    duplicates = list(
+        OCTUser.objects.exclude(phone_number__isnull=True).values('phone_number').annotate(
+            n=Count('id')).filter(n__gt=1).values_list('phone_number', flat=True)
+    )
+    if duplicates:
+        raise RuntimeError(f'duplicate phone numbers must be fixed before migrating: {duplicates}')
+
+
+def null_to_empty(apps, schema_editor):
+    OCTUser = apps.get_model('accounts', 'OCTUser')
+    OCTUser.objects.filter(phone_number__isnull=True).update(phone_number='')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0002_user_filter_indexes'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='octuser',
+            name='phone_number',
+            field=models.CharField(blank=True, db_index=True, max_length=17, null=True, validators=[PHONE_VALIDATOR]),
+        ),
+        migrations.RunPython(empty_to_null, null_to_empty),
+        migrations.AlterField(
+            model_name='octuser',
+            name='phone_number',
+            field=models.CharField(blank=True, max_length=17, null=True, unique=True, validators=[PHONE_VALIDATOR]),
+        ),
+    ]
@@ -34,9 +34,11 @@ class OCTUser(AbstractBaseUser, PermissionsMixin):
         },
     )
     name = models.CharField(_("name"), max_length=150, blank=True)
-    phone_number = models.CharField(validators=[phone_regex], max_length=17, blank=True)  # Validators should be a list
-    department = models.CharField(_("department"), max_length=150, blank=True)
-    role = models.IntegerField(choices=RoleChoices.choices, verbose_name=_('role'), null=True)
+    # SIMPLE_JWT 的 USER_ID_FIELD，需唯一；未填写时存 NULL
+    phone_number = models.CharField(validators=[phone_regex], max_length=17, blank=True, null=True,
+                                    unique=True)  # Validators should be a list
+    department = models.CharField(_("department"), max_length=150, blank=True, db_index=True)
+    role = models.IntegerField(choices=RoleChoices.choices, verbose_name=_('role'), null=True, db_index=True)
     email = models.EmailField(_("email address"), blank=True)
     mime = models.URLField(_('头像'), max_length=255, blank=True)
     is_staff = models.BooleanField(
@@ -70,6 +72,11 @@ class OCTUser(AbstractBaseUser, PermissionsMixin):
         super().clean()
         self.email = self.__class__.objects.normalize_email(self.email)
 
+    def save(self, *args, **kwargs):
+        if not self.phone_number:
+            self.phone_number = None
+        super().save(*args, **kwargs)
+
     def get_full_name(self):
         """
         Return the first_name plus the last_name, with a space in between.
@@ -0,0 +1,95 @@
+"""
+选人 typeahead 的内存前缀索引。
+
+姓名、用户名、部门（casefold 后）排序存放，前缀查询用二分查找确定范围，不访问数据库。
+OCTUser 保存、删除时 signals 更新 cache 中的版本号，各进程在下次查询时发现版本变化后重建；
+USER_SEARCH_INDEX_TIMEOUT 为兜底重建间隔。
+"""
+import heapq
+import threading
+import time
+import uuid
+from bisect import bisect_left
+
+from django.conf import settings
+from django.core.cache import cache
+
+from .models import OCTUser
+
+VERSION_KEY = 'accounts:user-search-version'
+# 顺序扫描的最大行数，超过后改用范围查找
+SCAN_BUDGET = 2000
+
+_lock = threading.Lock()
+_index = None
+
+
+class PrefixIndex:
+
+    def __init__(self, rows, version):
+        self.version = version
+        self.built = time.monotonic()
+        # 按 (name, id) 排序，rank 即为结果顺序
+        self.users = sorted(rows, key=lambda row: (row[1], row[0]))
+        self.folded = [tuple(str(value).casefold() for value in row[1:4] if value) for row in self.users]
+        self.keys = sorted((key, rank) for rank, keys in enumerate(self.folded) for key in keys)
+        self.by_role = {}
+        for rank, row in enumerate(self.users):
+            self.by_role.setdefault(row[4], []).append(rank)
+
+    def search(self, q, roles=None, offset=0, limit=20):
+        """返回 (users, has_more)，users 为 (id, name, username, department, role)"""
+        wanted = offset + limit + 1
+        if not q:
+            if roles:
+                ranks = heapq.merge(*(self.by_role.get(role, ()) for role in roles))
+            else:
+                ranks = range(len(self.users))
+            rows = [self.users[rank] for _, rank in zip(range(wanted), ranks)]
+            return rows[offset:offset + limit], len(rows) > offset + limit
+        q = q.casefold()
+        lo = bisect_left(self.keys, (q,))
+        hi = bisect_left(self.keys, (q + '\U0010ffff',))
+        rows = None
+        if (hi - lo) * 8 > len(self.users):
+            # 匹配的用户很多时先按结果顺序扫描，取够即停
+            rows = []
+            for row, keys in zip(self.users[:SCAN_BUDGET], self.folded):
+                if (not roles or row[4] in roles) and any(key.startswith(q) for key in keys):
+                    rows.append(row)
+                    if len(rows) == wanted:
+                        break
+            else:
+                if len(self.users) > SCAN_BUDGET:
+                    rows = None
+        if rows is None:
+            ranks = {rank for _, rank in self.keys[lo:hi] if not roles or self.users[rank][4] in roles}
+            rows = [self.users[rank] for rank in heapq.nsmallest(wanted, ranks)]
+        rows = rows[offset:]
+        return rows[:limit], len(rows) > limit
+
+
+def _build(version):
+    rows = list(OCTUser.objects.filter(is_active=True).values_list('id', 'name', 'username', 'department', 'role'))
+    return PrefixIndex(rows, version)
+
+
+def get_index():
+    global _index
+    version = cache.get(VERSION_KEY)
+    if version is None:
+        version = uuid.uuid4().hex
+        cache.add(VERSION_KEY, version, None)
+        version = cache.get(VERSION_KEY, version)
+    timeout = getattr(settings, 'USER_SEARCH_INDEX_TIMEOUT', 300)
+    index = _index
+    if index is None or index.version != version or time.monotonic() - index.built > timeout:
+        with _lock:
+            index = _index
+            if index is None or index.version != version or time.monotonic() - index.built > timeout:
+                index = _index = _build(version)
+    return index
+
+
+def invalidate():
+    cache.set(VERSION_KEY, uuid.uuid4().hex, None)
@@ -0,0 +1,49 @@
+from django.db.models.signals import post_delete, post_save, pre_save
+from django.dispatch import receiver
+
+from . import directory, search
+from .authentication import invalidate_user
+from .models import OCTUser
+
+# 缓存用到的字段：只有这些字段变化时才失效目录和搜索索引，last_login 等写入不清空缓存
+TRACKED_FIELDS = ('phone_number', 'name', 'username', 'department', 'role', 'is_active')
+DIRECTORY_FIELDS = {'name', 'role'}
+SEARCH_FIELDS = {'name', 'username', 'department', 'role', 'is_active'}
+# 只写这些字段（登录时的 update_last_login）时不影响任何缓存
+IGNORED_UPDATE_FIELDS = {'last_login'}
+
+
+def _ignored(update_fields):
+    return bool(update_fields) and set(update_fields) <= IGNORED_UPDATE_FIELDS
+
+
+@receiver(pre_save, sender=OCTUser)
+def remember_cached_fields(sender, instance, update_fields=None, **kwargs):
+    # 记下修改前的值；手机号即 token 中的 user id，修改手机号时需同时失效旧 id 的缓存
+    instance._previous_cached_fields = None
+    if instance.pk and not _ignored(update_fields):
+        instance._previous_cached_fields = OCTUser.objects.filter(pk=instance.pk).values(*TRACKED_FIELDS).first()
+
+
+@receiver(post_save, sender=OCTUser)
+def invalidate_user_caches(sender, instance, created, update_fields=None, **kwargs):
+    if _ignored(update_fields):
+        return
+    previous = instance.__dict__.pop('_previous_cached_fields', None)
+    if created or previous is None:
+        changed = set(TRACKED_FIELDS)
+    else:
+        changed = {field for field in TRACKED_FIELDS if getattr(instance, field) != previous[field]}
+    if changed & DIRECTORY_FIELDS:
+        directory.invalidate()
+    if changed & SEARCH_FIELDS:
+        search.invalidate()
+    # 认证缓存的是整个用户对象（密码、权限标志等），除 last_login 外的保存都失效
+    invalidate_user(instance.phone_number, previous and previous['phone_number'])
+
+
+@receiver(post_delete, sender=OCTUser)
+def invalidate_deleted_user(sender, instance, **kwargs):
+    directory.invalidate()
+    search.invalidate()
+    invalidate_user(instance.phone_number)
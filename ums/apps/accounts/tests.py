@@ -1,3 +1,55 @@
+from django.contrib.auth.models import update_last_login
+from django.core.cache import cache
 from django.test import TestCase
 
-# Create your tests here.
+from . import directory, search
+from .authentication import user_cache_key
+from .models import OCTUser
+from .utils import RoleChoices
+
+
+class UserCacheInvalidationTest(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.user = OCTUser.objects.create(username='sponsor', name='sponsor', phone_number='13800000001',
+                                           role=RoleChoices.PROJECT_SPONSOR.value)
+        directory.get_directory('sponsor')
+        search.get_index()
+        cache.set(user_cache_key(self.user.phone_number), self.user)
+
+    def assertCached(self, directory_cached, search_cached, user_cached):
+        self.assertEqual(cache.get(directory.CACHE_KEY) is not None, directory_cached)
+        self.assertEqual(cache.get(search.VERSION_KEY) == self.search_version, search_cached)
+        self.assertEqual(cache.get(user_cache_key(self.user.phone_number)) is not None, user_cached)
+
+    def save(self):
+        self.search_version = cache.get(search.VERSION_KEY)
+        self.user.save()
+
+    def test_last_login_keeps_caches(self):
+        self.search_version = cache.get(search.VERSION_KEY)
+        update_last_login(None, self.user)
+        self.assertCached(True, True, True)
+
+    def test_unrelated_field_keeps_directory_and_search(self):
+        self.user.email = 'sponsor@example.com'
+        self.save()
+        self.assertCached(True, True, False)
+
+    def test_department_invalidates_search_only(self):
+        self.user.department = 'design'
+        self.save()
+        self.assertCached(True, False, False)
+
+    def test_name_invalidates_all(self):
+        self.user.name = 'renamed'
+        self.save()
+        self.assertCached(False, False, False)
+        self.assertEqual(directory.get_directory('sponsor')['items'], [{'value': self.user.pk, 'label': 'renamed'}])
+
+    def test_phone_change_invalidates_previous_id(self):
+        old = self.user.phone_number
+        self.user.phone_number = '13800000002'
+        self.user.save()
+        self.assertIsNone(cache.get(user_cache_key(old)))
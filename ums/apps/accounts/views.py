@@ -1,5 +1,3 @@
-import json
-from django.db.models.query import QuerySet
 from django.conf import settings
 from django.contrib.auth.models import Permission
 
@@ -7,12 +5,16 @@ from rest_framework import generics
 from rest_framework.decorators import action
 from rest_framework.views import APIView
 from django.shortcuts import get_object_or_404
+from django.utils.cache import get_conditional_response
 from rest_framework import viewsets
 from rest_framework import status
 from rest_framework.response import Response
 from rest_framework.permissions import IsAuthenticated
 from rest_framework.permissions import DjangoModelPermissionsOrAnonReadOnly
 from guardian.shortcuts import assign_perm
+from django_filters.rest_framework import DjangoFilterBackend
+from . import directory, search
+from .filters import UserFilter
 from .models import OCTUser, GroupType, GroupProfile
 from .serializers import UserSerializer, GroupTypeSerializer, GroupProfileSerializer
 from .utils import RoleChoices
@@ -28,22 +30,9 @@ class UserViewSet(viewsets.ModelViewSet):
     serializer_class = UserSerializer
     lookup_field = 'phone_number'
     permission_classes = [DjangoModelPermissionsOrAnonReadOnly]
-
-    def get_queryset(self):
-        try:
-            other_param = self.request.query_params.dict()
-            if "format" in other_param.keys():
-                other_param.pop("format")
-        except json.decoder.JSONDecodeError:
-            other_param = None
-        queryset = self.queryset
-
-        if isinstance(queryset, QuerySet):
-            if other_param:
-                queryset = queryset.filter(**other_param)
-            else:
-                queryset = queryset.all()
-        return queryset
+    # 只允许 UserFilter 中声明的字段，其他参数返回 400
+    filter_backends = [DjangoFilterBackend]
+    filterset_class = UserFilter
 
     def create(self, request, *args, **kwargs):
         serializer = self.get_serializer(data=request.data)
@@ -63,45 +52,59 @@ class UserViewSet(viewsets.ModelViewSet):
                 assign_perm(p, instance)
 
 
+    def _directory_response(self, request, key):
+        # 角色目录走缓存，客户端带 If-None-Match 时返回 304
+        entry = directory.get_directory(key)
+        response = get_conditional_response(request, etag=entry['etag'])
+        if response is None:
+            response = Response(entry['items'])
+        response['ETag'] = entry['etag']
+        return response
+
+    @action(detail=False, url_path='search')
+    def search_users(self, request):
+        """
+        选人 typeahead：q 匹配姓名、用户名、部门的前缀（内存前缀索引，见 search.py），
+        scope=member|sponsor|approver 或 roles=1,2 限定角色，limit/offset 分页
+        """
+        q = request.query_params.get('q', '').strip()
+        scope = request.query_params.get('scope')
+        try:
+            limit = min(max(int(request.query_params.get('limit', 20)), 1), 50)
+            offset = max(int(request.query_params.get('offset', 0)), 0)
+            roles = [int(i) for i in request.query_params.get('roles', '').split(',') if i]
+        except ValueError:
+            return Response({'msg': '请求错误。'}, status=status.HTTP_400_BAD_REQUEST)
+        if scope:
+            if scope not in directory.DIRECTORY_ROLES:
+                return Response({'msg': '请求错误。'}, status=status.HTTP_400_BAD_REQUEST)
+            roles = list(directory.DIRECTORY_ROLES[scope])
+        rows, has_more = search.get_index().search(q, set(roles), offset, limit)
+        return Response({
+            'results': [
+                {
+                    'value': uid,
+                    'label': str(name),
+                    'username': username,
+                    'department': department,
+                    'role': role,
+                } for uid, name, username, department, role in rows
+            ],
+            'has_more': has_more,
+            'next_offset': offset + limit if has_more else None,
+        })
+
     @action(detail=False)
     def get_sponsor_users(self, request):
-        # todo add try catch
-        sponsors = OCTUser.objects.filter(role=RoleChoices.PROJECT_SPONSOR.value)
-        data = []
-        for obj in sponsors:
-            if obj:
-                data.append({
-                    'value': obj.id,
-                    'label': obj.name,
-                })
-        return Response(data)
+        return self._directory_response(request, 'sponsor')
 
     @action(detail=False)
     def get_approver_users(self, request):
-        # todo add try catch
-        sponsors = OCTUser.objects.filter(role=RoleChoices.APPROVAL_LEADER.value)
-        data = []
-        for obj in sponsors:
-            if obj:
-                data.append({
-                    'value': obj.id,
-                    'label': obj.name,
-                })
-        return Response(data)
+        return self._directory_response(request, 'approver')
 
     @action(detail=False)
     def get_member_users(self, request):
-        # todo add try catch
-        sponsors = OCTUser.objects.filter(role__in=[RoleChoices.PROJECT_SPONSOR.value, RoleChoices.PROJECT_WORKER.value,
-                                                    RoleChoices.SECRETARY.value, RoleChoices.ADMIN.value])
-        data = []
-        for obj in sponsors:
-            if obj:
-                data.append({
-                    'value': obj.id,
-                    'label': f"""{str(obj.name)}""",
-                })
-        return Response(data)
+        return self._directory_response(request, 'member')
 
 
 class GroupTypeListView(generics.ListAPIView):
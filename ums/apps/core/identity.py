@@ -0,0 +1,96 @@
+"""
+请求级 identity map。
+
+同一个请求内，ContentType、用户、项目、成果以及项目的成员/负责人/审批人集合只从数据库加载一次，
+flow 与 view 通过 get_identity_map() 共享。请求结束即丢弃，不做跨请求缓存。
+"""
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from django.contrib.contenttypes.models import ContentType
+
+_current = ContextVar('identity_map', default=None)
+
+
+class IdentityMap:
+
+    def __init__(self):
+        self._store = {}
+        self.hits = 0
+        self.misses = 0
+
+    def get_or_load(self, key, loader):
+        try:
+            value = self._store[key]
+        except KeyError:
+            self.misses += 1
+            value = self._store[key] = loader()
+        else:
+            self.hits += 1
+        return value
+
+    def discard(self, key):
+        self._store.pop(key, None)
+
+    def content_type(self, model):
+        """model 可以是模型类或实例"""
+        model = model if isinstance(model, type) else model.__class__
+        return self.get_or_load(
+            ('contenttype', model._meta.label_lower), lambda: ContentType.objects.get_for_model(model)
+        )
+
+    def add(self, obj):
+        """登记一个已经加载的对象，之后按主键获取不再查询"""
+        self._store.setdefault(('object', obj._meta.label_lower, obj.pk), obj)
+        return obj
+
+    def get(self, model, pk):
+        return self.get_or_load(('object', model._meta.label_lower, pk), lambda: model.objects.get(pk=pk))
+
+    def get_many(self, model, pks):
+        """返回 {pk: obj}，未命中的主键一次查询补齐；不存在的主键不出现在结果中"""
+        label = model._meta.label_lower
+        found, missing = {}, []
+        for pk in pks:
+            obj = self._store.get(('object', label, pk))
+            if obj is None:
+                missing.append(pk)
+            else:
+                found[pk] = obj
+        self.hits += len(found)
+        if missing:
+            self.misses += len(missing)
+            for pk, obj in model.objects.in_bulk(missing).items():
+                found[pk] = self.add(obj)
+        return found
+
+    def related_ids(self, instance, relation):
+        """instance 上多对多关系的对象 id 集合，如 related_ids(project, 'project_sponsor')"""
+        return self.get_or_load(
+            ('related', instance._meta.label_lower, instance.pk, relation),
+            lambda: frozenset(getattr(instance, relation).values_list('pk', flat=True))
+        )
+
+    def stats(self):
+        return {'hits': self.hits, 'misses': self.misses, 'size': len(self._store)}
+
+
+def get_identity_map():
+    """
+    返回当前请求的 identity map；不在请求（或 identity_scope）内时返回一个临时实例，不共享。
+    """
+    identity_map = _current.get()
+    if identity_map is None:
+        identity_map = IdentityMap()
+    return identity_map
+
+
+@contextmanager
+def identity_scope():
+    """在请求之外（管理命令、测试）开启一个 identity map 作用域"""
+    identity_map = IdentityMap()
+    token = _current.set(identity_map)
+    try:
+        yield identity_map
+    finally:
+        _current.reset(token)
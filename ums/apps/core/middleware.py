@@ -0,0 +1,24 @@
+import logging
+
+from django.conf import settings
+
+from .identity import identity_scope
+
+logger = logging.getLogger(__name__)
+
+
+class IdentityMapMiddleware:
+    """为每个请求开启 identity map，DEBUG 时在响应头返回命中统计"""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        with identity_scope() as identity_map:
+            request.identity_map = identity_map
+            response = self.get_response(request)
+        stats = identity_map.stats()
+        logger.debug('identity map %s %s', request.path, stats)
+        if settings.DEBUG:
+            response['X-Identity-Map'] = 'hits={hits}; misses={misses}'.format(**stats)
+        return response
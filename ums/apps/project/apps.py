@@ -4,3 +4,6 @@ from django.apps import AppConfig
 class ProjectConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'ums.apps.project'
+
+    def ready(self):
+        from . import signals  # noqa: F401
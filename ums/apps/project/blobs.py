@@ -0,0 +1,124 @@
+"""
+成果文件的内容寻址存储。
+
+上传的文件按 sha256 和扩展名存为 FileBlob（blobs/ab/cd/<sha256>.<ext>），相同内容只写一次盘；
+FileManager.blob 引用它，ref_count 归零时删除 blob 及其文件。
+文件先写临时文件再原子改名，删除前在 blob 行锁下复查引用数。
+"""
+import hashlib
+import os
+import re
+import tempfile
+
+from django.db import IntegrityError, transaction
+from django.db.models import F
+
+from .models import FileBlob, blob_file_name
+
+EXT_RE = re.compile(r'^\.[0-9a-z]{1,15}$')
+
+
+def _storage():
+    return FileBlob._meta.get_field('file').storage
+
+
+def content_hash(fileobj):
+    """流式计算 sha256，返回 (sha256, size)"""
+    digest = hashlib.sha256()
+    size = 0
+    for chunk in fileobj.chunks():
+        digest.update(chunk)
+        size += len(chunk)
+    return digest.hexdigest(), size
+
+
+def blob_ext(filename):
+    """规范化的扩展名：小写，只含字母数字，不合法时为空"""
+    ext = os.path.splitext(filename or '')[1].lower()
+    return ext if EXT_RE.match(ext) else ''
+
+
+def _store(storage, name, fileobj, size):
+    """
+    确保 name 处是完整的文件：已存在且大小一致时直接复用，否则先写临时文件再原子改名，
+    进程中途退出只会留下临时文件，目标路径上不会出现写了一半的文件。
+    """
+    if storage.exists(name) and storage.size(name) == size:
+        return
+    path = storage.path(name)
+    directory = os.path.dirname(path)
+    os.makedirs(directory, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=directory, suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'wb') as fh:
+            for chunk in fileobj.chunks():
+                fh.write(chunk)
+        os.chmod(tmp_path, storage.file_permissions_mode or 0o644)
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+
+def acquire(fileobj, sha256=None):
+    """
+    取得 fileobj 内容（及扩展名）对应的 FileBlob 并增加一次引用，已存在时不写盘。
+    sha256 已知（如分片上传已校验）时跳过哈希计算。
+    """
+    ext = blob_ext(fileobj.name)
+    if sha256 is None:
+        sha256, size = content_hash(fileobj)
+    else:
+        size = fileobj.size
+    storage = _storage()
+    with transaction.atomic():
+        blob = FileBlob.objects.select_for_update().filter(sha256=sha256, ext=ext).first()
+        if blob is None:
+            blob = FileBlob(sha256=sha256, ext=ext, size=size)
+            blob.file.name = blob_file_name(blob, None)
+            _store(storage, blob.file.name, fileobj, size)
+            try:
+                with transaction.atomic():
+                    blob.save()
+            except IntegrityError:
+                # 并发上传了相同内容，文件相同，使用先登记的 blob
+                blob = FileBlob.objects.select_for_update().get(sha256=sha256, ext=ext)
+        elif blob.ref_count <= 0:
+            # 等待 purge 的 blob，文件可能已被删除
+            _store(storage, blob.file.name, fileobj, size)
+        FileBlob.objects.filter(pk=blob.pk).update(ref_count=F('ref_count') + 1)
+    return blob
+
+
+def release(blob_id):
+    """减少一次引用，归零时在提交后 purge"""
+    with transaction.atomic():
+        blob = FileBlob.objects.select_for_update().filter(pk=blob_id).first()
+        if blob is None:
+            return
+        FileBlob.objects.filter(pk=blob.pk).update(ref_count=F('ref_count') - 1)
+        if blob.ref_count <= 1:
+            transaction.on_commit(lambda: purge(blob.pk))
+
+
+def purge(blob_id):
+    """
+    删除无引用的 blob 及其文件。在行锁下复查引用数：并发的 acquire 或者已经重新引用了它（跳过），
+    或者等待行锁，在 blob 删除后重新写入文件。
+    """
+    with transaction.atomic():
+        blob = FileBlob.objects.select_for_update().filter(pk=blob_id, ref_count__lte=0).first()
+        if blob is None:
+            return
+        _storage().delete(blob.file.name)
+        blob.delete()
+
+
+def attach(instance, fileobj, sha256=None):
+    """把 fileobj 存入 blob 并绑定到 FileManager（不保存 instance）"""
+    instance.filename = fileobj.name.replace('\\', '/').split('/')[-1]
+    blob = acquire(fileobj, sha256)
+    instance.blob = blob
+    instance.file = blob.file.name
+    return blob
@@ -0,0 +1,97 @@
+"""
+UserCounter 增量维护。
+
+flow 中每次改变 task / process 状态时记录前后状态，CounterUpdate.apply() 在同一事务中
+按增量更新计数（相同增量的用户合并为一条 UPDATE），并写入对应的 InboxEvent。
+"""
+from collections import defaultdict
+
+from django.db import transaction
+from django.db.models import Count, F, Q
+
+from . import inbox
+from .activation import STATUS
+from .models import Process, Task, UserCounter
+
+CLOSED_PROCESS_STATUS = (STATUS.DONE, STATUS.ERROR, STATUS.CANCELED, STATUS.DENY)
+FIELDS = ('assigned_tasks', 'open_processes')
+
+
+def is_open_process(status):
+    return status not in CLOSED_PROCESS_STATUS
+
+
+class CounterUpdate:
+
+    def __init__(self):
+        self._deltas = defaultdict(lambda: [0, 0])
+        self._events = []
+
+    def task(self, task, old_status, new_status):
+        """old_status 为 None 表示新建"""
+        if task.owner_id:
+            self._deltas[task.owner_id][0] += (new_status == STATUS.ASSIGNED) - (old_status == STATUS.ASSIGNED)
+        event = inbox.task_event(task, old_status, new_status)
+        if event is not None:
+            self._events.append(event)
+
+    def process(self, owner_id, old_status, new_status):
+        if owner_id:
+            was_open = old_status is not None and is_open_process(old_status)
+            self._deltas[owner_id][1] += is_open_process(new_status) - was_open
+
+    def apply(self):
+        deltas = {uid: tuple(d) for uid, d in self._deltas.items() if any(d)}
+        self._deltas.clear()
+        inbox.record(self._events)
+        self._events = []
+        if not deltas:
+            return
+        UserCounter.objects.bulk_create(
+            [UserCounter(user_id=uid) for uid in deltas], ignore_conflicts=True
+        )
+        groups = defaultdict(list)
+        for uid, delta in deltas.items():
+            groups[delta].append(uid)
+        for delta, user_ids in groups.items():
+            UserCounter.objects.filter(pk__in=user_ids).update(**{
+                field: F(field) + value for field, value in zip(FIELDS, delta) if value
+            })
+
+
+def get_counter(user):
+    """单条主键查询，没有记录时为 0"""
+    row = UserCounter.objects.filter(pk=user.pk).values_list(*FIELDS).first()
+    return dict(zip(FIELDS, row or (0, 0)))
+
+
+def rebuild(user_ids=None):
+    """
+    按 task / process 表重新计算计数，user_ids 为空时重建全部，返回更新的用户数。
+
+    先锁定计数行再统计：进行中的 flow 事务要么已提交（统计中已包含它的变化），要么在计数行锁上等待，
+    提交时在重建后的值上再加它的增量，不会被覆盖。
+    """
+    tasks = Task.objects.filter(status=STATUS.ASSIGNED, owner__isnull=False)
+    processes = Process.objects.filter(~Q(status__in=CLOSED_PROCESS_STATUS), owner__isnull=False)
+    counters = UserCounter.objects.all()
+    if user_ids is not None:
+        tasks = tasks.filter(owner_id__in=user_ids)
+        processes = processes.filter(owner_id__in=user_ids)
+        counters = counters.filter(pk__in=user_ids)
+    with transaction.atomic():
+        owners = set(tasks.values_list('owner_id', flat=True).distinct()) | \
+            set(processes.values_list('owner_id', flat=True).distinct())
+        UserCounter.objects.bulk_create([UserCounter(user_id=uid) for uid in owners], ignore_conflicts=True)
+        # 已有记录但已无待办的用户清零
+        values = {uid: [0, 0] for uid in counters.select_for_update().order_by('pk').values_list('pk', flat=True)}
+        # 锁定之后才出现的用户，其计数行由 flow 创建并按增量维护，不在此更新
+        for uid, n in tasks.values_list('owner_id').annotate(n=Count('id')).order_by():
+            if uid in values:
+                values[uid][0] = n
+        for uid, n in processes.values_list('owner_id').annotate(n=Count('id')).order_by():
+            if uid in values:
+                values[uid][1] = n
+        rows = [UserCounter(user_id=uid, assigned_tasks=a, open_processes=o) for uid, (a, o) in values.items()]
+        UserCounter.objects.bulk_update(rows, FIELDS, batch_size=500)
+    return len(rows)
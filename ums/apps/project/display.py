@@ -0,0 +1,168 @@
+"""
+展示平台对接。
+
+send-to-display 接口只把推送写入 DisplayPush（outbox），由 send_display_outbox 命令异步投递：
+带超时、指数退避重试，复用连接池；成功后批量回写文件展示链接。
+"""
+import json
+import logging
+from datetime import timedelta
+
+import requests
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+from requests.adapters import HTTPAdapter
+
+from .models import Achievement, DisplayPush, FileManager
+from .utils import DisplayPushStatusChoices
+
+logger = logging.getLogger(__name__)
+
+# 投递中的推送在此时间内不会被其他 worker 重复领取
+CLAIM_LEASE = timedelta(minutes=5)
+
+
+class DisplayError(Exception):
+    pass
+
+
+def build_payload(instance, base_url):
+    """base_url 形如 http://host:port，用于拼接文件的绝对地址"""
+    project = instance.project
+    return {
+        "result_id": instance.id,
+        "contract_number": instance.name,
+        "pro_id": project.id,
+        "pro_name": project.project_title,
+        "pro_type": project.get_project_type_display(),
+        "pro_cls": project.get_project_cate_display(),
+        "file_list": [
+            {
+                "file_id": file.id,
+                "file_name": file.name,
+                "file_url": f"{base_url}{file.file.url}",
+                "file_tags": [i.name for i in file.tags.all()]
+            } for file in
+            instance.files.all()
+        ]
+    }
+
+
+def enqueue(instance, base_url):
+    """入队，同一成果已有待发送的推送时直接返回它。返回 (push, created)"""
+    with transaction.atomic():
+        # 锁成果行串行化同一成果的入队：没有待发送推送时 select_for_update 锁不到任何行，
+        # 并发请求会各自插入一条
+        Achievement.objects.select_for_update().only('pk').get(pk=instance.pk)
+        push = DisplayPush.objects.filter(
+            achievement=instance, status=DisplayPushStatusChoices.PENDING.value
+        ).first()
+        if push is not None:
+            return push, False
+        push = DisplayPush.objects.create(achievement=instance, payload=build_payload(instance, base_url))
+    return push, True
+
+
+def get_session(pool_size=10):
+    """keep-alive 连接池，重试由 outbox 负责，这里不做 urllib3 重试"""
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size, max_retries=0)
+    session.mount('http://', adapter)
+    session.mount('https://', adapter)
+    session.headers.update({'Content-type': 'application/json'})
+    return session
+
+
+def post_payload(session, payload):
+    """发送一条推送，返回展示平台的响应数据；失败抛出 DisplayError"""
+    try:
+        res = session.post(settings.DISPLAY_URL, data=json.dumps(payload),
+                           timeout=getattr(settings, 'DISPLAY_TIMEOUT', (3.05, 30)))
+    except requests.RequestException as e:
+        raise DisplayError(f'request failed: {e}') from e
+    if not 200 <= res.status_code <= 299:
+        raise DisplayError(f'display platform returned {res.status_code}: {res.text[:500]}')
+    try:
+        return res.json()
+    except ValueError as e:
+        raise DisplayError('display platform returned invalid json') from e
+
+
+def apply_results(results):
+    """
+    results: {achievement_id: 展示平台响应}。
+    成果标记为已对接，文件展示链接一次 bulk_update 写回。
+    """
+    if not results:
+        return
+    links = {}
+    for achievement_id, data in results.items():
+        for file in (data or {}).get('file_list') or []:
+            try:
+                links[(achievement_id, int(file.get('file_id')))] = file.get('file_link')
+            except (TypeError, ValueError):
+                logger.error(f"file {file} does not exist")
+    files = list(FileManager.objects.filter(
+        achievement_id__in=list(results), pk__in={file_id for _, file_id in links}
+    ).only('id', 'achievement_id', 'file_link'))
+    for file in files:
+        file.file_link = links[(file.achievement_id, file.id)] or ''
+    missing = set(links) - {(f.achievement_id, f.id) for f in files}
+    if missing:
+        logger.error(f"files {missing} does not exist")
+    with transaction.atomic():
+        Achievement.objects.filter(pk__in=list(results)).update(is_reviewed=True, updated=timezone.now())
+        FileManager.objects.bulk_update(files, ['file_link'], batch_size=500)
+
+
+def _retry_delay(attempts):
+    base = getattr(settings, 'DISPLAY_RETRY_BACKOFF', 30)
+    return timedelta(seconds=min(base * 2 ** (attempts - 1), 6 * 60 * 60))
+
+
+def claim(push):
+    """领取一条到期的推送，返回是否成功（多个 worker 并发时只有一个成功）"""
+    now = timezone.now()
+    return DisplayPush.objects.filter(
+        pk=push.pk, status=DisplayPushStatusChoices.PENDING.value, next_attempt__lte=now
+    ).update(next_attempt=now + CLAIM_LEASE) == 1
+
+
+def deliver(push, session):
+    """投递一条已领取的推送，更新其状态，返回是否成功"""
+    push.attempts += 1
+    try:
+        data = post_payload(session, push.payload)
+    except DisplayError as e:
+        push.last_error = str(e)
+        if push.attempts >= getattr(settings, 'DISPLAY_MAX_ATTEMPTS', 8):
+            push.status = DisplayPushStatusChoices.FAILED.value
+            logger.error(f'display push {push.pk} failed after {push.attempts} attempts: {e}')
+        else:
+            push.next_attempt = timezone.now() + _retry_delay(push.attempts)
+            logger.warning(f'display push {push.pk} attempt {push.attempts} failed: {e}')
+        push.save(update_fields=['attempts', 'last_error', 'status', 'next_attempt'])
+        return False
+    apply_results({push.achievement_id: data})
+    push.status = DisplayPushStatusChoices.SENT.value
+    push.sent = timezone.now()
+    push.last_error = ''
+    push.save(update_fields=['attempts', 'last_error', 'status', 'sent'])
+    return True
+
+
+def deliver_pending(session, limit=50):
+    """投递到期的推送，返回 (成功数, 失败数)"""
+    due = DisplayPush.objects.filter(
+        status=DisplayPushStatusChoices.PENDING.value, next_attempt__lte=timezone.now()
+    ).order_by('next_attempt', 'id')[:limit]
+    sent = failed = 0
+    for push in due:
+        if not claim(push):
+            continue
+        if deliver(push, session):
+            sent += 1
+        else:
+            failed += 1
+    return sent, failed
@@ -0,0 +1,136 @@
+"""
+成果文件下载。
+
+支持 ETag / Last-Modified 条件请求和单段 Range；FILE_DOWNLOAD_BACKEND 为 nginx / sendfile 时
+只返回 X-Accel-Redirect / X-Sendfile 头，由前端 web 服务器传输文件（Range 也由其处理）。
+
+nginx 示例（FILE_DOWNLOAD_ACCEL_PREFIX = '/protected/'）:
+    location /protected/ {
+        internal;
+        alias /path/to/media/;
+    }
+"""
+import mimetypes
+import re
+from urllib.parse import quote
+
+from django.conf import settings
+from django.http import FileResponse, HttpResponse, StreamingHttpResponse
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date, parse_http_date_safe, quote_etag
+
+READ_SIZE = 64 * 1024
+RANGE_RE = re.compile(r'^bytes=(\d*)-(\d*)$')
+
+
+def file_etag(instance):
+    """blob 文件以内容 sha256 为 ETag，旧文件以路径和大小、更新时间生成"""
+    if instance.blob_id:
+        return quote_etag(instance.blob.sha256)
+    updated = int(instance.updated.timestamp()) if instance.updated else 0
+    return quote_etag(f'{instance.file.name}-{instance.file.size}-{updated}')
+
+
+def content_disposition(filename):
+    try:
+        filename.encode('ascii')
+        return 'attachment; filename="{}"'.format(filename.replace('\\', '\\\\').replace('"', r'\"'))
+    except UnicodeEncodeError:
+        return "attachment; filename*=utf-8''{}".format(quote(filename))
+
+
+def parse_range(header, size):
+    """
+    解析单段 Range，返回 (start, end)（含 end）；无法满足返回 False；
+    多段或格式不符返回 None（按 RFC 7233 忽略 Range，返回整个文件）
+    """
+    match = RANGE_RE.match(header.strip())
+    if not match:
+        return None
+    start, end = match.groups()
+    if not start and not end:
+        return None
+    if not start:
+        # bytes=-500 取最后 500 字节
+        length = int(end)
+        if length == 0:
+            return False
+        return max(size - length, 0), size - 1
+    start = int(start)
+    if end and start > int(end):
+        return None
+    if start >= size:
+        return False
+    end = int(end) if end else size - 1
+    return start, min(end, size - 1)
+
+
+def _range_matches(request, etag, last_modified):
+    """If-Range 与当前版本一致时才按 Range 返回"""
+    if_range = request.headers.get('If-Range')
+    if not if_range:
+        return True
+    if if_range.startswith(('"', 'W/')):
+        return if_range == etag
+    date = parse_http_date_safe(if_range)
+    return date is not None and last_modified is not None and date >= last_modified
+
+
+def _iter_range(fh, start, length):
+    try:
+        fh.seek(start)
+        while length > 0:
+            data = fh.read(min(READ_SIZE, length))
+            if not data:
+                break
+            length -= len(data)
+            yield data
+    finally:
+        fh.close()
+
+
+def serve_file(request, instance):
+    field_file = instance.file
+    filename = instance.display_filename
+    etag = file_etag(instance)
+    last_modified = int(instance.updated.timestamp()) if instance.updated else None
+    response = get_conditional_response(request, etag=etag, last_modified=last_modified)
+    if response is not None:
+        return response
+
+    content_type = mimetypes.guess_type(filename)[0] or 'application/octet-stream'
+    backend = getattr(settings, 'FILE_DOWNLOAD_BACKEND', 'django')
+    if backend in ('nginx', 'sendfile'):
+        response = HttpResponse(content_type=content_type)
+        if backend == 'nginx':
+            prefix = getattr(settings, 'FILE_DOWNLOAD_ACCEL_PREFIX', '/protected/')
+            response['X-Accel-Redirect'] = quote(prefix.rstrip('/') + '/' + field_file.name)
+        else:
+            response['X-Sendfile'] = field_file.path
+    else:
+        size = field_file.size
+        byte_range = None
+        if request.headers.get('Range') and _range_matches(request, etag, last_modified):
+            byte_range = parse_range(request.headers['Range'], size)
+        if byte_range is False:
+            response = HttpResponse(status=416)
+            response['Content-Range'] = f'bytes */{size}'
+            return response
+        fh = field_file.storage.open(field_file.name, 'rb')
+        if byte_range is None:
+            response = FileResponse(fh, content_type=content_type)
+            response['Content-Length'] = size
+        else:
+            start, end = byte_range
+            response = StreamingHttpResponse(_iter_range(fh, start, end - start + 1),
+                                             status=206, content_type=content_type)
+            response['Content-Range'] = f'bytes {start}-{end}/{size}'
+            response['Content-Length'] = end - start + 1
+        response['Accept-Ranges'] = 'bytes'
+    response['Content-Disposition'] = content_disposition(filename)
+    response['ETag'] = etag
+    if last_modified is not None:
+        response['Last-Modified'] = http_date(last_modified)
+    # 文件需鉴权，不允许共享缓存
+    response['Cache-Control'] = 'private, no-cache'
+    return response
@@ -1,9 +1,11 @@
 import logging
+from django.db import connection, transaction
 from django.utils import timezone
-from django.contrib.contenttypes.models import ContentType
 from django.contrib.auth import get_user_model
-from guardian.shortcuts import assign_perm, get_users_with_perms, get_user_perms, remove_perm, get_perms
+from ums.apps.core.identity import get_identity_map
 from .models import Process, Task, Achievement
+from .counters import CounterUpdate
+from .perms import reconcile_achievement_perms
 from .serializers import ProcessSerializer
 from .activation import STATUS, STATUS_CHOICES
 from .utils import AchievementStateChoices
@@ -44,6 +46,7 @@ class AchievementProcessHandlerFirstStage(AchievementProcessHandler):
     status_field = 'status1'
 
     @classmethod
+    @transaction.atomic
     def create_process(cls, instance, *args, **kwargs):
         """
         kwargs :{
@@ -55,24 +58,26 @@ class AchievementProcessHandlerFirstStage(AchievementProcessHandler):
         approver = kwargs.get('required_approver', None)
         user = kwargs.get('user')
         perm = 'approve_achievement_lv1'
-        print(type(approver), approver)
+        identity_map = get_identity_map()
         if not approver:
+            sponsors = identity_map.get_many(User, identity_map.related_ids(instance.project, 'project_sponsor'))
             approver = [
                 {'id': u.id, 'name': u.name} for u in
-                instance.project.project_sponsor.all()
+                sorted(sponsors.values(), key=lambda u: u.id)
             ]
-        else:
-            print(type(approver), type(approver[0]))
         level = kwargs.get('level', 1)
         if level == 2:
             perm = 'approve_achievement_lv2'
         if not flow_type:
             logging.error(f'No flow type provided for instance {instance._meta.model.__name__} {instance.pk}')
-        content_type_object = ContentType.objects.get(app_label=instance._meta.app_label,
-                                                      model=instance._meta.model.__name__)
+        content_type_object = identity_map.content_type(instance)
 
         process = Process(
             artifact_content_type=content_type_object, artifact_object_id=instance.pk,
+            # owner/stage/activation 同时写入列和 data
+            owner=user,
+            stage=level,
+            activation='approval',
             data={
                 # store flow attributes
                 'flow_type': flow_type,  # 会签JOIN，或签OR，单签SINGLE
@@ -102,6 +107,7 @@ class AchievementProcessHandlerFirstStage(AchievementProcessHandler):
             owner_permission='submit_achievement',
             comments=comments,
             status=STATUS.DONE,  # 提交已完成
+            is_first=True,
             data={
                 'is_withdraw': 0,
                 'is_first': 1 , # 是首个task
@@ -112,36 +118,63 @@ class AchievementProcessHandlerFirstStage(AchievementProcessHandler):
         task.started = timezone.now()
         task.finished = timezone.now()
         task.save()
-        cls.create_tasks(process, task)
+        task_list = cls.create_tasks(process, task)
+        counters = CounterUpdate()
+        counters.process(process.owner_id, None, process.status)
+        for t in task_list:
+            counters.task(t, None, t.status)
+        counters.apply()
         return process
 
     @classmethod
     def create_tasks(cls, process, init_task):
+        """
+        为每个审批人创建task，批量写入：
+        审批人一次查询，Task一次bulk insert，previous关系一次bulk insert
+        """
         data = process.data
         flow_type = data.get('flow_type')
-
-        task_list = []
-        # 为每个用户创建task
-        for item in data.get('approve'):
-            task = Task(
+        # get_many 按整数主键返回，id 可能来自请求中的字符串
+        approver_ids = [int(item.get('id')) for item in data.get('approve')]
+        owners = get_identity_map().get_many(User, approver_ids)
+        missing = set(approver_ids) - set(owners)
+        if missing:
+            raise User.DoesNotExist(f'Approver {missing} does not exist')
+
+        now = timezone.now()
+        task_list = [
+            Task(
                 process=process,
                 flow_task_type=flow_type,
                 artifact_content_type=init_task.artifact_content_type,
                 artifact_object_id=init_task.artifact_object_id,
-                owner=User.objects.get(id=item.get('id')),
+                owner=owners[uid],
                 # external_task_id
                 owner_permission=data.get("permission"),
                 status=STATUS.ASSIGNED,  # 提交已完成，分配给sponsor
+                assigned=now,
+                started=now,
                 data={
                     'is_first': 0,
                     'submitted_by': init_task.owner.name
                 }
-            )
-            task.assigned = timezone.now()
-            task.started = timezone.now()
-            task.save()
-            task.previous.add(init_task)
-            task_list.append(task)
+            ) for uid in approver_ids
+        ]
+        returns_pks = connection.features.can_return_rows_from_bulk_insert
+        if not returns_pks:
+            # 锁定 process，其他事务不能同时为它插入 task
+            Process.objects.select_for_update().filter(pk=process.pk).exists()
+        task_list = Task.objects.bulk_create(task_list)
+        if not returns_pks:
+            # MySQL 不返回自增主键：同一条 INSERT 的自增 id 按行顺序递增，
+            # 该 process 最新的 len(task_list) 个 id 即为本批，按顺序对应
+            pks = Task.objects.filter(process=process).order_by('-id').values_list('id', flat=True)[:len(task_list)]
+            for task, pk in zip(task_list, reversed(list(pks))):
+                task.pk = pk
+        Through = Task.previous.through
+        Through.objects.bulk_create([
+            Through(from_task_id=task.pk, to_task_id=init_task.pk) for task in task_list
+        ])
         return task_list
 
 
@@ -149,9 +182,10 @@ class ActionHandler:
 
     def __init__(self, instance):
         self.instance = instance
-        self.content_type_object = ContentType.objects.get(app_label=instance._meta.app_label,
-                                                           model=instance._meta.model.__name__)
+        self.content_type_object = get_identity_map().content_type(instance)
         self.object_id = instance.pk
+        # 本次动作的待办计数变化，动作结束时在同一事务中写入
+        self.counters = CounterUpdate()
 
     def get_process(self):
 
@@ -160,12 +194,12 @@ class ActionHandler:
         ).order_by('-created')
         return processes[0]
 
+    @transaction.atomic
     def withdraw(self, comments):
         process = self.get_process()
         tasks = Task.objects.filter(
             process=process
         ).order_by('-created')
-        print(comments)
         task = Task(
             process=process,
             flow_task_type=process.data.get('flow_type', 'SINGLE'),
@@ -175,6 +209,7 @@ class ActionHandler:
             owner_permission='withdraw_achievement',
             comments=comments,
             status=STATUS.CANCELED,  # 提交已完成
+            is_withdraw=True,
             data={
                 'is_withdraw': 1,
                 'is_first': 0  # 是首个task
@@ -189,19 +224,23 @@ class ActionHandler:
         )
         for t in tasks:
             if t.status != STATUS.DONE and t.status != STATUS.ERROR and t.status != STATUS.CANCELED and t.status != STATUS.DENY:
+                self.counters.task(t, t.status, STATUS.CANCELED)
                 t.status = STATUS.CANCELED
                 t.comments = '提交人撤销，自动处理。'
                 t.save()
+        self.counters.process(process.owner_id, process.status, STATUS.CANCELED)
         process.status = STATUS.CANCELED
         process.comments = '提交人撤销，自动处理。'
         process.finished = timezone.now()
         process.save()
+        self.counters.apply()
         return process
 
+    @transaction.atomic
     def approve(self, comments, user):
         # 判断几级审批
         process = self.get_process()
-        stage = process.data.get('stage', 1)
+        stage = process.stage
         if stage == 1:
             self._approve(process, comments, user, 1)
         else:
@@ -209,7 +248,7 @@ class ActionHandler:
         # 找到第一个task
         first_task = Task.objects.get(
             process=process,
-            data__is_first=1,
+            is_first=True,
             owner_permission__contains='submit'
         )
         if process.data.get('flow_type', 'SINGLE') == 'JOIN':
@@ -217,6 +256,7 @@ class ActionHandler:
             if self.perform_join(first_task):
                 # all done
                 # 更改process
+                self.counters.process(process.owner_id, process.status, STATUS.DONE)
                 process.status = STATUS.DONE
                 process.finished = timezone.now()
                 process.save()
@@ -224,74 +264,27 @@ class ActionHandler:
             # if process.data.get('flow_type', 'SINGLE') == 'OR':
                 # 将所有task状态改为通过
             self.perform_or(first_task, STATUS.DONE)
+            self.counters.process(process.owner_id, process.status, STATUS.DONE)
             process.status = STATUS.DONE
             process.finished = timezone.now()
             process.save()
         self._approval_after(process, user, stage)
+        self.counters.apply()
         return process
 
     def _approval_after(self, process, user, stage):
-        # todo  分配权限
-        perm = 'approve_achievement_lv1'
-        if stage == 2:
-            perm = 'approve_achievement_lv2'
-        # all conditions user need remove permission
-        remove_perm(perm, user, self.instance)
-
-        # 如果是第一级审批，需要分配给当前用户提交权限（要求process status == DONE)
-        if stage == 1 and process.status == STATUS.DONE:  # 谁审批，谁提交
-            # 成果的一级审批标签变为完成
+        # 如果是第一级审批通过，成果的一级审批标签变为完成（谁审批，谁提交）
+        if stage == 1 and process.status == STATUS.DONE:
             self.instance.status1 = STATUS.DONE
-            self._flush_perms(stage)
-            # 重新为当前审批负责人分配权限
-            assign_perm('change_achievement', user, self.instance)
-            assign_perm('submit_achievement', user, self.instance)
-            assign_perm('delete_achievement', user, self.instance)
-            # 去掉 approve_achievement_lv1的所有权限
-            # 如果通过，去掉一级提交人（一般是作者）的withdraw权限
         if stage == 2 and process.status == STATUS.DONE:
-            # 如果结束，去掉所有leader的 approval权限
-            # 收回所有用户的withdraw，change， submit， delete权限
             self.instance.status2 = STATUS.DONE
             self.instance.is_finished = True  # 流程结束
-            self._flush_perms(stage)
 
         # state 改为已通过
         self.instance.state = AchievementStateChoices.APP.value
         self.instance.save()
-
-    def _flush_perms(self, stage):
-        # 1. achievement creator
-        members = self.instance.project.project_members.all()
-        sponsors = self.instance.project.project_sponsor.all()
-        leaders = self.instance.project.project_approver.all()
-
-        # when lv1 pass
-        # remove creator's withdraw permission, and change/submit/delete(if have)
-        for member in members:
-            remove_perm('withdraw_achievement', member, self.instance)
-            remove_perm('change_achievement', member, self.instance)
-            remove_perm('delete_achievement', member, self.instance)
-            remove_perm('submit_achievement', member, self.instance)
-
-        # sponsor 已经审批完毕，释放app权限，
-        for sponsor in sponsors:
-            print('working on it ')
-            print(sponsor)
-            remove_perm('withdraw_achievement', sponsor, self.instance)
-            remove_perm('submit_achievement', sponsor, self.instance)
-            remove_perm('delete_achievement', sponsor, self.instance)
-            remove_perm('approve_achievement_lv1', sponsor, self.instance)
-            print(get_perms(sponsor, self.instance))
-        if stage == 1:
-            return True
-        for leader in leaders:
-            # 回收所有用户权限，主要为leader的approval 权限
-            remove_perm('withdraw_achievement', leader, self.instance)
-            remove_perm('submit_achievement', leader, self.instance)
-            remove_perm('delete_achievement', leader, self.instance)
-            remove_perm('approve_achievement_lv2', leader, self.instance)
-        return True
+        # 按新状态同步权限
+        reconcile_achievement_perms(self.instance)
 
     def perform_join(self, task):
         task_list = task.leading.all()
@@ -305,12 +298,12 @@ class ActionHandler:
         task_list = task.leading.all()
         for task in task_list:
             if task.status != STATUS.DONE and task.status != STATUS.CANCELED:
+                self.counters.task(task, task.status, status)
                 task.status = status
                 task.finished = timezone.now()
                 task.save()
 
     def _approve(self, process, comments, user, stage):
-        print(comments)
         perm = 'approve_achievement_lv1'
         if stage == 2:
             perm = 'approve_achievement_lv2'
@@ -323,16 +316,17 @@ class ActionHandler:
                 owner_permission=perm,
                 process=process
             )
+            self.counters.task(users_task, users_task.status, STATUS.DONE)
             users_task.status = STATUS.DONE
             users_task.finished = timezone.now()
             users_task.comments = comments
-            print(users_task)
             users_task.save()
-        except Exception as e:
+        except Exception:
             # todo: raise 500
-            print(e)
-            raise Exception
+            logging.exception(f'Approve failed: achievement {self.object_id}, process {process.pk}, user {user.pk}')
+            raise
 
+    @transaction.atomic
     def deny(self, comments, user):
         """
          任一审批人 deny,流程deny，权限清洗，仅creator有withdraw权限，
@@ -341,18 +335,20 @@ class ActionHandler:
         :return:
         """
         process = self.get_process()
-        stage = process.data.get('stage', 1)
+        stage = process.stage
         if stage == 1:
             # 执行具体动作
             self._deny(process, comments, user, 1)
         else:
             self._deny(process, comments, user, 2)
         #
+        self.counters.process(process.owner_id, process.status, STATUS.DENY)
         process.status = STATUS.DENY
         process.finished = timezone.now()
         process.save()
 
         self._deny_after(stage)
+        self.counters.apply()
         return process
 
     def _deny(self, process, comments, user, stage):
@@ -368,29 +364,25 @@ class ActionHandler:
                 process=process
             )
             for task in users_tasks:
+                self.counters.task(task, task.status, STATUS.DENY)
                 task.status = STATUS.DENY
                 task.finished = timezone.now()
                 if task.owner == user:
                     task.comments = comments
                 else:
                     task.comments = 'auto deny'
-                print(task)
                 task.save()
-        except Exception as e:
+        except Exception:
             # todo: raise 500
-            print(e)
-            raise Exception
+            logging.exception(f'Deny failed: achievement {self.object_id}, process {process.pk}, user {user.pk}')
+            raise
 
     def _deny_after(self, stage):
-        # todo  分配权限
-        user = self.instance.creator
-        self._flush_perms(2)  # 清空
-        # state 改为已通过
-
-        assign_perm('withdraw_achievement', user, self.instance)
+        # 驳回后仅作者保留撤销权限，由 reconcile 统一处理
         self.instance.state = AchievementStateChoices.DENY.value
         if stage == 1:
             self.instance.status1 = STATUS.DENY
         elif stage == 2:
             self.instance.status2 = STATUS.DENY
         self.instance.save()
+        reconcile_achievement_perms(self.instance)
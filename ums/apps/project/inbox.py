@@ -0,0 +1,100 @@
+"""
+待办（inbox）通知。
+
+flow 中的 task 状态变化写入 InboxEvent（与状态变化同一事务），提交后唤醒本进程内订阅了该用户的
+SSE 连接；其他进程的连接按 INBOX_POLL_INTERVAL 轮询 InboxEvent 兜底。
+
+事件 id 在 flow 事务中分配，提交顺序与 id 顺序不一致：较小 id 的事件可能在客户端越过它之后才提交。
+因此读取时除 last_id 之后的事件外，还回扫 INBOX_EVENT_GRACE 秒内创建的事件；事件至少投递一次，
+客户端按 id 去重。
+"""
+import asyncio
+import threading
+from collections import defaultdict
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from .activation import STATUS
+from .models import InboxEvent
+
+_lock = threading.Lock()
+_listeners = defaultdict(set)
+
+
+def subscribe(user_id):
+    """在事件循环中调用，返回订阅句柄 (loop, asyncio.Event)"""
+    handle = (asyncio.get_running_loop(), asyncio.Event())
+    with _lock:
+        _listeners[user_id].add(handle)
+    return handle
+
+
+def unsubscribe(user_id, handle):
+    with _lock:
+        listeners = _listeners.get(user_id)
+        if listeners is not None:
+            listeners.discard(handle)
+            if not listeners:
+                del _listeners[user_id]
+
+
+def wake(user_ids):
+    with _lock:
+        handles = [handle for uid in user_ids for handle in _listeners.get(uid, ())]
+    for loop, event in handles:
+        try:
+            loop.call_soon_threadsafe(event.set)
+        except RuntimeError:
+            # 事件循环已关闭
+            pass
+
+
+def record(events):
+    """写入 InboxEvent，提交后通知订阅者"""
+    if not events:
+        return
+    InboxEvent.objects.bulk_create(events)
+    user_ids = {event.user_id for event in events}
+    transaction.on_commit(lambda: wake(user_ids))
+
+
+def task_event(task, old_status, new_status):
+    """task 分配给用户或用户的待办被处理时返回 InboxEvent，否则返回 None"""
+    if not task.owner_id or old_status == new_status:
+        return None
+    if new_status == STATUS.ASSIGNED:
+        kind = InboxEvent.ASSIGNED
+    elif old_status == STATUS.ASSIGNED:
+        kind = InboxEvent.FINISHED
+    else:
+        return None
+    return InboxEvent(user_id=task.owner_id, kind=kind, task_id=task.pk, data={
+        'task': task.pk,
+        'process': task.process_id,
+        'achievement': task.artifact_object_id,
+        'status': new_status,
+    })
+
+
+def grace_cutoff():
+    """创建时间晚于该时刻的事件可能还有未提交的同伴，需要回扫"""
+    return timezone.now() - timedelta(seconds=getattr(settings, 'INBOX_EVENT_GRACE', 60))
+
+
+def events_after(user_id, last_id, seen=(), limit=100):
+    """
+    last_id 之后的事件，以及 last_id 之前、INBOX_EVENT_GRACE 秒内创建的事件（可能晚于 last_id 提交）。
+    seen 为本连接已推送的事件 id，不再返回。
+    """
+    queryset = InboxEvent.objects.filter(user_id=user_id).filter(Q(id__gt=last_id) | Q(created__gte=grace_cutoff()))
+    if seen:
+        queryset = queryset.exclude(id__in=seen)
+    return list(queryset.order_by('id').values('id', 'kind', 'data', 'created')[:limit])
+
+
+def latest_event_id(user_id):
+    return InboxEvent.objects.filter(user_id=user_id).order_by('-id').values_list('id', flat=True).first() or 0
@@ -0,0 +1,99 @@
+import random
+import statistics
+import time
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from ums.apps.accounts.utils import RoleChoices
+from ums.apps.project.models import Achievement, Project
+from ums.apps.project.perms import visible_achievements, visible_projects
+from ums.apps.project.utils import ProjectCateChoices, ProjectTypeChoices
+
+User = get_user_model()
+BATCH_SIZE = 2000
+
+
+class Command(BaseCommand):
+    help = '测量成果、项目列表可见范围过滤的查询耗时；--seed 时在回滚的事务中生成测试数据'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--seed', type=int, default=0, help='生成的成果数，如 100000；0 表示使用现有数据')
+        parser.add_argument('--projects', type=int, default=2000, help='生成的项目数')
+        parser.add_argument('--users', type=int, default=500, help='生成的用户数')
+        parser.add_argument('--members', type=int, default=8, help='每个项目的成员数')
+        parser.add_argument('--user', type=int, action='append', dest='user_ids', help='只测量指定用户，可重复')
+        parser.add_argument('--repeat', type=int, default=5, help='每条查询重复次数，取中位数')
+        parser.add_argument('--explain', action='store_true', help='输出查询计划')
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            user_ids = options['user_ids']
+            if options['seed']:
+                user_ids = user_ids or self.seed(options)
+            user_ids = user_ids or list(User.objects.order_by('id').values_list('id', flat=True)[:3])
+            for user in User.objects.filter(pk__in=user_ids).order_by('id'):
+                self.measure(user, options)
+            # 测试数据不保留
+            transaction.set_rollback(True)
+
+    def seed(self, options):
+        rng = random.Random(0)
+        tag = f'bench-{int(time.time())}'
+        start = time.perf_counter()
+        User.objects.bulk_create([
+            User(username=f'{tag}-{i}', name=f'bench{i}', email='', phone_number=None, role=RoleChoices.PROJECT_WORKER.value)
+            for i in range(options['users'])
+        ], batch_size=BATCH_SIZE)
+        user_ids = list(User.objects.filter(username__startswith=tag).values_list('id', flat=True))
+        Project.objects.bulk_create([
+            Project(project_id=f'{tag}-{i}', project_title=f'bench{i}', project_type=ProjectTypeChoices.FR.value,
+                    project_cate=ProjectCateChoices.IR.value, project_issuer_id=user_ids[0])
+            for i in range(options['projects'])
+        ], batch_size=BATCH_SIZE)
+        projects = list(Project.objects.filter(project_id__startswith=tag).values_list('id', flat=True))
+        members = {pk: rng.sample(user_ids[1:], min(options['members'], len(user_ids) - 1)) for pk in projects}
+        through = Project.project_members.through
+        through.objects.bulk_create([
+            through(project_id=pk, octuser_id=uid) for pk, uids in members.items() for uid in uids
+        ], batch_size=BATCH_SIZE)
+        Achievement.objects.bulk_create([
+            Achievement(project_id=pk, name=f'bench{i}', creator_id=rng.choice(members[pk]))
+            for i, pk in enumerate(rng.choice(projects) for _ in range(options['seed']))
+        ], batch_size=BATCH_SIZE)
+        self.stdout.write(f'seeded {len(user_ids)} users, {len(projects)} projects, '
+                          f'{options["seed"]} achievements in {time.perf_counter() - start:.1f}s')
+        # 管理员（不过滤）、普通成员、只参与一个项目的成员
+        sparse = User(username=f'{tag}-sparse', name='sparse', email='', role=RoleChoices.PROJECT_WORKER.value)
+        sparse.save()
+        through.objects.create(project_id=projects[-1], octuser_id=sparse.pk)
+        admin = User(username=f'{tag}-admin', name='admin', email='', role=RoleChoices.ADMIN.value)
+        admin.save()
+        return [admin.pk, user_ids[1], sparse.pk]
+
+    def timed(self, query, repeat):
+        times = []
+        for _ in range(repeat):
+            start = time.perf_counter()
+            result = query()
+            times.append((time.perf_counter() - start) * 1000)
+        return result, statistics.median(times)
+
+    def measure(self, user, options):
+        repeat = options['repeat']
+        achievements = visible_achievements(user)
+        projects = visible_projects(user)
+        queries = [
+            ('achievement count', lambda: achievements.count()),
+            ('achievement first page', lambda: len(achievements.order_by('-id')[:10])),
+            ('achievement page 50', lambda: len(achievements.order_by('-id')[490:500])),
+            ('project count', lambda: projects.count()),
+            ('project first page', lambda: len(projects.order_by('-project_created', '-id')[:10])),
+        ]
+        self.stdout.write(self.style.MIGRATE_HEADING(f'user {user.pk} ({user.get_role_display()})'))
+        for label, query in queries:
+            result, ms = self.timed(query, repeat)
+            self.stdout.write(f'  {label:<24} {ms:8.2f} ms  rows={result}')
+        if options['explain']:
+            self.stdout.write(achievements.order_by('-id')[:10].explain())
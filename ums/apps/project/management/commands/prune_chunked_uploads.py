@@ -0,0 +1,44 @@
+import os
+import shutil
+import uuid
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from ums.apps.project.models import ChunkedUpload
+from ums.apps.project.uploads import discard
+from ums.apps.project.utils import ChunkedUploadStatusChoices
+
+
+class Command(BaseCommand):
+    help = '删除过期未完成的分片上传会话及其分片目录'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--days', type=int, default=2, help='保留最近几天创建的未完成上传')
+
+    def handle(self, *args, **options):
+        cutoff = timezone.now() - timedelta(days=options['days'])
+        expired = ChunkedUpload.objects.filter(
+            status=ChunkedUploadStatusChoices.UPLOADING.value, created__lt=cutoff
+        )
+        deleted = 0
+        for upload in expired.iterator():
+            discard(upload)
+            deleted += 1
+        # 会话已删除或已完成但残留的分片目录
+        orphans = 0
+        root = settings.CHUNKED_UPLOAD_ROOT
+        for name in os.listdir(root) if os.path.isdir(root) else []:
+            path = os.path.join(root, name)
+            try:
+                upload_id = uuid.UUID(name)
+            except ValueError:
+                continue
+            if os.path.getmtime(path) >= cutoff.timestamp() or ChunkedUpload.objects.filter(
+                    pk=upload_id, status=ChunkedUploadStatusChoices.UPLOADING.value).exists():
+                continue
+            shutil.rmtree(path, ignore_errors=True)
+            orphans += 1
+        self.stdout.write(self.style.SUCCESS(f'deleted {deleted} chunked uploads, {orphans} orphan chunk directories'))
@@ -0,0 +1,19 @@
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from ums.apps.project.models import InboxEvent
+
+
+class Command(BaseCommand):
+    help = '删除过期的待办事件（InboxEvent）'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--days', type=int, default=7, help='保留最近几天的事件')
+
+    def handle(self, *args, **options):
+        deleted, _ = InboxEvent.objects.filter(
+            created__lt=timezone.now() - timedelta(days=options['days'])
+        ).delete()
+        self.stdout.write(self.style.SUCCESS(f'deleted {deleted} inbox events'))
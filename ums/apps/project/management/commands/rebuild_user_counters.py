@@ -0,0 +1,17 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from ums.apps.project.counters import rebuild
+
+
+class Command(BaseCommand):
+    help = '按 task / process 表重建用户待办计数（UserCounter）'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--user', type=int, action='append', dest='user_ids',
+                            help='只重建指定用户，可重复')
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            count = rebuild(options['user_ids'])
+        self.stdout.write(self.style.SUCCESS(f'rebuilt counters for {count} users'))
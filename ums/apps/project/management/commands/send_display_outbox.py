@@ -0,0 +1,25 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from ums.apps.project.display import deliver_pending, get_session
+
+
+class Command(BaseCommand):
+    help = '投递展示平台推送队列（DisplayPush）'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--once', action='store_true', help='处理一轮到期推送后退出')
+        parser.add_argument('--batch', type=int, default=50, help='每轮最多处理的推送数')
+        parser.add_argument('--interval', type=float, default=5, help='队列为空时的轮询间隔（秒）')
+
+    def handle(self, *args, **options):
+        session = get_session()
+        while True:
+            sent, failed = deliver_pending(session, limit=options['batch'])
+            if sent or failed:
+                self.stdout.write(self.style.SUCCESS(f'sent: {sent} failed: {failed}'))
+            if options['once']:
+                break
+            if sent + failed < options['batch']:
+                time.sleep(options['interval'])
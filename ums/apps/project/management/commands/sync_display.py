@@ -0,0 +1,71 @@
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from ums.apps.project.display import DisplayError, apply_results, build_payload, get_session, post_payload
+from ums.apps.project.models import Achievement
+from ums.apps.project.utils import DisplayPushStatusChoices
+
+
+class Command(BaseCommand):
+    help = '将所有已完成、未对接的成果批量推送到展示平台'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--base-url', default=getattr(settings, 'DISPLAY_FILE_BASE_URL', ''),
+                            help='文件地址前缀，如 http://ums.example.com')
+        parser.add_argument('--concurrency', type=int, default=8, help='并发推送线程数')
+        parser.add_argument('--batch-size', type=int, default=100, help='每批读取、回写的成果数')
+        parser.add_argument('--start-after', type=int, default=0, help='从该成果 id 之后开始（断点续传）')
+        parser.add_argument('--limit', type=int, default=0, help='最多处理的成果数，0 为不限')
+
+    def handle(self, *args, **options):
+        base_url = options['base_url'].rstrip('/')
+        if not base_url:
+            raise CommandError('--base-url or settings.DISPLAY_FILE_BASE_URL is required')
+        concurrency = max(options['concurrency'], 1)
+        session = get_session(pool_size=concurrency)
+        queryset = Achievement.objects.filter(
+            is_finished=True, is_reviewed=False
+        ).exclude(
+            # 已在 outbox 中等待发送的交给 send_display_outbox
+            display_pushes__status=DisplayPushStatusChoices.PENDING.value
+        ).select_related('project').prefetch_related('files__tags').order_by('pk')
+
+        last_pk = options['start_after']
+        total = sent = failed = 0
+        started = time.monotonic()
+        with ThreadPoolExecutor(max_workers=concurrency) as executor:
+            while not options['limit'] or total < options['limit']:
+                size = options['batch_size']
+                if options['limit']:
+                    size = min(size, options['limit'] - total)
+                batch = list(queryset.filter(pk__gt=last_pk)[:size])
+                if not batch:
+                    break
+                payloads = [(obj.pk, build_payload(obj, base_url)) for obj in batch]
+                futures = [(pk, executor.submit(post_payload, session, payload)) for pk, payload in payloads]
+                results = {}
+                for pk, future in futures:
+                    try:
+                        results[pk] = future.result()
+                    except DisplayError as e:
+                        failed += 1
+                        self.stderr.write(f'achievement {pk}: {e}')
+                # 每批成功的结果立即回写，is_reviewed 即为检查点，重跑时自动跳过
+                apply_results(results)
+                sent += len(results)
+                total += len(batch)
+                last_pk = batch[-1].pk
+                elapsed = time.monotonic() - started
+                self.stdout.write(
+                    f'checkpoint: {last_pk} processed: {total} sent: {sent} failed: {failed} '
+                    f'rate: {total / elapsed if elapsed else 0:.1f}/s'
+                )
+
+        elapsed = time.monotonic() - started
+        self.stdout.write(self.style.SUCCESS(
+            f'done. processed: {total} sent: {sent} failed: {failed} elapsed: {elapsed:.1f}s '
+            f'rate: {total / elapsed if elapsed else 0:.1f}/s'
+        ))
@@ -0,0 +1,18 @@
+# Generated by Django 4.0.3 on 2026-10-18 17:08
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('project', '0023_alter_process_options_alter_task_options_and_more'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='filemanager',
+            name='file_link',
+            field=models.CharField(default='', max_length=255, verbose_name='展示链接'),
+        ),
+    ]
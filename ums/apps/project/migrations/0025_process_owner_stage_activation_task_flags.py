@@ -0,0 +1,45 @@
+# Generated by Django 4.0.3 on 2026-10-18 17:08
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('project', '0024_filemanager_file_link'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='process',
+            name='activation',
+            field=models.CharField(blank=True, db_index=True, default='', max_length=50, verbose_name='Activation'),
+        ),
+        migrations.AddField(
+            model_name='process',
+            name='owner',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='issued_processes', to=settings.AUTH_USER_MODEL, verbose_name='Owner'),
+        ),
+        migrations.AddField(
+            model_name='process',
+            name='stage',
+            field=models.PositiveSmallIntegerField(db_index=True, default=1, verbose_name='Stage'),
+        ),
+        migrations.AddField(
+            model_name='task',
+            name='is_first',
+            field=models.BooleanField(db_index=True, default=False, verbose_name='Is first'),
+        ),
+        migrations.AddField(
+            model_name='task',
+            name='is_withdraw',
+            field=models.BooleanField(db_index=True, default=False, verbose_name='Is withdraw'),
+        ),
+        migrations.AddIndex(
+            model_name='process',
+            index=models.Index(fields=['owner', 'status'], name='project_pro_owner_i_e8cb67_idx'),
+        ),
+    ]
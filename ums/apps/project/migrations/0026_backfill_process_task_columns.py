@@ -0,0 +1,60 @@
+from django.conf import settings
+from django.db import migrations
+
+BATCH_SIZE = 500
+
+
+def _flag(value):
+    return str(value) in ('1', 'True', 'true')
+
+
+def backfill(apps, schema_editor):
+    """把 Process.data / Task.data 中的 owner、stage、activation、is_first、is_withdraw 回填到新列"""
+    Process = apps.get_model('project', 'Process')
+    Task = apps.get_model('project', 'Task')
+    User = apps.get_model(*settings.AUTH_USER_MODEL.split('.'))
+
+    def flush(batch):
+        owner_ids = {p.owner_id for p in batch if p.owner_id}
+        existing = set(User.objects.filter(pk__in=owner_ids).values_list('pk', flat=True))
+        for p in batch:
+            if p.owner_id not in existing:
+                p.owner_id = None
+        Process.objects.bulk_update(batch, ['owner', 'stage', 'activation'])
+
+    batch = []
+    for process in Process.objects.only('id', 'data').iterator(chunk_size=BATCH_SIZE):
+        data = process.data or {}
+        process.owner_id = (data.get('owner') or {}).get('id')
+        process.stage = int(data.get('stage') or 1)
+        process.activation = data.get('activation') or ''
+        batch.append(process)
+        if len(batch) >= BATCH_SIZE:
+            flush(batch)
+            batch = []
+    if batch:
+        flush(batch)
+
+    batch = []
+    for task in Task.objects.only('id', 'data').iterator(chunk_size=BATCH_SIZE):
+        data = task.data or {}
+        task.is_first = _flag(data.get('is_first', 0))
+        task.is_withdraw = _flag(data.get('is_withdraw', 0))
+        batch.append(task)
+        if len(batch) >= BATCH_SIZE:
+            Task.objects.bulk_update(batch, ['is_first', 'is_withdraw'])
+            batch = []
+    if batch:
+        Task.objects.bulk_update(batch, ['is_first', 'is_withdraw'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('project', '0025_process_owner_stage_activation_task_flags'),
+    ]
+
+    operations = [
+        migrations.RunPython(backfill, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,36 @@
+# Generated by Django 4.0.3 on 2026-10-18 17:09
+
+from django.db import migrations, models
+import django.db.models.deletion
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('project', '0026_backfill_process_task_columns'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DisplayPush',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('payload', models.JSONField(verbose_name='推送内容')),
+                ('status', models.CharField(choices=[('PENDING', '待发送'), ('SENT', '已发送'), ('FAILED', '发送失败')], default='PENDING', max_length=10, verbose_name='发送状态')),
+                ('attempts', models.PositiveIntegerField(default=0, verbose_name='尝试次数')),
+                ('next_attempt', models.DateTimeField(default=django.utils.timezone.now, verbose_name='下次尝试时间')),
+                ('last_error', models.TextField(blank=True, default='', verbose_name='最近错误')),
+                ('created', models.DateTimeField(auto_now_add=True, verbose_name='创建时间')),
+                ('sent', models.DateTimeField(blank=True, null=True, verbose_name='发送时间')),
+                ('achievement', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='display_pushes', to='project.achievement', verbose_name='成果')),
+            ],
+            options={
+                'ordering': ['id'],
+            },
+        ),
+        migrations.AddIndex(
+            model_name='displaypush',
+            index=models.Index(fields=['status', 'next_attempt'], name='project_dis_status_e01b3a_idx'),
+        ),
+    ]
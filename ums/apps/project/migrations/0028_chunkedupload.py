@@ -0,0 +1,34 @@
+# Generated by Django 4.0.3 on 2026-10-18 17:12
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+import uuid
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('project', '0027_displaypush'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ChunkedUpload',
+            fields=[
+                ('id', models.UUIDField(default=uuid.uuid4, editable=False, primary_key=True, serialize=False)),
+                ('filename', models.CharField(max_length=255, verbose_name='原始文件名')),
+                ('name', models.CharField(blank=True, max_length=255, null=True, verbose_name='文件名')),
+                ('tags', models.JSONField(blank=True, default=list, verbose_name='标签')),
+                ('total_size', models.PositiveBigIntegerField(verbose_name='文件大小')),
+                ('chunk_size', models.PositiveIntegerField(verbose_name='分片大小')),
+                ('checksum', models.CharField(max_length=64, verbose_name='SHA-256')),
+                ('status', models.CharField(choices=[('UPLOADING', '上传中'), ('COMPLETE', '已完成')], default='UPLOADING', max_length=10, verbose_name='上传状态')),
+                ('created', models.DateTimeField(auto_now_add=True, verbose_name='创建时间')),
+                ('achievement', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='chunked_uploads', to='project.achievement', verbose_name='成果')),
+                ('creator', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='chunked_uploads', to=settings.AUTH_USER_MODEL, verbose_name='文件上传人')),
+                ('file', models.OneToOneField(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='chunked_upload', to='project.filemanager')),
+            ],
+        ),
+    ]
@@ -0,0 +1,36 @@
+# Generated by Django 4.0.3 on 2026-10-18 17:13
+
+from django.db import migrations, models
+import django.db.models.deletion
+import ums.apps.project.models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('project', '0028_chunkedupload'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='FileBlob',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('sha256', models.CharField(max_length=64, unique=True, verbose_name='SHA-256')),
+                ('file', models.FileField(max_length=255, upload_to=ums.apps.project.models.blob_file_name)),
+                ('size', models.PositiveBigIntegerField(default=0, verbose_name='文件大小')),
+                ('ref_count', models.PositiveIntegerField(default=0, verbose_name='引用数')),
+                ('created', models.DateTimeField(auto_now_add=True, verbose_name='创建时间')),
+            ],
+        ),
+        migrations.AddField(
+            model_name='filemanager',
+            name='filename',
+            field=models.CharField(blank=True, default='', max_length=255, verbose_name='原始文件名'),
+        ),
+        migrations.AddField(
+            model_name='filemanager',
+            name='blob',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.PROTECT, related_name='files', to='project.fileblob', verbose_name='文件内容'),
+        ),
+    ]
@@ -0,0 +1,25 @@
+# Generated by Django 4.0.3 on 2026-10-18 17:16
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0001_initial'),
+        ('project', '0029_fileblob'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='UserCounter',
+            fields=[
+                ('user', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='project_counter', serialize=False, to=settings.AUTH_USER_MODEL)),
+                ('assigned_tasks', models.IntegerField(default=0, verbose_name='待处理任务数')),
+                ('open_processes', models.IntegerField(default=0, verbose_name='进行中的流程数')),
+                ('updated', models.DateTimeField(auto_now=True, verbose_name='更新时间')),
+            ],
+        ),
+    ]
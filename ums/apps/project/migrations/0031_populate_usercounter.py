@@ -0,0 +1,35 @@
+from collections import defaultdict
+
+from django.db import migrations
+from django.db.models import Count, Q
+
+CLOSED_PROCESS_STATUS = ('DONE', 'ERROR', 'CANCELED', 'DENY')
+
+
+def populate(apps, schema_editor):
+    """按现有 task / process 计算 UserCounter"""
+    Task = apps.get_model('project', 'Task')
+    Process = apps.get_model('project', 'Process')
+    UserCounter = apps.get_model('project', 'UserCounter')
+
+    values = defaultdict(lambda: [0, 0])
+    for uid, n in Task.objects.filter(status='ASSIGNED', owner__isnull=False).values_list(
+            'owner_id').annotate(n=Count('id')).order_by():
+        values[uid][0] = n
+    for uid, n in Process.objects.filter(~Q(status__in=CLOSED_PROCESS_STATUS), owner__isnull=False).values_list(
+            'owner_id').annotate(n=Count('id')).order_by():
+        values[uid][1] = n
+    UserCounter.objects.bulk_create([
+        UserCounter(user_id=uid, assigned_tasks=a, open_processes=o) for uid, (a, o) in values.items()
+    ], batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('project', '0030_usercounter'),
+    ]
+
+    operations = [
+        migrations.RunPython(populate, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,34 @@
+# Generated by Django 4.0.3 on 2026-10-18 17:18
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('project', '0031_populate_usercounter'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='InboxEvent',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('kind', models.CharField(choices=[('assigned', '新待办'), ('finished', '待办已处理')], max_length=20, verbose_name='类型')),
+                ('data', models.JSONField(blank=True, null=True)),
+                ('created', models.DateTimeField(auto_now_add=True, db_index=True, verbose_name='创建时间')),
+                ('task', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='inbox_events', to='project.task', verbose_name='Task')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='inbox_events', to=settings.AUTH_USER_MODEL, verbose_name='用户')),
+            ],
+            options={
+                'ordering': ['id'],
+            },
+        ),
+        migrations.AddIndex(
+            model_name='inboxevent',
+            index=models.Index(fields=['user', 'id'], name='project_inb_user_id_e33e45_idx'),
+        ),
+    ]
@@ -0,0 +1,68 @@
+from django.db import migrations
+
+MODELS = (
+    ('achievement', 'AchievementUserObjectPermission'),
+    ('project', 'ProjectUserObjectPermission'),
+)
+BATCH_SIZE = 2000
+
+
+def _content_type(apps, model_name):
+    ContentType = apps.get_model('contenttypes', 'ContentType')
+    return ContentType.objects.filter(app_label='project', model=model_name).first()
+
+
+def forwards(apps, schema_editor):
+    """把 guardian 通用表中成果、项目的用户对象权限移到直接外键表，已删除对象的残留记录一并清除"""
+    UserObjectPermission = apps.get_model('guardian', 'UserObjectPermission')
+    for model_name, perm_model_name in MODELS:
+        content_type = _content_type(apps, model_name)
+        if content_type is None:
+            continue
+        model = apps.get_model('project', model_name)
+        perm_model = apps.get_model('project', perm_model_name)
+        generic = UserObjectPermission.objects.filter(content_type=content_type)
+        existing = set(model.objects.values_list('pk', flat=True))
+        rows = []
+        for user_id, permission_id, object_pk in generic.values_list(
+                'user_id', 'permission_id', 'object_pk').iterator(chunk_size=BATCH_SIZE):
+            if not object_pk.isdigit() or int(object_pk) not in existing:
+                continue
+            rows.append(perm_model(user_id=user_id, permission_id=permission_id, content_object_id=int(object_pk)))
+            if len(rows) >= BATCH_SIZE:
+                perm_model.objects.bulk_create(rows, ignore_conflicts=True)
+                rows = []
+        perm_model.objects.bulk_create(rows, ignore_conflicts=True)
+        generic.delete()
+
+
+def backwards(apps, schema_editor):
+    UserObjectPermission = apps.get_model('guardian', 'UserObjectPermission')
+    for model_name, perm_model_name in MODELS:
+        content_type = _content_type(apps, model_name)
+        if content_type is None:
+            continue
+        perm_model = apps.get_model('project', perm_model_name)
+        rows = []
+        for user_id, permission_id, object_id in perm_model.objects.values_list(
+                'user_id', 'permission_id', 'content_object_id').iterator(chunk_size=BATCH_SIZE):
+            rows.append(UserObjectPermission(user_id=user_id, permission_id=permission_id,
+                                             content_type=content_type, object_pk=str(object_id)))
+            if len(rows) >= BATCH_SIZE:
+                UserObjectPermission.objects.bulk_create(rows, ignore_conflicts=True)
+                rows = []
+        UserObjectPermission.objects.bulk_create(rows, ignore_conflicts=True)
+        perm_model.objects.all().delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('contenttypes', '0002_remove_content_type_name'),
+        ('guardian', '0002_generic_permissions_index'),
+        ('project', '0033_direct_object_permissions'),
+    ]
+
+    operations = [
+        migrations.RunPython(forwards, backwards),
+    ]
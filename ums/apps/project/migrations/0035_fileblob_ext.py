@@ -0,0 +1,27 @@
+# Generated by Django 4.0.3 on 2026-10-18 17:38
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('project', '0034_move_object_permissions'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='fileblob',
+            name='ext',
+            field=models.CharField(blank=True, default='', max_length=16, verbose_name='扩展名'),
+        ),
+        migrations.AlterField(
+            model_name='fileblob',
+            name='sha256',
+            field=models.CharField(max_length=64, verbose_name='SHA-256'),
+        ),
+        migrations.AlterUniqueTogether(
+            name='fileblob',
+            unique_together={('sha256', 'ext')},
+        ),
+    ]
@@ -1,8 +1,10 @@
 import hashlib
+import uuid
 from django.conf import settings
 from django.contrib.contenttypes.fields import GenericForeignKey
 from django.contrib.contenttypes.models import ContentType
-from django.db import models
+from django.db import models, transaction
+from django.utils import timezone
 from django.template import Template, Context
 from django.utils.encoding import force_str
 from django.contrib.auth.models import Group, Permission, PermissionsMixin
@@ -11,10 +13,11 @@ from django.db.models import Q
 from jsonstore import JSONField
 from taggit.managers import TaggableManager
 from taggit.models import TaggedItemBase
+from guardian.models import UserObjectPermissionBase
 from ..accounts.utils import RoleChoices
 from .activation import STATUS, STATUS_CHOICES
 from .utils import ProjectTypeChoices, ProjectCateChoices, ProjectStatusChoices, AchievementStateChoices, \
-    ContractChoices
+    ContractChoices, DisplayPushStatusChoices, ChunkedUploadStatusChoices
 
 
 class Project(models.Model):
@@ -99,6 +102,25 @@ def achievement_file_name(instance, filename):
     return f"""project/achievement/{hashlib.md5((str(instance.achievement).encode('UTF-8'))).hexdigest()}/{filename}"""
 
 
+def blob_file_name(instance, filename):
+    # 按内容寻址，相同内容只存一份；保留扩展名，web 服务器和展示平台据此判断文件类型
+    return f"blobs/{instance.sha256[:2]}/{instance.sha256[2:4]}/{instance.sha256}{instance.ext}"
+
+
+class FileBlob(models.Model):
+    """成果文件内容，按 (sha256, 扩展名) 去重，ref_count 为引用它的 FileManager 数"""
+    sha256 = models.CharField(_('SHA-256'), max_length=64)
+    # 小写扩展名，含 '.'，如 '.pdf'；没有扩展名时为空
+    ext = models.CharField(_('扩展名'), max_length=16, blank=True, default='')
+    file = models.FileField(upload_to=blob_file_name, max_length=255)
+    size = models.PositiveBigIntegerField(_('文件大小'), default=0)
+    ref_count = models.PositiveIntegerField(_('引用数'), default=0)
+    created = models.DateTimeField(_('创建时间'), auto_now_add=True)
+
+    class Meta:
+        unique_together = ['sha256', 'ext']
+
+
 class FileManager(models.Model):
     achievement = models.ForeignKey(
         Achievement, on_delete=models.CASCADE, verbose_name=_('成果文件'), related_name='files', db_index=True
@@ -116,6 +138,98 @@ class FileManager(models.Model):
     )
     tags = TaggableManager(verbose_name=_('标签'), through=TaggedFile)
     file_link = models.CharField(_('展示链接'), max_length=255, default='')
+    blob = models.ForeignKey(
+        FileBlob, on_delete=models.PROTECT, null=True, blank=True, related_name='files', verbose_name=_('文件内容')
+    )
+    filename = models.CharField(_('原始文件名'), max_length=255, default='', blank=True)
+
+    def save(self, *args, **kwargs):
+        # 新上传的文件写入内容寻址存储，file 指向共享的 blob
+        if not self.file or self.file._committed:
+            return super().save(*args, **kwargs)
+        from .blobs import attach, release
+        previous = None
+        if self.pk:
+            previous = FileManager.objects.filter(pk=self.pk).values_list('blob_id', flat=True).first()
+        with transaction.atomic():
+            attach(self, self.file)
+            super().save(*args, **kwargs)
+            if previous and previous != self.blob_id:
+                release(previous)
+
+    @property
+    def display_filename(self):
+        return self.filename or (self.file.name.split('/')[-1] if self.file else '')
+
+
+class ChunkedUpload(models.Model):
+    """分片上传会话，分片写在 CHUNKED_UPLOAD_ROOT 下，全部到齐并校验后才创建 FileManager"""
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    achievement = models.ForeignKey(
+        Achievement, on_delete=models.CASCADE, verbose_name=_('成果'), related_name='chunked_uploads'
+    )
+    creator = models.ForeignKey(
+        settings.AUTH_USER_MODEL, on_delete=models.CASCADE, verbose_name=_('文件上传人'), related_name='chunked_uploads'
+    )
+    filename = models.CharField(_('原始文件名'), max_length=255)
+    name = models.CharField(_('文件名'), max_length=255, null=True, blank=True)
+    tags = JSONField(_('标签'), default=list, blank=True)
+    total_size = models.PositiveBigIntegerField(_('文件大小'))
+    chunk_size = models.PositiveIntegerField(_('分片大小'))
+    checksum = models.CharField(_('SHA-256'), max_length=64)
+    status = models.CharField(
+        _('上传状态'), max_length=10, choices=ChunkedUploadStatusChoices.choices,
+        default=ChunkedUploadStatusChoices.UPLOADING.value
+    )
+    file = models.OneToOneField(
+        FileManager, on_delete=models.SET_NULL, null=True, blank=True, related_name='chunked_upload'
+    )
+    created = models.DateTimeField(_('创建时间'), auto_now_add=True)
+
+    @property
+    def total_chunks(self):
+        return max((self.total_size + self.chunk_size - 1) // self.chunk_size, 1)
+
+    def expected_chunk_size(self, index):
+        if index < self.total_chunks - 1:
+            return self.chunk_size
+        return self.total_size - self.chunk_size * (self.total_chunks - 1)
+
+
+class DisplayPush(models.Model):
+    """展示平台推送 outbox，接口只负责入队，由 send_display_outbox 命令投递"""
+    achievement = models.ForeignKey(
+        Achievement, on_delete=models.CASCADE, verbose_name=_('成果'), related_name='display_pushes'
+    )
+    payload = JSONField(_('推送内容'))
+    status = models.CharField(
+        _('发送状态'), max_length=10, choices=DisplayPushStatusChoices.choices,
+        default=DisplayPushStatusChoices.PENDING.value
+    )
+    attempts = models.PositiveIntegerField(_('尝试次数'), default=0)
+    next_attempt = models.DateTimeField(_('下次尝试时间'), default=timezone.now)
+    last_error = models.TextField(_('最近错误'), blank=True, default='')
+    created = models.DateTimeField(_('创建时间'), auto_now_add=True)
+    sent = models.DateTimeField(_('发送时间'), null=True, blank=True)
+
+    class Meta:
+        ordering = ['id']
+        indexes = [
+            models.Index(fields=['status', 'next_attempt'])
+        ]
+
+
+class UserCounter(models.Model):
+    """
+    用户待办计数，由 flow 在同一事务中按增量维护，可用 rebuild_user_counters 命令重建。
+    assigned_tasks: 待处理（ASSIGNED）的 task 数；open_processes: 发起的未结束 process 数
+    """
+    user = models.OneToOneField(
+        settings.AUTH_USER_MODEL, on_delete=models.CASCADE, primary_key=True, related_name='project_counter'
+    )
+    assigned_tasks = models.IntegerField(_('待处理任务数'), default=0)
+    open_processes = models.IntegerField(_('进行中的流程数'), default=0)
+    updated = models.DateTimeField(_('更新时间'), auto_now=True)
 
 
 class AbsProcess(models.Model):
@@ -149,6 +263,14 @@ class Process(AbsProcess):
     artifact_object_id = models.PositiveIntegerField(null=True, blank=True)
     artifact = GenericForeignKey('artifact_content_type', 'artifact_object_id')
 
+    # data 中常用于过滤的字段，单独建列并加索引（data 中仍保留一份）
+    owner = models.ForeignKey(
+        settings.AUTH_USER_MODEL, blank=True, null=True, on_delete=models.SET_NULL,
+        verbose_name=_('Owner'), related_name='issued_processes'
+    )
+    stage = models.PositiveSmallIntegerField(_('Stage'), default=1, db_index=True)
+    activation = models.CharField(_('Activation'), max_length=50, blank=True, default='', db_index=True)
+
     data = JSONField(null=True, blank=True)
 
     class Meta:
@@ -158,7 +280,10 @@ class Process(AbsProcess):
         indexes = [
             models.Index(
                 fields=["artifact_content_type", "artifact_object_id"]
-            )
+            ),
+            models.Index(
+                fields=["owner", "status"]
+            ),
         ]
 
 
@@ -179,6 +304,8 @@ class Task(AbsTask):
     external_task_id = models.CharField(_('External Task ID'), max_length=50, blank=True, null=True, db_index=True)
     owner_permission = models.CharField(_('Permission'), max_length=255, blank=True, null=True)
     comments = models.TextField(_('Comments'), blank=True, null=True)
+    is_first = models.BooleanField(_('Is first'), default=False, db_index=True)
+    is_withdraw = models.BooleanField(_('Is withdraw'), default=False, db_index=True)
 
     data = JSONField(null=True, blank=True)
 
@@ -191,3 +318,43 @@ class Task(AbsTask):
                 fields=["artifact_content_type", "artifact_object_id"]
             )
         ]
+
+
+class InboxEvent(models.Model):
+    """用户待办变化事件，由 flow 写入，供 SSE / long-poll 接口按 id 增量读取"""
+    ASSIGNED = 'assigned'
+    FINISHED = 'finished'
+    KIND_CHOICES = [
+        (ASSIGNED, _('新待办')),
+        (FINISHED, _('待办已处理')),
+    ]
+
+    user = models.ForeignKey(
+        settings.AUTH_USER_MODEL, on_delete=models.CASCADE, verbose_name=_('用户'), related_name='inbox_events'
+    )
+    kind = models.CharField(_('类型'), max_length=20, choices=KIND_CHOICES)
+    task = models.ForeignKey(Task, on_delete=models.CASCADE, verbose_name=_('Task'), related_name='inbox_events')
+    data = JSONField(null=True, blank=True)
+    created = models.DateTimeField(_('创建时间'), auto_now_add=True, db_index=True)
+
+    class Meta:
+        ordering = ['id']
+        indexes = [
+            models.Index(fields=['user', 'id'])
+        ]
+
+
+class AchievementUserObjectPermission(UserObjectPermissionBase):
+    """成果的用户对象权限，整数外键直连 Achievement，代替 guardian 通用表的 varchar object_pk"""
+    content_object = models.ForeignKey(Achievement, on_delete=models.CASCADE, related_name='user_object_permissions')
+
+    class Meta(UserObjectPermissionBase.Meta):
+        abstract = False
+
+
+class ProjectUserObjectPermission(UserObjectPermissionBase):
+    """项目的用户对象权限"""
+    content_object = models.ForeignKey(Project, on_delete=models.CASCADE, related_name='user_object_permissions')
+
+    class Meta(UserObjectPermissionBase.Meta):
+        abstract = False
@@ -0,0 +1,350 @@
+"""
+guardian 对象权限的批量操作。
+
+guardian.shortcuts 的 assign_perm/remove_perm 每个 (用户, 权限) 都是一条 SQL，
+这里按 (users × codenames × objects) 一次完成：授权为一条 INSERT IGNORE，
+回收为一条带 JOIN 的 DELETE。同时兼容 guardian 的通用表和直接外键表。
+
+成果的审批权限由 reconcile_achievement_perms 按状态统一维护，各流程节点不再手工分配。
+列表的可见范围由 visible_projects / visible_achievements 按项目成员关系过滤，
+成员关系变化时由 sync_project_viewers 同步项目和成果的查看权限。
+"""
+from django.contrib.auth import get_user_model
+from django.contrib.auth.models import Permission
+from django.db.models import Exists, Model, OuterRef, Q, QuerySet
+from guardian.ctypes import get_content_type
+from guardian.utils import get_user_obj_perms_model
+from ums.apps.core.identity import get_identity_map
+from .activation import STATUS
+from ums.apps.accounts.utils import RoleChoices
+from .models import Achievement, Process, Project, Task
+from .utils import AchievementStateChoices
+
+BULK_BATCH_SIZE = 1000
+
+
+def _as_objects(objs):
+    if isinstance(objs, Model):
+        return [objs]
+    return objs
+
+
+def _model_of(objs):
+    if isinstance(objs, QuerySet):
+        return objs.model
+    return objs[0].__class__
+
+
+def _object_filter(perm_model, content_type, objs):
+    if not perm_model.objects.is_generic():
+        return {'content_object__in': objs}
+    if isinstance(objs, QuerySet):
+        objs = objs.values_list('pk', flat=True)
+    return {
+        'content_type': content_type,
+        'object_pk__in': [str(pk) for pk in (getattr(o, 'pk', o) for o in objs)],
+    }
+
+
+def _user_ids(users):
+    if isinstance(users, QuerySet):
+        return list(users.values_list('pk', flat=True))
+    return [getattr(u, 'pk', u) for u in users]
+
+
+def bulk_assign_perms(codenames, users, objs, model=None):
+    """
+    为 users 中每个用户分配 objs 上的 codenames 权限，objs 指定 model 时可以是主键列表。
+    已存在的权限直接忽略，返回尝试写入的行数。
+    """
+    objs = list(_as_objects(objs))
+    user_ids = _user_ids(users)
+    if not codenames or not user_ids or not objs:
+        return 0
+    model = model or _model_of(objs)
+    content_type = get_content_type(model)
+    perm_model = get_user_obj_perms_model(model)
+    permissions = list(Permission.objects.filter(content_type=content_type, codename__in=codenames))
+    pks = [getattr(obj, 'pk', obj) for obj in objs]
+
+    if perm_model.objects.is_generic():
+        rows = [
+            perm_model(user_id=uid, permission=perm, content_type=content_type, object_pk=str(pk))
+            for pk in pks for uid in user_ids for perm in permissions
+        ]
+    else:
+        rows = [
+            perm_model(user_id=uid, permission=perm, content_object_id=pk)
+            for pk in pks for uid in user_ids for perm in permissions
+        ]
+    perm_model.objects.bulk_create(rows, batch_size=BULK_BATCH_SIZE, ignore_conflicts=True)
+    return len(rows)
+
+
+def bulk_assign_model_perms(perms, users):
+    """为 users 分配模型级权限，perms 为 'app_label.codename'，一条 INSERT IGNORE"""
+    user_ids = _user_ids(users)
+    if not perms or not user_ids:
+        return 0
+    query = Q()
+    for perm in perms:
+        app_label, codename = perm.split('.', 1)
+        query |= Q(content_type__app_label=app_label, codename=codename)
+    permission_ids = list(Permission.objects.filter(query).values_list('pk', flat=True))
+    field = get_user_model()._meta.get_field('user_permissions')
+    through = field.remote_field.through
+    rows = [through(**{f'{field.m2m_field_name()}_id': uid, f'{field.m2m_reverse_field_name()}_id': pid})
+            for uid in user_ids for pid in permission_ids]
+    through.objects.bulk_create(rows, ignore_conflicts=True)
+    return len(rows)
+
+
+def bulk_remove_perms(codenames, users, objs):
+    """
+    回收 users 在 objs 上的 codenames 权限，一条 DELETE 完成。
+    users 可以是用户列表、id 列表或 QuerySet（作为子查询）。
+    """
+    objs = _as_objects(objs)
+    if not codenames or (not isinstance(objs, QuerySet) and not objs):
+        return 0
+    if not isinstance(users, QuerySet):
+        users = _user_ids(users)
+        if not users:
+            return 0
+    model = _model_of(objs)
+    content_type = get_content_type(model)
+    perm_model = get_user_obj_perms_model(model)
+    queryset = perm_model.objects.filter(
+        user__in=users,
+        permission__content_type=content_type,
+        permission__codename__in=codenames,
+        **_object_filter(perm_model, content_type, objs)
+    )
+    deleted, _ = queryset.delete()
+    return deleted
+
+
+def user_object_perms(user, objs, model=None):
+    """
+    一条查询取得 user 在 objs 上的对象权限，返回 {pk: [codename, ...]}，
+    与 guardian.shortcuts.get_user_perms 一致（只含用户直接分配的权限，不含组权限）。
+    objs 为对象列表，或指定 model 时为主键列表；没有权限的对象不在返回值中。
+    """
+    objs = list(_as_objects(objs))
+    if not objs or not getattr(user, 'pk', None):
+        return {}
+    model = model or _model_of(objs)
+    content_type = get_content_type(model)
+    perm_model = get_user_obj_perms_model(model)
+    pks = [getattr(obj, 'pk', obj) for obj in objs]
+    if perm_model.objects.is_generic():
+        key = 'object_pk'
+        pk_of = {str(pk): pk for pk in pks}
+    else:
+        key = 'content_object_id'
+        pk_of = {pk: pk for pk in pks}
+    rows = perm_model.objects.filter(
+        user_id=user.pk, **_object_filter(perm_model, content_type, objs)
+    ).order_by().values_list(key, 'permission__codename')
+    result = {}
+    for object_pk, codename in rows:
+        result.setdefault(pk_of[object_pk], []).append(codename)
+    for codenames in result.values():
+        codenames.sort()
+    return result
+
+
+# ---------------------------------------------------------------------------
+# 列表可见范围：与 reconcile、sync_project_viewers 分配查看权限的规则一致（项目创建人、成员、负责人、审批人），
+# 用 m2m 中间表上的 EXISTS 判断，走 (project_id, user_id) 唯一索引，不经过 guardian 的 varchar object_pk
+# ---------------------------------------------------------------------------
+
+# 可以查看全部项目和成果的角色
+VIEW_ALL_ROLES = (RoleChoices.SECRETARY.value, RoleChoices.ADMIN.value, RoleChoices.DEV.value)
+MEMBERSHIP_FIELDS = ('project_members', 'project_sponsor', 'project_approver')
+
+
+def can_view_all(user):
+    return user.is_superuser or user.role in VIEW_ALL_ROLES
+
+
+def _membership(user_id):
+    """项目 pk（OuterRef）的成员、负责人或审批人中包含 user_id"""
+    condition = Q()
+    for name in MEMBERSHIP_FIELDS:
+        field = Project._meta.get_field(name)
+        through = field.remote_field.through
+        condition |= Exists(through.objects.filter(**{
+            field.m2m_field_name(): OuterRef('pk'),
+            field.m2m_reverse_field_name(): user_id,
+        }))
+    return condition
+
+
+def visible_projects(user, queryset=None):
+    """user 可以查看的项目：创建人，或项目成员、负责人、审批人"""
+    queryset = Project.objects.all() if queryset is None else queryset
+    if not user.is_authenticated:
+        return queryset.none()
+    if can_view_all(user):
+        return queryset
+    return queryset.filter(Q(project_issuer_id=user.pk) | _membership(user.pk))
+
+
+def visible_achievements(user, queryset=None):
+    """user 可以查看的成果：作者，或所属项目对其可见"""
+    queryset = Achievement.objects.all() if queryset is None else queryset
+    if not user.is_authenticated:
+        return queryset.none()
+    if can_view_all(user):
+        return queryset
+    projects = visible_projects(user).order_by().values('pk')
+    return queryset.filter(Q(creator_id=user.pk) | Q(project_id__in=projects))
+
+
+def project_viewer_ids(project_id, user_ids=None):
+    """项目的创建人、成员、负责人、审批人 id，一条 UNION 查询；给出 user_ids 时只在其中查找"""
+    issuer = Project.objects.filter(pk=project_id).order_by()
+    if user_ids is not None:
+        issuer = issuer.filter(project_issuer_id__in=user_ids)
+    querysets = [issuer.values_list('project_issuer_id', flat=True)]
+    for name in MEMBERSHIP_FIELDS:
+        field = Project._meta.get_field(name)
+        queryset = field.remote_field.through.objects.filter(**{field.m2m_field_name(): project_id})
+        if user_ids is not None:
+            queryset = queryset.filter(**{f'{field.m2m_reverse_field_name()}__in': user_ids})
+        querysets.append(queryset.values_list(field.m2m_reverse_field_name(), flat=True))
+    return set(querysets[0].union(*querysets[1:]))
+
+
+def sync_project_viewers(project_id, added=(), removed=()):
+    """
+    项目创建人、成员、负责人、审批人变化后同步查看权限：added 授予项目及其全部成果的查看权限，
+    removed 中已不担任任何角色的用户回收。授权、回收各按 (用户 × 对象) 批量完成。
+    返回 (授权用户数, 回收用户数)。
+    """
+    added = set(added)
+    removed = set(removed) - added
+    if removed:
+        removed -= project_viewer_ids(project_id, removed)
+    achievements = Achievement.objects.filter(project_id=project_id)
+    if added:
+        bulk_assign_perms(['view_project'], added, [project_id], model=Project)
+        bulk_assign_perms(['view_achievement'], added, list(achievements.values_list('pk', flat=True)),
+                          model=Achievement)
+    if removed:
+        bulk_remove_perms(['view_project'], removed, Project.objects.filter(pk=project_id))
+        bulk_remove_perms(['view_achievement'], removed, achievements)
+    return len(added), len(removed)
+
+
+# ---------------------------------------------------------------------------
+# 成果（Achievement）对象权限：由状态推导期望权限集合，与现有记录比对后只写差量
+# ---------------------------------------------------------------------------
+
+EDIT_PERMS = ('change_achievement', 'submit_achievement', 'delete_achievement')
+APPROVE_PERMS = {1: 'approve_achievement_lv1', 2: 'approve_achievement_lv2'}
+# 由 reconcile 管理的权限，final_review_achievement 按角色分配，不在此列
+MANAGED_PERMS = EDIT_PERMS + ('withdraw_achievement', 'view_achievement') + tuple(APPROVE_PERMS.values())
+FINISHED_STATUS = (STATUS.DONE, STATUS.ERROR, STATUS.CANCELED, STATUS.DENY)
+
+
+def desired_achievement_perms(achievement, members, sponsors, approvers, process=None, tasks=()):
+    """
+    根据成果状态计算期望的 {(user_id, codename)} 集合，不访问数据库。
+
+    :param achievement: Achievement，仅使用 state/status1/status2/creator_id
+    :param members: 可查看成果的用户 id（项目创建人、成员、负责人、审批人）
+    :param sponsors: 项目负责人 id
+    :param approvers: 项目审批人（分管领导）id
+    :param process: 该成果最新的 Process，可为 None
+    :param tasks: 该 Process 的审批 task，(owner_id, status, owner_permission, finished) 元组
+    """
+    sponsors, approvers = set(sponsors), set(approvers)
+    perms = {(uid, 'view_achievement') for uid in members}
+
+    def grant(user_id, codenames):
+        if user_id is not None:
+            perms.update((user_id, c) for c in codenames)
+
+    owner_id = process.owner_id if process is not None else None
+    if achievement.status2 == STATUS.DONE:
+        # 二级审批通过，流程结束，仅保留查看权限
+        return perms
+    if process is not None and process.status not in FINISHED_STATUS:
+        # 审批中：提交人可撤销，尚未处理的审批人保有审批权限
+        stage = process.stage
+        eligible = sponsors if stage == 1 else approvers
+        grant(owner_id, ['withdraw_achievement'])
+        for task_owner, task_status, task_perm, _ in tasks:
+            if task_status == STATUS.ASSIGNED and task_perm == APPROVE_PERMS[stage] and task_owner in eligible:
+                grant(task_owner, [APPROVE_PERMS[stage]])
+    elif process is None or achievement.state == AchievementStateChoices.NEW:
+        grant(achievement.creator_id, EDIT_PERMS)
+    elif achievement.state == AchievementStateChoices.DENY:
+        # 驳回后由作者撤销
+        grant(achievement.creator_id, ['withdraw_achievement'])
+    elif achievement.state == AchievementStateChoices.WITHDRAW:
+        # 驳回后撤销的是作者，审批中撤销的是提交人
+        denied = any(task_status == STATUS.DENY for _, task_status, _, _ in tasks)
+        grant(achievement.creator_id if denied else owner_id, EDIT_PERMS)
+    elif achievement.state == AchievementStateChoices.APP and achievement.status1 == STATUS.DONE:
+        # 一级审批通过：谁审批，谁提交。会签取最后一个审批人，或签/单签取第一个（其余为自动通过）
+        done = [t for t in tasks if t[1] == STATUS.DONE and t[2] == APPROVE_PERMS[1] and t[0] in sponsors]
+        if done:
+            pick = max if process.data.get('flow_type', 'SINGLE') == 'JOIN' else min
+            grant(pick(done, key=lambda t: t[3])[0], EDIT_PERMS)
+    return perms
+
+
+def reconcile_achievement_perms(achievement):
+    """
+    使成果的对象权限与其状态一致：一次读取现有记录，只删除多余的、只插入缺少的。
+    查询次数固定，与项目成员数无关。返回 (新增数, 删除数)。
+    """
+    project = achievement.project
+    identity_map = get_identity_map()
+    content_type = identity_map.content_type(achievement)
+    process = Process.objects.filter(
+        artifact_content_type=content_type, artifact_object_id=achievement.pk
+    ).order_by('-created', '-id').first()
+    tasks = []
+    if process is not None:
+        tasks = list(Task.objects.filter(process=process).values_list(
+            'owner_id', 'status', 'owner_permission', 'finished'))
+    sponsors = identity_map.related_ids(project, 'project_sponsor')
+    approvers = identity_map.related_ids(project, 'project_approver')
+    desired = desired_achievement_perms(
+        achievement,
+        # 与 sync_project_viewers 一致，创建人、负责人、审批人也可查看
+        members=identity_map.related_ids(project, 'project_members') | sponsors | approvers
+        | {project.project_issuer_id},
+        sponsors=sponsors,
+        approvers=approvers,
+        process=process,
+        tasks=tasks,
+    )
+
+    perm_model = get_user_obj_perms_model(achievement)
+    current = {}
+    for pk, user_id, codename in perm_model.objects.filter(
+            permission__content_type=content_type, permission__codename__in=MANAGED_PERMS,
+            **_object_filter(perm_model, content_type, [achievement])
+    ).values_list('pk', 'user_id', 'permission__codename'):
+        current[(user_id, codename)] = pk
+
+    stale = [pk for key, pk in current.items() if key not in desired]
+    missing = desired - set(current)
+    if stale:
+        perm_model.objects.filter(pk__in=stale).delete()
+    if missing:
+        permissions = dict(Permission.objects.filter(
+            content_type=content_type, codename__in={c for _, c in missing}).values_list('codename', 'id'))
+        if perm_model.objects.is_generic():
+            rows = [perm_model(user_id=uid, permission_id=permissions[c], content_type=content_type,
+                               object_pk=str(achievement.pk)) for uid, c in missing]
+        else:
+            rows = [perm_model(user_id=uid, permission_id=permissions[c], content_object=achievement)
+                    for uid, c in missing]
+        perm_model.objects.bulk_create(rows, ignore_conflicts=True)
+    return len(missing), len(stale)
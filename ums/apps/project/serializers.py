@@ -1,9 +1,10 @@
+from django.db.models import Prefetch, QuerySet, prefetch_related_objects
 from rest_framework import serializers
 from django.contrib.auth.models import Group
 from django.conf import settings
 from taggit.serializers import TaggitSerializer, TagListSerializerField
 from ums.apps.accounts.serializers import UserSerializer
-from .models import Project, Process, Task, FileManager, Achievement
+from .models import Project, Process, Task, FileManager, Achievement, ChunkedUpload
 from .utils import AchievementStateChoices
 from .activation import STATUS, STATUS_DISPLAY, FIRST_TASK_STATUS_DISPLAY
 
@@ -16,6 +17,23 @@ def get_first_task_status_display(status):
     return FIRST_TASK_STATUS_DISPLAY[status]
 
 
+class EagerLoadingMixin:
+    """
+    列表序列化前一次性预加载关联对象，避免逐行查询。
+    setup_eager_loading 接受 QuerySet 或已取出的对象列表。
+    """
+    select_related_fields = ()
+    prefetch_related_fields = ()
+
+    @classmethod
+    def setup_eager_loading(cls, queryset):
+        if isinstance(queryset, QuerySet):
+            return queryset.select_related(*cls.select_related_fields).prefetch_related(
+                *cls.prefetch_related_fields)
+        prefetch_related_objects(queryset, *cls.select_related_fields, *cls.prefetch_related_fields)
+        return queryset
+
+
 class FileManagerSerializer(TaggitSerializer, serializers.ModelSerializer):
     tags = TagListSerializerField()
     file_name = serializers.CharField(source='file.name', read_only=True)
@@ -23,15 +41,55 @@ class FileManagerSerializer(TaggitSerializer, serializers.ModelSerializer):
     class Meta:
         model = FileManager
         fields = "__all__"
+        read_only_fields = ('blob', 'filename')
 
     def to_representation(self, instance):
         ret = super().to_representation(instance)
         if ret['file_name']:
-            ret['file_name'] = ret['file_name'].split('/')[-1]
+            ret['file_name'] = instance.display_filename
         ret.pop('file')
         return ret
 
 
+class ChunkedUploadSerializer(serializers.ModelSerializer):
+    tags = serializers.ListField(child=serializers.CharField(max_length=100), required=False)
+    checksum = serializers.RegexField(r'^[0-9a-fA-F]{64}$')
+
+    class Meta:
+        model = ChunkedUpload
+        fields = (
+            'id', 'achievement', 'filename', 'name', 'tags', 'total_size', 'chunk_size', 'checksum',
+            'status', 'file', 'created',
+        )
+        read_only_fields = ('status', 'file', 'created')
+
+    def validate_filename(self, value):
+        value = value.replace('\\', '/').split('/')[-1]
+        if not value:
+            raise serializers.ValidationError('文件名不能为空')
+        return value
+
+    def validate_chunk_size(self, value):
+        max_size = getattr(settings, 'CHUNKED_UPLOAD_MAX_CHUNK_SIZE', 16 * 1024 * 1024)
+        if not 0 < value <= max_size:
+            raise serializers.ValidationError(f'分片大小需在 1 到 {max_size} 之间')
+        return value
+
+    def validate_total_size(self, value):
+        max_size = getattr(settings, 'CHUNKED_UPLOAD_MAX_SIZE', 2 * 1024 * 1024 * 1024)
+        if value > max_size:
+            raise serializers.ValidationError(f'文件大小不能超过 {max_size}')
+        return value
+
+    def validate_checksum(self, value):
+        return value.lower()
+
+    def to_representation(self, instance):
+        ret = super().to_representation(instance)
+        ret['total_chunks'] = instance.total_chunks
+        return ret
+
+
 class ProjectSerializer(serializers.ModelSerializer):
     class Meta:
         model = Project
@@ -59,11 +117,14 @@ class ProjectSerializer(serializers.ModelSerializer):
         return ret
 
 
-class AchievementSerializer(serializers.ModelSerializer):
+class AchievementSerializer(EagerLoadingMixin, serializers.ModelSerializer):
     project_title = serializers.CharField(source='project.project_title', read_only=True)
     creator_name = serializers.CharField(source='creator.name', read_only=True)
     files = FileManagerSerializer(many=True, read_only=True)
 
+    select_related_fields = ('project', 'creator')
+    prefetch_related_fields = ('project__project_sponsor', 'project__project_approver', 'files__tags')
+
     # project_sponsor = serializers.JSONField()
 
     class Meta:
@@ -96,6 +157,9 @@ class AchievementSerializer(serializers.ModelSerializer):
         ret['project_sponsor'] = [{'id': i.id, 'name': i.name} for i in instance.project.project_sponsor.all()]
         ret['project_approver'] = [{'id': i.id, 'name': i.name} for i in instance.project.project_approver.all()]
         ret['state_display_name'] = self.get_state_display_name(instance)
+        if 'user_perms' in self.context:
+            # ?include=perms 时由视图按页一次查询
+            ret['perms'] = self.context['user_perms'].get(instance.pk, [])
         return ret
 
 
@@ -111,11 +175,14 @@ class ArtifactObjectRelatedField(serializers.RelatedField):
         return serializer.data
 
 
-class TaskSerializer(serializers.ModelSerializer):
+class TaskSerializer(EagerLoadingMixin, serializers.ModelSerializer):
     project_id = serializers.CharField(source='artifact.project.id')
     project_name = serializers.CharField(source='artifact.project.project_title')
     achievement_name = serializers.CharField(source='artifact.name')
 
+    select_related_fields = ('owner',)
+    prefetch_related_fields = ('previous', 'artifact__project')
+
     class Meta:
         model = Task
         fields = "__all__"
@@ -136,9 +203,14 @@ class TaskSerializer(serializers.ModelSerializer):
         return ret
 
 
-class ProcessSerializer(serializers.ModelSerializer):
+class ProcessSerializer(EagerLoadingMixin, serializers.ModelSerializer):
     task = TaskSerializer(read_only=True, many=True)
 
+    prefetch_related_fields = (
+        'artifact__project',
+        Prefetch('task', queryset=TaskSerializer.setup_eager_loading(Task.objects.all())),
+    )
+
     class Meta:
         model = Process
         fields = "__all__"
@@ -0,0 +1,68 @@
+from django.db.models.signals import m2m_changed, post_delete, post_save, pre_save
+from django.dispatch import receiver
+
+from ums.apps.core.identity import get_identity_map
+from .blobs import release
+from .models import FileManager, Project
+from .perms import MEMBERSHIP_FIELDS, sync_project_viewers
+
+
+@receiver(post_delete, sender=FileManager)
+def release_file_blob(sender, instance, **kwargs):
+    # 包括成果级联删除的文件
+    if instance.blob_id:
+        release(instance.blob_id)
+
+
+@receiver(pre_save, sender=Project)
+def remember_project_issuer(sender, instance, **kwargs):
+    instance._previous_issuer_id = None
+    if instance.pk:
+        instance._previous_issuer_id = Project.objects.filter(pk=instance.pk).values_list(
+            'project_issuer_id', flat=True).first()
+
+
+@receiver(post_save, sender=Project)
+def sync_project_issuer(sender, instance, created, **kwargs):
+    """创建人与成员一样可以查看项目及其成果"""
+    previous = instance.__dict__.pop('_previous_issuer_id', None)
+    if previous == instance.project_issuer_id:
+        return
+    sync_project_viewers(instance.pk, added=[instance.project_issuer_id], removed=[previous] if previous else [])
+
+
+def sync_project_membership(sender, instance, action, reverse, pk_set, **kwargs):
+    """项目成员、负责人、审批人变化（正反两侧的 add/remove/clear、set）时同步查看权限"""
+    field = _membership_fields[sender]
+    cleared = instance.__dict__.setdefault('_membership_cleared', {})
+    if action == 'pre_clear':
+        # clear 不带 pk_set，先记下将被清除的另一侧 id
+        manager = getattr(instance, field.remote_field.get_accessor_name() if reverse else field.name)
+        cleared[sender] = set(manager.values_list('pk', flat=True))
+        return
+    if action == 'post_clear':
+        pk_set = cleared.pop(sender, set())
+    elif action not in ('post_add', 'post_remove'):
+        return
+    if not pk_set:
+        return
+    key = 'added' if action == 'post_add' else 'removed'
+    if reverse:
+        # instance 为用户，pk_set 为项目
+        for project_id in pk_set:
+            _sync(project_id, field, **{key: [instance.pk]})
+    else:
+        _sync(instance.pk, field, **{key: pk_set})
+
+
+def _sync(project_id, field, **changes):
+    get_identity_map().discard(('related', Project._meta.label_lower, project_id, field.name))
+    sync_project_viewers(project_id, **changes)
+
+
+_membership_fields = {}
+for _name in MEMBERSHIP_FIELDS:
+    _field = Project._meta.get_field(_name)
+    _membership_fields[_field.remote_field.through] = _field
+    m2m_changed.connect(sync_project_membership, sender=_field.remote_field.through,
+                        dispatch_uid=f'sync_project_membership_{_name}')
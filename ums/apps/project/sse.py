@@ -0,0 +1,144 @@
+"""
+待办变化的 SSE 推送（ASGI），由 ums/asgi.py 挂载在 INBOX_STREAM_PATH。
+
+认证：Authorization: Bearer <access token>，或 ?token=<access token>（EventSource 无法设置请求头）。
+断线重连时浏览器带 Last-Event-ID（或 ?last_event_id=），从该事件之后继续推送；
+晚提交的较小 id 事件由 inbox.events_after 回扫，同一连接内不重复推送，重连后可能重复，客户端按 id 去重。
+
+数据库查询不经过 Django 的请求周期，由 _db 在独立线程池中执行，并在查询前后 close_old_connections，
+避免长连接超过 MySQL wait_timeout，各连接之间也不争用同一个线程。
+"""
+import asyncio
+import json
+from urllib.parse import parse_qs
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import close_old_connections
+from django.core.serializers.json import DjangoJSONEncoder
+from rest_framework.exceptions import AuthenticationFailed
+from rest_framework.settings import api_settings
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.exceptions import InvalidToken, TokenError
+from rest_framework_simplejwt.settings import api_settings as jwt_settings
+
+from . import inbox
+from .counters import get_counter
+
+HEARTBEAT = 15
+
+
+def _run_db(func, *args):
+    close_old_connections()
+    try:
+        return func(*args)
+    finally:
+        close_old_connections()
+
+
+async def _db(func, *args):
+    return await sync_to_async(_run_db, thread_sensitive=False)(func, *args)
+
+
+def _authenticate(raw_token):
+    auth_classes = [cls for cls in api_settings.DEFAULT_AUTHENTICATION_CLASSES if issubclass(cls, JWTAuthentication)]
+    auth = (auth_classes[0] if auth_classes else JWTAuthentication)()
+    try:
+        return auth.get_user(auth.get_validated_token(raw_token))
+    except (InvalidToken, TokenError, AuthenticationFailed):
+        return None
+
+
+def _format(event, event_id=None, data=None):
+    lines = []
+    if event_id is not None:
+        lines.append(f'id: {event_id}')
+    lines.append(f'event: {event}')
+    lines.append(f'data: {json.dumps(data, cls=DjangoJSONEncoder, ensure_ascii=False)}')
+    return ('\n'.join(lines) + '\n\n').encode('utf-8')
+
+
+async def _reject(send, status, message):
+    await send({
+        'type': 'http.response.start',
+        'status': status,
+        'headers': [(b'content-type', b'application/json')],
+    })
+    await send({'type': 'http.response.body', 'body': json.dumps({'msg': message}).encode('utf-8')})
+
+
+async def inbox_stream(scope, receive, send):
+    headers = {k.decode('latin1').lower(): v.decode('latin1') for k, v in scope.get('headers', [])}
+    query = parse_qs(scope.get('query_string', b'').decode('latin1'))
+    raw_token = None
+    auth_header = headers.get('authorization', '').split()
+    if len(auth_header) == 2 and auth_header[0] in jwt_settings.AUTH_HEADER_TYPES:
+        raw_token = auth_header[1]
+    elif query.get('token'):
+        raw_token = query['token'][0]
+    user = await _db(_authenticate, raw_token) if raw_token else None
+    if user is None:
+        return await _reject(send, 401, '身份认证信息未提供或无效。')
+
+    # 回扫窗口内已推送的事件 id -> 创建时间
+    seen = {}
+    try:
+        last_id = int(headers.get('last-event-id') or query.get('last_event_id', [''])[0])
+    except ValueError:
+        # 新连接只推送此后的事件，窗口内已提交的视为已推送
+        last_id = await _db(inbox.latest_event_id, user.id)
+        recent = await _db(inbox.events_after, user.id, last_id)
+        seen = {e['id']: e['created'] for e in recent if e['id'] <= last_id}
+
+    await send({
+        'type': 'http.response.start',
+        'status': 200,
+        'headers': [
+            (b'content-type', b'text/event-stream'),
+            (b'cache-control', b'no-cache'),
+            # 关闭 nginx 缓冲，事件立即下发
+            (b'x-accel-buffering', b'no'),
+        ],
+    })
+
+    disconnected = asyncio.Event()
+
+    async def watch_disconnect():
+        while True:
+            message = await receive()
+            if message['type'] == 'http.disconnect':
+                disconnected.set()
+                return
+
+    handle = inbox.subscribe(user.id)
+    watcher = asyncio.ensure_future(watch_disconnect())
+    poll_interval = getattr(settings, 'INBOX_POLL_INTERVAL', 5)
+    loop = asyncio.get_running_loop()
+    try:
+        counter = await _db(get_counter, user)
+        await send({'type': 'http.response.body', 'body': _format('counter', data=counter), 'more_body': True})
+        last_sent = loop.time()
+        while not disconnected.is_set():
+            handle[1].clear()
+            cutoff = inbox.grace_cutoff()
+            seen = {pk: created for pk, created in seen.items() if created >= cutoff}
+            events = await _db(inbox.events_after, user.id, last_id, list(seen))
+            if events:
+                body = b''.join(_format(e['kind'], e['id'], e) for e in events)
+                last_id = max(last_id, events[-1]['id'])
+                seen.update((e['id'], e['created']) for e in events)
+                counter = await _db(get_counter, user)
+                body += _format('counter', data=counter)
+                await send({'type': 'http.response.body', 'body': body, 'more_body': True})
+                last_sent = loop.time()
+                continue
+            if loop.time() - last_sent >= HEARTBEAT:
+                await send({'type': 'http.response.body', 'body': b': ping\n\n', 'more_body': True})
+                last_sent = loop.time()
+            waiters = [asyncio.ensure_future(handle[1].wait()), asyncio.ensure_future(disconnected.wait())]
+            _, pending = await asyncio.wait(waiters, timeout=poll_interval, return_when=asyncio.FIRST_COMPLETED)
+            for waiter in pending:
+                waiter.cancel()
+    finally:
+        inbox.unsubscribe(user.id, handle)
+        watcher.cancel()
@@ -1,3 +1,910 @@
-from django.test import TestCase
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+import threading
+import uuid
+from datetime import timedelta
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from io import StringIO
+from unittest import mock
 
-# Create your tests here.
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.contrib.auth.models import AnonymousUser, Permission
+from django.core.files.base import ContentFile
+from django.core.management import call_command
+from django.db import connection
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from django.utils.timezone import now
+from rest_framework.test import APIClient
+
+from ums.apps.accounts.utils import RoleChoices
+from . import counters, display, inbox, uploads
+from .activation import STATUS
+from .models import Achievement, AchievementUserObjectPermission, ChunkedUpload, FileBlob, FileManager, InboxEvent, \
+    Process, Project, Task, UserCounter
+from .perms import APPROVE_PERMS, EDIT_PERMS, VIEW_ALL_ROLES, desired_achievement_perms, reconcile_achievement_perms, \
+    user_object_perms, visible_achievements, visible_projects
+from .utils import AchievementStateChoices, DisplayPushStatusChoices
+from .views import KeysetPagination
+
+User = get_user_model()
+BASE = '/api/v1/project-system/'
+
+
+class ProjectTestMixin:
+    """一个项目：作者、两个负责人（同为成员）、一个审批人、一个秘书"""
+
+    def setUp(self):
+        self.creator = self.make_user('creator', RoleChoices.PROJECT_WORKER.value)
+        self.sponsors = [self.make_user(f'sponsor{i}', RoleChoices.PROJECT_SPONSOR.value) for i in range(2)]
+        self.leader = self.make_user('leader', RoleChoices.APPROVAL_LEADER.value)
+        self.secretary = self.make_user('secretary', RoleChoices.SECRETARY.value)
+        self.project = Project.objects.create(project_id='P1', project_title='project', project_type='0',
+                                              project_cate='0', project_issuer=self.secretary)
+        self.project.project_members.set([self.creator] + self.sponsors)
+        self.project.project_sponsor.set(self.sponsors)
+        self.project.project_approver.set([self.leader])
+        self.creator.user_permissions.add(*Permission.objects.filter(
+            codename__in=['add_achievement', 'add_filemanager']))
+
+    def make_user(self, username, role):
+        return User.objects.create(username=username, name=username, role=role,
+                                   phone_number=f'1380000{User.objects.count():04d}')
+
+    def client_for(self, user=None):
+        client = APIClient()
+        if user is not None:
+            client.force_authenticate(user)
+        return client
+
+    def create_achievement(self):
+        response = self.client_for(self.creator).post(BASE + 'achievement/', {
+            'project': self.project.pk, 'name': 'achievement', 'creator': self.creator.pk}, format='json')
+        self.assertEqual(response.status_code, 201)
+        return Achievement.objects.get(pk=response.data['id'])
+
+    def submit(self, achievement, approvers, user=None, level=1, flow_type='OR'):
+        return self.client_for(user or self.creator).put(BASE + f'achievement/{achievement.pk}/submit/', {
+            'level': level, 'flow_type': flow_type, 'required_approver': approvers}, format='json')
+
+
+class SubmitTest(ProjectTestMixin, TestCase):
+
+    def test_string_approver_ids(self):
+        achievement = self.create_achievement()
+        response = self.submit(achievement, [{'id': str(u.pk), 'name': u.name} for u in self.sponsors])
+        self.assertEqual(response.status_code, 200)
+        process = Process.objects.get(artifact_object_id=achievement.pk)
+        owners = set(Task.objects.filter(process=process, status=STATUS.ASSIGNED).values_list('owner_id', flat=True))
+        self.assertEqual(owners, {u.pk for u in self.sponsors})
+
+    def test_invalid_approver_ids(self):
+        achievement = self.create_achievement()
+        for approvers in ([{'id': 'abc'}], [{'name': 'x'}], '5', None, [{'id': self.leader.pk}]):
+            response = self.submit(achievement, approvers)
+            self.assertEqual(response.status_code, 400, approvers)
+            # 成果状态和流程都不变
+            achievement.refresh_from_db()
+            self.assertEqual(achievement.state, AchievementStateChoices.NEW.value)
+            self.assertFalse(Process.objects.filter(artifact_object_id=achievement.pk).exists())
+
+
+    def test_task_ids_without_returning(self):
+        # MySQL 的 bulk insert 不返回主键；同一时刻的两批 task 不能混淆
+        moment = timezone.now()
+        with mock.patch.object(type(connection.features), 'can_return_rows_from_bulk_insert',
+                               new_callable=mock.PropertyMock, return_value=False), \
+                mock.patch('ums.apps.project.flow.timezone.now', return_value=moment):
+            for achievement in (self.create_achievement(), self.create_achievement()):
+                self.assertEqual(self.submit(achievement, [{'id': u.pk} for u in self.sponsors]).status_code, 200)
+        self.assertEqual(InboxEvent.objects.count(), 4)
+        for event in InboxEvent.objects.select_related('task'):
+            self.assertEqual(event.task.owner_id, event.user_id)
+            self.assertEqual(event.task.artifact_object_id, event.data['achievement'])
+        for task in Task.objects.filter(status=STATUS.ASSIGNED):
+            self.assertEqual([t.process_id for t in task.previous.all()], [task.process_id])
+            self.assertTrue(task.previous.get().is_first)
+
+
+@override_settings(INBOX_EVENT_GRACE=60)
+class InboxTest(ProjectTestMixin, TestCase):
+
+    def setUp(self):
+        super().setUp()
+        achievement = self.create_achievement()
+        self.submit(achievement, [{'id': self.sponsors[0].pk}])
+        self.user = self.sponsors[0]
+        self.first = InboxEvent.objects.get(user=self.user)
+        # 早已提交的事件，不在回扫窗口内
+        InboxEvent.objects.filter(pk=self.first.pk).update(created=timezone.now() - timedelta(seconds=120))
+
+    def event(self, pk):
+        return InboxEvent.objects.create(pk=pk, user=self.user, kind=InboxEvent.ASSIGNED, task_id=self.first.task_id)
+
+    def poll(self, after):
+        response = self.client_for(self.user).get(BASE + 'task/inbox/', {'after': after})
+        self.assertEqual(response.status_code, 200)
+        return [event['id'] for event in response.data['events']], response.data['last_event_id']
+
+    def test_late_commit(self):
+        self.assertEqual(self.poll(0), ([self.first.pk], self.first.pk))
+        high = self.event(self.first.pk + 10)
+        self.assertEqual(self.poll(self.first.pk), ([high.pk], high.pk))
+        # 较小 id 的事件在客户端越过它之后才提交
+        late = self.event(self.first.pk + 5)
+        self.assertEqual(self.poll(high.pk), ([late.pk, high.pk], high.pk))
+
+    def test_seen(self):
+        high = self.event(self.first.pk + 10)
+        late = self.event(self.first.pk + 5)
+        events = inbox.events_after(self.user.pk, high.pk, seen=[high.pk])
+        self.assertEqual([event['id'] for event in events], [late.pk])
+        self.assertEqual(inbox.events_after(self.user.pk, high.pk, seen=[late.pk, high.pk]), [])
+
+
+class DesiredAchievementPermsTest(SimpleTestCase):
+    """desired_achievement_perms：作者 1，负责人 2、3，审批人 4，成员 5"""
+    CREATOR, SPONSORS, APPROVERS, MEMBERS = 1, {2, 3}, {4}, {1, 2, 3, 4, 5}
+    LV1, LV2 = APPROVE_PERMS[1], APPROVE_PERMS[2]
+
+    def desired(self, state=AchievementStateChoices.NEW.value, status1=STATUS.NEW, status2=STATUS.NEW,
+                process=None, tasks=()):
+        achievement = Achievement(creator_id=self.CREATOR, state=state, status1=status1, status2=status2)
+        perms = desired_achievement_perms(achievement, self.MEMBERS, self.SPONSORS, self.APPROVERS, process, tasks)
+        viewers = {(uid, 'view_achievement') for uid in self.MEMBERS}
+        self.assertLessEqual(viewers, perms)
+        return perms - viewers
+
+    def process(self, status, stage=1, owner=CREATOR, flow_type='OR'):
+        return Process(status=status, stage=stage, owner_id=owner, data={'flow_type': flow_type})
+
+    def edit(self, user_id):
+        return {(user_id, codename) for codename in EDIT_PERMS}
+
+    def test_new(self):
+        self.assertEqual(self.desired(), self.edit(self.CREATOR))
+        # 撤销后重新编辑的成果仍是 NEW
+        self.assertEqual(self.desired(process=self.process(STATUS.CANCELED)), self.edit(self.CREATOR))
+
+    def test_submitted_stage1(self):
+        tasks = [(2, STATUS.ASSIGNED, self.LV1, None), (3, STATUS.DONE, self.LV1, now()),
+                 (4, STATUS.ASSIGNED, self.LV1, None)]
+        perms = self.desired(AchievementStateChoices.SUB.value, STATUS.STARTED,
+                             process=self.process(STATUS.STARTED), tasks=tasks)
+        # 已处理的负责人、非负责人都没有审批权限
+        self.assertEqual(perms, {(self.CREATOR, 'withdraw_achievement'), (2, self.LV1)})
+
+    def test_submitted_stage2(self):
+        # 负责人直接提交到二级审批
+        tasks = [(4, STATUS.ASSIGNED, self.LV2, None), (3, STATUS.ASSIGNED, self.LV2, None)]
+        perms = self.desired(AchievementStateChoices.SUB.value, STATUS.DONE, STATUS.STARTED,
+                             process=self.process(STATUS.STARTED, stage=2, owner=2), tasks=tasks)
+        self.assertEqual(perms, {(2, 'withdraw_achievement'), (4, self.LV2)})
+
+    def approved(self, flow_type, tasks):
+        return self.desired(AchievementStateChoices.APP.value, STATUS.DONE,
+                            process=self.process(STATUS.DONE, flow_type=flow_type), tasks=tasks)
+
+    def test_approved_stage1(self):
+        first, last = now() - timedelta(minutes=1), now()
+        self.assertEqual(self.approved('SINGLE', [(2, STATUS.DONE, self.LV1, first)]), self.edit(2))
+        # 或签：第一个审批的负责人提交，其余为自动通过
+        tasks = [(3, STATUS.DONE, self.LV1, last), (2, STATUS.DONE, self.LV1, first)]
+        self.assertEqual(self.approved('OR', tasks), self.edit(2))
+        # 会签：最后一个审批的负责人提交
+        self.assertEqual(self.approved('JOIN', tasks), self.edit(3))
+        # 审批人已不是负责人
+        self.assertEqual(self.approved('SINGLE', [(5, STATUS.DONE, self.LV1, first)]), set())
+
+    def test_denied(self):
+        denied = [(2, STATUS.DENY, self.LV1, now())]
+        perms = self.desired(AchievementStateChoices.DENY.value, STATUS.DENY,
+                             process=self.process(STATUS.DENY, owner=self.CREATOR), tasks=denied)
+        self.assertEqual(perms, {(self.CREATOR, 'withdraw_achievement')})
+        denied = [(4, STATUS.DENY, self.LV2, now())]
+        perms = self.desired(AchievementStateChoices.DENY.value, STATUS.DONE, STATUS.DENY,
+                             process=self.process(STATUS.DENY, stage=2, owner=2), tasks=denied)
+        self.assertEqual(perms, {(self.CREATOR, 'withdraw_achievement')})
+
+    def test_withdrawn(self):
+        # 审批中撤销：提交人恢复编辑权限
+        tasks = [(4, STATUS.CANCELED, self.LV2, now())]
+        perms = self.desired(AchievementStateChoices.WITHDRAW.value,
+                             process=self.process(STATUS.CANCELED, stage=2, owner=2), tasks=tasks)
+        self.assertEqual(perms, self.edit(2))
+        # 驳回后撤销：作者恢复编辑权限
+        tasks = [(4, STATUS.DENY, self.LV2, now())]
+        perms = self.desired(AchievementStateChoices.WITHDRAW.value,
+                             process=self.process(STATUS.DENY, stage=2, owner=2), tasks=tasks)
+        self.assertEqual(perms, self.edit(self.CREATOR))
+
+    def test_finished(self):
+        tasks = [(4, STATUS.DONE, self.LV2, now())]
+        perms = self.desired(AchievementStateChoices.APP.value, STATUS.DONE, STATUS.DONE,
+                             process=self.process(STATUS.DONE, stage=2, owner=2), tasks=tasks)
+        self.assertEqual(perms, set())
+
+
+class ReconcileAchievementPermsTest(ProjectTestMixin, TestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.achievement = self.create_achievement()
+        self.assertEqual(self.submit(self.achievement, [{'id': u.pk} for u in self.sponsors]).status_code, 200)
+
+    def perms(self):
+        return {(p.user_id, p.permission.codename) for p in
+                AchievementUserObjectPermission.objects.filter(content_object=self.achievement)
+                if p.permission.codename != 'final_review_achievement'}
+
+    def test_reconcile(self):
+        expected = self.perms()
+        self.assertIn((self.sponsors[0].pk, APPROVE_PERMS[1]), expected)
+        AchievementUserObjectPermission.objects.filter(content_object=self.achievement).delete()
+        self.assertEqual(reconcile_achievement_perms(self.achievement), (len(expected), 0))
+        self.assertEqual(self.perms(), expected)
+        self.assertEqual(reconcile_achievement_perms(self.achievement), (0, 0))
+
+    def test_query_count(self):
+        """查询次数与项目成员数无关：最新 process、task、三个成员关系、现有权限、Permission、插入"""
+        def reconcile():
+            AchievementUserObjectPermission.objects.filter(content_object=self.achievement).delete()
+            achievement = Achievement.objects.select_related('project').get(pk=self.achievement.pk)
+            with self.assertNumQueries(8):
+                reconcile_achievement_perms(achievement)
+        reconcile()
+        self.project.project_members.add(*[self.make_user(f'member{i}', RoleChoices.PROJECT_WORKER.value)
+                                           for i in range(20)])
+        reconcile()
+        # 查看：作者、负责人、审批人、创建人和新成员；两个负责人的审批权限；提交人的撤销权限
+        self.assertEqual(len(self.perms()), 5 + 20 + 2 + 1)
+
+
+class VisibilityTest(ProjectTestMixin, TestCase):
+    """P1 为 mixin 的项目；P2 由普通用户 issuer 创建，没有成员，outsider 在其中创建了成果"""
+
+    def setUp(self):
+        super().setUp()
+        self.issuer = self.make_user('issuer', RoleChoices.PROJECT_WORKER.value)
+        self.outsider = self.make_user('outsider', RoleChoices.PROJECT_WORKER.value)
+        self.other = Project.objects.create(project_id='P2', project_title='other', project_type='0',
+                                            project_cate='0', project_issuer=self.issuer)
+        self.achievement = Achievement.objects.create(project=self.project, name='a1', creator=self.creator)
+        self.created = Achievement.objects.create(project=self.other, name='a2', creator=self.outsider)
+
+    def assertVisible(self, user, projects, achievements):
+        self.assertEqual(set(visible_projects(user)), set(projects), user)
+        self.assertEqual(set(visible_achievements(user)), set(achievements), user)
+
+    def test_project_roles(self):
+        for user in [self.creator, self.sponsors[0], self.leader]:
+            self.assertVisible(user, [self.project], [self.achievement])
+        self.assertVisible(self.issuer, [self.other], [self.created])
+        # 只能看到自己创建的成果，看不到所属项目
+        self.assertVisible(self.outsider, [], [self.created])
+
+    def test_view_all_roles(self):
+        superuser = self.make_user('root', RoleChoices.PROJECT_WORKER.value)
+        superuser.is_superuser = True
+        users = [self.make_user(role, role) for role in VIEW_ALL_ROLES] + [self.secretary, superuser]
+        for user in users:
+            self.assertVisible(user, [self.project, self.other], [self.achievement, self.created])
+
+    def test_anonymous(self):
+        self.assertVisible(AnonymousUser(), [], [])
+        client = self.client_for()
+        self.assertEqual(client.get(BASE + 'project/').data['results'], [])
+        self.assertEqual(client.get(BASE + 'achievement/').data['results'], [])
+
+    def test_list(self):
+        response = self.client_for(self.sponsors[0]).get(BASE + 'achievement/')
+        self.assertEqual([row['id'] for row in response.data['results']], [self.achievement.pk])
+        response = self.client_for(self.issuer).get(BASE + 'project/')
+        self.assertEqual([row['id'] for row in response.data['results']], [self.other.pk])
+
+    def test_issuer_object_perms(self):
+        # 列表可见与对象权限一致：创建人有项目及其成果的查看权限
+        reconcile_achievement_perms(self.created)
+        self.assertEqual(user_object_perms(self.issuer, [self.other]), {self.other.pk: ['view_project']})
+        self.assertIn('view_achievement', user_object_perms(self.issuer, [self.created])[self.created.pk])
+        # 更换创建人
+        self.other.project_issuer = self.outsider
+        self.other.save()
+        self.assertEqual(user_object_perms(self.issuer, [self.other]), {})
+        self.assertEqual(user_object_perms(self.issuer, [self.created]), {})
+        self.assertEqual(user_object_perms(self.outsider, [self.other]), {self.other.pk: ['view_project']})
+        self.assertVisible(self.issuer, [], [])
+
+
+class MembershipSyncTest(ProjectTestMixin, TestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.achievement = Achievement.objects.create(project=self.project, name='a1', creator=self.creator)
+        reconcile_achievement_perms(self.achievement)
+        self.user = self.make_user('user', RoleChoices.PROJECT_WORKER.value)
+
+    def assertViewer(self, user, expected=True):
+        perms = user_object_perms(user, [self.project]).get(self.project.pk, []) + \
+            user_object_perms(user, [self.achievement]).get(self.achievement.pk, [])
+        views = [codename for codename in perms if codename.startswith('view_')]
+        self.assertEqual(views, ['view_project', 'view_achievement'] if expected else [], user)
+
+    def test_project_side(self):
+        members = self.project.project_members
+        self.assertViewer(self.user, False)
+        members.add(self.user)
+        self.assertViewer(self.user)
+        members.remove(self.user)
+        self.assertViewer(self.user, False)
+        members.add(self.user)
+        members.clear()
+        self.assertViewer(self.user, False)
+        # 作者只是成员；负责人仍是负责人
+        self.assertViewer(self.creator, False)
+        self.assertViewer(self.sponsors[0])
+        members.set([self.user, self.creator])
+        self.assertViewer(self.user)
+        self.assertViewer(self.creator)
+        members.set([self.creator])
+        self.assertViewer(self.user, False)
+        self.assertViewer(self.creator)
+
+    def test_user_side(self):
+        projects = self.user.member
+        projects.add(self.project)
+        self.assertViewer(self.user)
+        projects.remove(self.project)
+        self.assertViewer(self.user, False)
+        projects.add(self.project)
+        projects.clear()
+        self.assertViewer(self.user, False)
+        projects.set([self.project])
+        self.assertViewer(self.user)
+        projects.set([])
+        self.assertViewer(self.user, False)
+        # 负责人、审批人一侧
+        self.user.project_sponsor.add(self.project)
+        self.assertViewer(self.user)
+        self.user.project_sponsor.clear()
+        self.assertViewer(self.user, False)
+        self.user.project_approver.set([self.project])
+        self.assertViewer(self.user)
+        self.user.project_approver.remove(self.project)
+        self.assertViewer(self.user, False)
+
+    def test_remaining_role(self):
+        sponsor = self.sponsors[0]
+        # 从成员中移除，仍是负责人
+        self.project.project_members.remove(sponsor)
+        self.assertViewer(sponsor)
+        self.project.project_sponsor.remove(sponsor)
+        self.assertViewer(sponsor, False)
+        # 审批人从成员一侧移除
+        self.leader.member.add(self.project)
+        self.leader.member.remove(self.project)
+        self.assertViewer(self.leader)
+        self.leader.project_approver.clear()
+        self.assertViewer(self.leader, False)
+        # 创建人
+        self.secretary.member.add(self.project)
+        self.secretary.member.clear()
+        self.assertEqual(user_object_perms(self.secretary, [self.project]), {self.project.pk: ['view_project']})
+
+
+class UserCounterTest(ProjectTestMixin, TestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.achievement = self.create_achievement()
+
+    def snapshot(self):
+        return {uid: (a, o) for uid, a, o in
+                UserCounter.objects.values_list('user_id', 'assigned_tasks', 'open_processes') if a or o}
+
+    def act(self, user, action, data=None):
+        response = self.client_for(user).put(BASE + f'achievement/{self.achievement.pk}/{action}/',
+                                             data or {'comments': ''}, format='json')
+        self.assertEqual(response.status_code, 200, response.data)
+        # 增量维护的计数与按 task / process 表重建的结果一致
+        live = self.snapshot()
+        counters.rebuild()
+        self.assertEqual(self.snapshot(), live, action)
+        return live
+
+    def test_flow_matches_rebuild(self):
+        sponsors = [{'id': u.pk} for u in self.sponsors]
+        live = self.act(self.creator, 'submit', {'level': 1, 'flow_type': 'OR', 'required_approver': sponsors})
+        self.assertEqual(live, {self.creator.pk: (0, 1), self.sponsors[0].pk: (1, 0), self.sponsors[1].pk: (1, 0)})
+        self.assertEqual(self.act(self.sponsors[1], 'deny'), {})
+        self.act(self.creator, 'withdraw')
+        self.act(self.creator, 'submit', {'level': 1, 'flow_type': 'OR', 'required_approver': sponsors})
+        self.assertEqual(self.act(self.sponsors[0], 'approve'), {})
+        live = self.act(self.sponsors[0], 'submit', {'level': 2, 'flow_type': 'OR',
+                                                     'required_approver': [{'id': self.leader.pk}]})
+        self.assertEqual(live, {self.sponsors[0].pk: (0, 1), self.leader.pk: (1, 0)})
+        self.act(self.sponsors[0], 'withdraw')
+        self.assertEqual(self.snapshot(), {})
+
+    def test_rebuild_repairs_drift(self):
+        self.submit(self.achievement, [{'id': self.sponsors[0].pk}])
+        expected = self.snapshot()
+        UserCounter.objects.update(assigned_tasks=5, open_processes=5)
+        out = StringIO()
+        call_command('rebuild_user_counters', stdout=out)
+        self.assertEqual(self.snapshot(), expected)
+        self.assertIn('rebuilt counters for', out.getvalue())
+
+
+class ListQueryCountTest(ProjectTestMixin, TestCase):
+    """列表接口的查询次数与每页行数无关"""
+
+    def setUp(self):
+        super().setUp()
+        for _ in range(4):
+            achievement = self.create_achievement()
+            FileManager.objects.create(achievement=achievement, name='report', file='report.pdf')
+            self.submit(achievement, [{'id': u.pk} for u in self.sponsors])
+
+    def assertQueries(self, num, url, page_sizes=(2, 4), **params):
+        client = self.client_for(self.secretary)
+        for page_size in page_sizes:
+            with self.assertNumQueries(num):
+                response = client.get(url, dict(params, page_size=page_size))
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(len(response.data['results']), page_size, url)
+
+    def test_achievement_list(self):
+        # 计数、成果（含项目、作者）、负责人、审批人、文件、文件标签
+        self.assertQueries(6, BASE + 'achievement/')
+
+    def test_process_list(self):
+        self.assertQueries(7, BASE + 'process/', cursor='')
+
+    def test_task_list(self):
+        self.assertQueries(4, BASE + 'task/', cursor='')
+
+
+class KeysetPaginationTest(ProjectTestMixin, TestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.client = self.client_for(self.secretary)
+        self.achievements = [Achievement.objects.create(project=self.project, name=f'a{i}', creator=self.creator)
+                             for i in range(5)]
+        # created 可为空（历史数据）
+        Achievement.objects.filter(pk__in=[a.pk for a in self.achievements[1:3]]).update(created=None)
+
+    def walk(self, url, **params):
+        """沿 next 翻到底，再沿 previous 翻回首页，返回两个方向的 id 序列"""
+        response = self.client.get(url, dict(params, cursor='', page_size=2))
+        pages = [[row['id'] for row in response.data['results']]]
+        while response.data['links']['next']:
+            response = self.client.get(response.data['links']['next'])
+            pages.append([row['id'] for row in response.data['results']])
+        backward = [pages[-1]]
+        while response.data['links']['previous']:
+            response = self.client.get(response.data['links']['previous'])
+            backward.append([row['id'] for row in response.data['results']])
+        return pages, backward
+
+    def test_forward_and_back(self):
+        pages, backward = self.walk(BASE + 'achievement/')
+        ids = sorted((a.pk for a in self.achievements), reverse=True)
+        self.assertEqual(pages, [ids[0:2], ids[2:4], ids[4:]])
+        self.assertEqual(backward, pages[::-1])
+
+    def test_ties_on_created(self):
+        # 创建时间相同的项目按 -id 排序，不重复、不遗漏
+        projects = [Project.objects.create(project_id=f'T{i}', project_title='t', project_type='0', project_cate='0',
+                                           project_issuer=self.secretary) for i in range(4)]
+        Project.objects.update(project_created=timezone.now())
+        pages, backward = self.walk(BASE + 'project/')
+        ids = sorted([p.pk for p in projects] + [self.project.pk], reverse=True)
+        self.assertEqual(sum(pages, []), ids)
+        self.assertEqual(backward, pages[::-1])
+
+    def test_count_limit(self):
+        self.assertEqual(KeysetPagination.count_limit, 1000)
+        response = self.client.get(BASE + 'achievement/', {'cursor': '', 'count': 1})
+        self.assertEqual((response.data['count'], response.data['count_is_approximate']), (5, False))
+        self.assertNotIn('count', self.client.get(BASE + 'achievement/', {'cursor': ''}).data)
+        with mock.patch.object(KeysetPagination, 'count_limit', 3):
+            response = self.client.get(BASE + 'achievement/', {'cursor': '', 'count': 'true'})
+        self.assertEqual((response.data['count'], response.data['count_is_approximate']), (3, True))
+
+
+class StubDisplayServer:
+    """本地展示平台替身：按顺序返回 responses 中的 (状态码, 响应体)，记录收到的请求体"""
+
+    def __init__(self, responses):
+        self.responses = list(responses)
+        self.requests = []
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_POST(self):
+                stub.requests.append(json.loads(self.rfile.read(int(self.headers['Content-Length']))))
+                code, body = stub.responses.pop(0)
+                data = json.dumps(body).encode('utf-8')
+                self.send_response(code)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def log_message(self, *args):
+                pass
+
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        self.url = f'http://127.0.0.1:{self.server.server_port}/inputData'
+
+    def __enter__(self):
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        return self
+
+    def __exit__(self, *exc):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+@override_settings(DISPLAY_RETRY_BACKOFF=30, DISPLAY_MAX_ATTEMPTS=3, DISPLAY_TIMEOUT=5)
+class DisplayOutboxTest(ProjectTestMixin, TestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.achievement = Achievement.objects.create(project=self.project, name='achievement', creator=self.creator)
+        self.file = FileManager.objects.create(achievement=self.achievement, name='report', file='report.pdf')
+        self.push, created = display.enqueue(self.achievement, 'http://ums.local')
+        self.assertTrue(created)
+
+    def deliver(self, responses, now=None):
+        with StubDisplayServer(responses) as stub, override_settings(DISPLAY_URL=stub.url):
+            if now is None:
+                result = display.deliver_pending(display.get_session())
+            else:
+                with mock.patch.object(display.timezone, 'now', return_value=now):
+                    result = display.deliver_pending(display.get_session())
+        self.push.refresh_from_db()
+        return result, stub.requests
+
+    def test_enqueue_returns_pending_push(self):
+        push, created = display.enqueue(self.achievement, 'http://ums.local')
+        self.assertFalse(created)
+        self.assertEqual(push.pk, self.push.pk)
+        self.assertEqual(self.push.payload['file_list'][0]['file_url'], 'http://ums.local/media/report.pdf')
+
+    def test_success(self):
+        body = {'file_list': [{'file_id': self.file.pk, 'file_link': 'http://display/report'}]}
+        result, requests = self.deliver([(200, body)])
+        self.assertEqual(result, (1, 0))
+        self.assertEqual(requests, [self.push.payload])
+        self.assertEqual(self.push.status, DisplayPushStatusChoices.SENT.value)
+        self.assertEqual(self.push.attempts, 1)
+        self.file.refresh_from_db()
+        self.achievement.refresh_from_db()
+        self.assertEqual(self.file.file_link, 'http://display/report')
+        self.assertTrue(self.achievement.is_reviewed)
+
+    def test_retry_backoff_then_fail(self):
+        result, _ = self.deliver([(500, {'msg': 'error'})])
+        self.assertEqual(result, (0, 1))
+        self.assertEqual(self.push.status, DisplayPushStatusChoices.PENDING.value)
+        self.assertIn('500', self.push.last_error)
+        first_retry = self.push.next_attempt
+        self.assertAlmostEqual((first_retry - timezone.now()).total_seconds(), 30, delta=5)
+
+        # 退避期内不重试
+        result, requests = self.deliver([])
+        self.assertEqual((result, requests), ((0, 0), []))
+
+        # 到期后重试，退避时间翻倍
+        result, _ = self.deliver([(503, {})], now=first_retry)
+        self.assertEqual(result, (0, 1))
+        self.assertEqual(self.push.attempts, 2)
+        self.assertEqual(self.push.next_attempt - first_retry, timedelta(seconds=60))
+
+        # 达到 DISPLAY_MAX_ATTEMPTS 后不再重试
+        result, _ = self.deliver([(500, {})], now=self.push.next_attempt)
+        self.assertEqual(result, (0, 1))
+        self.assertEqual(self.push.status, DisplayPushStatusChoices.FAILED.value)
+        self.assertEqual(self.push.attempts, 3)
+
+    def test_claim_lease_expiry(self):
+        now = timezone.now()
+        with mock.patch.object(display.timezone, 'now', return_value=now):
+            self.assertTrue(display.claim(self.push))
+            # 租约内其他 worker 领取不到
+            self.assertFalse(display.claim(self.push))
+        result, requests = self.deliver([], now=now + display.CLAIM_LEASE - timedelta(seconds=1))
+        self.assertEqual((result, requests), ((0, 0), []))
+        # worker 中途退出，租约过期后重新投递
+        result, requests = self.deliver([(200, {})], now=now + display.CLAIM_LEASE)
+        self.assertEqual(result, (1, 0))
+        self.assertEqual(len(requests), 1)
+        self.assertEqual(self.push.status, DisplayPushStatusChoices.SENT.value)
+
+    def test_command(self):
+        out = StringIO()
+        with StubDisplayServer([(200, {})]) as stub, override_settings(DISPLAY_URL=stub.url):
+            call_command('send_display_outbox', '--once', stdout=out)
+        self.push.refresh_from_db()
+        self.assertEqual(self.push.status, DisplayPushStatusChoices.SENT.value)
+        self.assertIn('sent: 1 failed: 0', out.getvalue())
+
+
+class ChunkedUploadTest(ProjectTestMixin, TestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.achievement = Achievement.objects.create(project=self.project, name='achievement', creator=self.creator)
+        tmp = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, tmp, ignore_errors=True)
+        settings_override = override_settings(MEDIA_ROOT=tmp, CHUNKED_UPLOAD_ROOT=os.path.join(tmp, 'chunks'))
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+
+    def initiate(self, client, content):
+        return client.post(BASE + 'file/uploads/', {
+            'achievement': self.achievement.pk, 'filename': 'report.pdf', 'name': 'report',
+            'total_size': len(content), 'chunk_size': 4, 'checksum': hashlib.sha256(content).hexdigest(),
+        }, format='json')
+
+    def test_upload(self):
+        content = b'0123456789'
+        client = self.client_for(self.creator)
+        response = self.initiate(client, content)
+        self.assertEqual(response.status_code, 201)
+        url = BASE + f"file/uploads/{response.data['id']}/"
+        for index in range(3):
+            response = client.put(f'{url}chunks/{index}/', content[index * 4:index * 4 + 4],
+                                  content_type='application/octet-stream')
+            self.assertEqual(response.status_code, 200)
+        response = client.post(f'{url}complete/')
+        self.assertEqual(response.status_code, 201)
+        with FileManager.objects.get(pk=response.data['id']).file.open('rb') as fh:
+            self.assertEqual(fh.read(), content)
+
+    def test_anonymous(self):
+        response = self.initiate(self.client_for(self.creator), b'0123')
+        url = BASE + f"file/uploads/{response.data['id']}/"
+        anonymous = self.client_for()
+        self.assertEqual(self.initiate(anonymous, b'0123').status_code, 401)
+        self.assertEqual(anonymous.get(url).status_code, 401)
+        self.assertEqual(anonymous.delete(url).status_code, 401)
+        self.assertEqual(anonymous.put(f'{url}chunks/0/', b'0123',
+                                       content_type='application/octet-stream').status_code, 401)
+        self.assertEqual(anonymous.post(f'{url}complete/').status_code, 401)
+
+    def test_other_user(self):
+        response = self.initiate(self.client_for(self.creator), b'0123')
+        url = BASE + f"file/uploads/{response.data['id']}/"
+        self.assertEqual(self.client_for(self.sponsors[0]).get(url).status_code, 404)
+
+    @override_settings(CHUNKED_UPLOAD_MAX_SIZE=8)
+    def test_max_size(self):
+        client = self.client_for(self.creator)
+        self.assertEqual(self.initiate(client, b'0123456789').status_code, 400)
+        self.assertEqual(self.initiate(client, b'01234567').status_code, 201)
+
+    def test_prune(self):
+        client = self.client_for(self.creator)
+        expired, fresh = (ChunkedUpload.objects.get(pk=self.initiate(client, b'01234567').data['id'])
+                          for _ in range(2))
+        for upload in (expired, fresh):
+            client.put(BASE + f'file/uploads/{upload.pk}/chunks/0/', b'0123', content_type='application/octet-stream')
+        ChunkedUpload.objects.filter(pk=expired.pk).update(created=timezone.now() - timedelta(days=3))
+        # 会话已删除、残留的分片目录
+        orphan = os.path.join(settings.CHUNKED_UPLOAD_ROOT, str(uuid.uuid4()))
+        os.makedirs(orphan)
+        old = (timezone.now() - timedelta(days=3)).timestamp()
+        os.utime(orphan, (old, old))
+        out = StringIO()
+        call_command('prune_chunked_uploads', '--days', '2', stdout=out)
+        self.assertIn('deleted 1 chunked uploads, 1 orphan chunk directories', out.getvalue())
+        self.assertEqual(list(ChunkedUpload.objects.values_list('pk', flat=True)), [fresh.pk])
+        self.assertFalse(os.path.exists(uploads.chunk_dir(expired)))
+        self.assertFalse(os.path.exists(orphan))
+        self.assertEqual(uploads.received_chunks(fresh), [0])
+
+
+class FileBlobTest(ProjectTestMixin, TestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.achievement = Achievement.objects.create(project=self.project, name='achievement', creator=self.creator)
+        tmp = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, tmp, ignore_errors=True)
+        settings_override = override_settings(MEDIA_ROOT=tmp)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+
+    def upload(self, filename, content=b'%PDF-1.4 report'):
+        return FileManager.objects.create(achievement=self.achievement, name=filename,
+                                          file=ContentFile(content, name=filename))
+
+    def test_blob_keeps_extension(self):
+        first = self.upload('report.pdf')
+        second = self.upload('copy.PDF')
+        self.assertEqual(first.blob_id, second.blob_id)
+        self.assertTrue(first.file.name.endswith('.pdf'))
+        self.assertTrue(first.file.url.endswith('.pdf'))
+        self.assertEqual(FileBlob.objects.get(pk=first.blob_id).ref_count, 2)
+        self.assertEqual(second.display_filename, 'copy.PDF')
+
+    def test_extension_is_part_of_key(self):
+        pdf = self.upload('report.pdf')
+        txt = self.upload('report.txt')
+        bare = self.upload('README')
+        self.assertEqual(len({pdf.blob_id, txt.blob_id, bare.blob_id}), 3)
+        self.assertTrue(txt.file.name.endswith('.txt'))
+        self.assertEqual(bare.file.name, f'blobs/{bare.blob.sha256[:2]}/{bare.blob.sha256[2:4]}/{bare.blob.sha256}')
+
+
+    def test_truncated_file_is_rewritten(self):
+        content = b'%PDF-1.4 report'
+        sha256 = hashlib.sha256(content).hexdigest()
+        storage = FileBlob._meta.get_field('file').storage
+        # 之前的写入中途退出，留下未登记的半截文件
+        name = f'blobs/{sha256[:2]}/{sha256[2:4]}/{sha256}.pdf'
+        storage.save(name, ContentFile(content[:4]))
+        instance = self.upload('report.pdf', content)
+        self.assertEqual(instance.file.name, name)
+        with instance.file.open('rb') as fh:
+            self.assertEqual(fh.read(), content)
+        self.assertEqual(os.listdir(os.path.dirname(storage.path(name))), [f'{sha256}.pdf'])
+
+    def test_release_then_acquire_keeps_file(self):
+        instance = self.upload('report.pdf')
+        blob = instance.blob
+        with self.captureOnCommitCallbacks() as callbacks:
+            instance.delete()
+        self.assertEqual(FileBlob.objects.get(pk=blob.pk).ref_count, 0)
+        # purge 执行前又上传了相同内容
+        again = self.upload('copy.pdf')
+        self.assertEqual(again.blob_id, blob.pk)
+        for callback in callbacks:
+            callback()
+        self.assertEqual(FileBlob.objects.get(pk=blob.pk).ref_count, 1)
+        with again.file.open('rb') as fh:
+            self.assertEqual(fh.read(), b'%PDF-1.4 report')
+
+    def test_purge(self):
+        instance = self.upload('report.pdf')
+        name = instance.file.name
+        storage = FileBlob._meta.get_field('file').storage
+        with self.captureOnCommitCallbacks(execute=True):
+            instance.delete()
+        self.assertFalse(FileBlob.objects.filter(pk=instance.blob_id).exists())
+        self.assertFalse(storage.exists(name))
+        # 删除后再次上传重新写入
+        again = self.upload('report.pdf')
+        self.assertEqual(again.file.name, name)
+        self.assertTrue(storage.exists(name))
+
+    def test_zero_ref_blob_without_file(self):
+        instance = self.upload('report.pdf')
+        FileBlob.objects.filter(pk=instance.blob_id).update(ref_count=0)
+        # purge 删除文件后未能提交
+        instance.file.storage.delete(instance.file.name)
+        again = self.upload('report.pdf')
+        self.assertEqual(again.blob_id, instance.blob_id)
+        with again.file.open('rb') as fh:
+            self.assertEqual(fh.read(), b'%PDF-1.4 report')
+
+
+class DownloadTest(ProjectTestMixin, TestCase):
+
+    def setUp(self):
+        super().setUp()
+        tmp = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, tmp, ignore_errors=True)
+        settings_override = override_settings(MEDIA_ROOT=tmp, FILE_DOWNLOAD_BACKEND='django')
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        self.achievement = self.create_achievement()
+        self.file = FileManager.objects.create(achievement=self.achievement, name='report',
+                                               file=ContentFile(b'0123456789', name='report.pdf'))
+        self.url = BASE + f'file/{self.file.pk}/download/'
+        self.etag = f'"{hashlib.sha256(b"0123456789").hexdigest()}"'
+
+    def get(self, user=None, **headers):
+        return self.client_for(user or self.creator).get(self.url, **headers)
+
+    def content(self, response):
+        return b''.join(response.streaming_content)
+
+    def test_permission(self):
+        self.assertEqual(self.client_for().get(self.url).status_code, 401)
+        outsider = self.make_user('outsider', RoleChoices.PROJECT_WORKER.value)
+        self.assertEqual(self.get(outsider).status_code, 403)
+        self.assertEqual(self.get(self.secretary).status_code, 200)
+
+    def test_full(self):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.get()
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.content(response), b'0123456789')
+        self.assertEqual(response['ETag'], self.etag)
+        self.assertEqual(response['Accept-Ranges'], 'bytes')
+        self.assertEqual(response['Content-Disposition'], 'attachment; filename="report.pdf"')
+        # blob 随 FileManager 一起查询
+        self.assertFalse([q for q in queries if 'FROM "project_fileblob"' in q['sql']])
+
+    def test_not_modified(self):
+        self.assertEqual(self.get(HTTP_IF_NONE_MATCH=self.etag).status_code, 304)
+        self.assertEqual(self.get(HTTP_IF_NONE_MATCH='"other"').status_code, 200)
+
+    def test_range(self):
+        response = self.get(HTTP_RANGE='bytes=2-5')
+        self.assertEqual(response.status_code, 206)
+        self.assertEqual(self.content(response), b'2345')
+        self.assertEqual(response['Content-Range'], 'bytes 2-5/10')
+        self.assertEqual(response['Content-Length'], '4')
+        response = self.get(HTTP_RANGE='bytes=-3')
+        self.assertEqual((response.status_code, self.content(response)), (206, b'789'))
+        response = self.get(HTTP_RANGE='bytes=7-')
+        self.assertEqual((response.status_code, self.content(response)), (206, b'789'))
+        # 多段 Range 忽略，返回整个文件
+        response = self.get(HTTP_RANGE='bytes=0-1,3-4')
+        self.assertEqual((response.status_code, self.content(response)), (200, b'0123456789'))
+
+    def test_unsatisfiable_range(self):
+        for header in ('bytes=10-', 'bytes=-0'):
+            response = self.get(HTTP_RANGE=header)
+            self.assertEqual(response.status_code, 416, header)
+            self.assertEqual(response['Content-Range'], 'bytes */10')
+
+    def test_if_range(self):
+        response = self.get(HTTP_RANGE='bytes=2-5', HTTP_IF_RANGE=self.etag)
+        self.assertEqual((response.status_code, self.content(response)), (206, b'2345'))
+        # 文件已变化，返回整个文件
+        response = self.get(HTTP_RANGE='bytes=2-5', HTTP_IF_RANGE='"stale"')
+        self.assertEqual((response.status_code, self.content(response)), (200, b'0123456789'))
+
+    def test_get_file_url(self):
+        response = self.client_for(self.creator).get(BASE + f'file/{self.file.pk}/get_file_url/')
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.data['file_url'].endswith(self.url))
+        self.assertEqual(response.data['file_url'], response.data['download_url'])
+        self.assertEqual(self.client_for().get(BASE + f'file/{self.file.pk}/get_file_url/').status_code, 401)
+
+
+class BulkPermissionsTest(ProjectTestMixin, TestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.achievement = self.create_achievement()
+        self.url = BASE + 'achievement/bulk-permissions/'
+
+    def post(self, ids):
+        return self.client_for(self.creator).post(self.url, {'ids': ids}, format='json')
+
+    def test_permissions(self):
+        response = self.post([self.achievement.pk, str(self.achievement.pk), 99999])
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data, [
+            {'id': self.achievement.pk, 'perms': ['change_achievement', 'delete_achievement',
+                                                  'submit_achievement', 'view_achievement']},
+            {'id': 99999, 'perms': []},
+        ])
+
+    def test_ids_must_be_list(self):
+        for ids in (str(self.achievement.pk), '123', 123, {'id': 1}, None):
+            self.assertEqual(self.post(ids).status_code, 400, ids)
+
+    def test_invalid_ids(self):
+        for ids in (['abc'], [None], [[1]], [{'id': 1}]):
+            self.assertEqual(self.post(ids).status_code, 400, ids)
+
+    def test_limit(self):
+        self.assertEqual(self.post(list(range(1, 502))).status_code, 400)
+        self.assertEqual(self.post(list(range(1, 501))).status_code, 200)
+
+    def test_anonymous(self):
+        self.assertEqual(self.client_for().post(self.url, {'ids': [1]}, format='json').status_code, 403)
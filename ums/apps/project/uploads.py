@@ -0,0 +1,128 @@
+"""
+FileManager 分片上传（可断点续传）。
+
+initiate 只登记会话；每个分片流式写入 CHUNKED_UPLOAD_ROOT/<upload_id>/<index>.part，
+写入时计算 sha256，校验通过后原子改名，磁盘上已有的分片即为已接收的分片；
+complete 时按序拼接并校验整个文件的 sha256，通过后才创建 FileManager。
+"""
+import hashlib
+import os
+import shutil
+import tempfile
+
+from django.conf import settings
+from django.core.files import File
+from django.db import transaction
+
+from .blobs import attach
+from .models import ChunkedUpload, FileManager
+from .utils import ChunkedUploadStatusChoices
+
+READ_SIZE = 64 * 1024
+
+
+class UploadError(Exception):
+    pass
+
+
+def chunk_dir(upload):
+    return os.path.join(settings.CHUNKED_UPLOAD_ROOT, str(upload.pk))
+
+
+def _chunk_path(upload, index):
+    return os.path.join(chunk_dir(upload), f'{index:06d}.part')
+
+
+def received_chunks(upload):
+    """已接收的分片序号"""
+    try:
+        names = os.listdir(chunk_dir(upload))
+    except FileNotFoundError:
+        return []
+    return sorted(int(name[:-5]) for name in names if name.endswith('.part'))
+
+
+def write_chunk(upload, index, stream, checksum=None):
+    """
+    把 stream 中的分片流式写入磁盘，不在内存中保留整个分片。
+    checksum 为该分片的 sha256（hex），提供时校验；同一分片重复上传会覆盖。
+    """
+    if upload.status != ChunkedUploadStatusChoices.UPLOADING.value:
+        raise UploadError('upload already completed')
+    if not 0 <= index < upload.total_chunks:
+        raise UploadError(f'chunk index must be between 0 and {upload.total_chunks - 1}')
+    expected = upload.expected_chunk_size(index)
+    directory = chunk_dir(upload)
+    os.makedirs(directory, exist_ok=True)
+    digest = hashlib.sha256()
+    size = 0
+    fd, tmp_path = tempfile.mkstemp(dir=directory, suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'wb') as fh:
+            while True:
+                data = stream.read(READ_SIZE) if stream is not None else b''
+                if not data:
+                    break
+                size += len(data)
+                if size > expected:
+                    raise UploadError(f'chunk {index} exceeds expected size {expected}')
+                digest.update(data)
+                fh.write(data)
+        if size != expected:
+            raise UploadError(f'chunk {index} size {size} does not match expected size {expected}')
+        if checksum and digest.hexdigest() != checksum.lower():
+            raise UploadError(f'chunk {index} checksum mismatch')
+        os.replace(tmp_path, _chunk_path(upload, index))
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+    return digest.hexdigest()
+
+
+def complete(upload):
+    """
+    拼接全部分片并校验大小、sha256，通过后创建 FileManager。
+    调用方需在事务中对 upload 加锁（select_for_update），重复调用返回已创建的文件。
+    """
+    if upload.status == ChunkedUploadStatusChoices.COMPLETE.value:
+        return upload.file
+    missing = sorted(set(range(upload.total_chunks)) - set(received_chunks(upload)))
+    if missing:
+        raise UploadError(f'missing chunks: {missing[:20]}')
+    directory = chunk_dir(upload)
+    digest = hashlib.sha256()
+    size = 0
+    with tempfile.TemporaryFile(dir=directory) as assembled:
+        for index in range(upload.total_chunks):
+            with open(_chunk_path(upload, index), 'rb') as part:
+                while True:
+                    data = part.read(READ_SIZE)
+                    if not data:
+                        break
+                    size += len(data)
+                    digest.update(data)
+                    assembled.write(data)
+        if size != upload.total_size:
+            raise UploadError(f'file size {size} does not match declared size {upload.total_size}')
+        if digest.hexdigest() != upload.checksum.lower():
+            raise UploadError('file checksum mismatch')
+        assembled.seek(0)
+        instance = FileManager(achievement=upload.achievement, name=upload.name, creator=upload.creator)
+        # 整个文件的 sha256 已校验，直接作为 blob 的键
+        attach(instance, File(assembled, name=upload.filename), sha256=upload.checksum.lower())
+    instance.save()
+    if upload.tags:
+        instance.tags.set(upload.tags)
+    upload.status = ChunkedUploadStatusChoices.COMPLETE.value
+    upload.file = instance
+    upload.save(update_fields=['status', 'file'])
+    # 提交后再删除分片，回滚时保留以便重试
+    transaction.on_commit(lambda: shutil.rmtree(directory, ignore_errors=True))
+    return instance
+
+
+def discard(upload):
+    """删除未完成的上传会话及其分片"""
+    shutil.rmtree(chunk_dir(upload), ignore_errors=True)
+    ChunkedUpload.objects.filter(pk=upload.pk).delete()
@@ -32,3 +32,14 @@ class AchievementStateChoices(models.TextChoices):
     APP = '3', _('审批通过')
     DENY = '4', _('审批驳回')
     WITHDRAW = '5', _('已撤销')
+
+
+class ChunkedUploadStatusChoices(models.TextChoices):
+    UPLOADING = 'UPLOADING', _('上传中')
+    COMPLETE = 'COMPLETE', _('已完成')
+
+
+class DisplayPushStatusChoices(models.TextChoices):
+    PENDING = 'PENDING', _('待发送')
+    SENT = 'SENT', _('已发送')
+    FAILED = 'FAILED', _('发送失败')  # 超过最大重试次数
@@ -1,16 +1,15 @@
 import logging
-import json
-import requests
 from django.contrib.auth import get_user_model
-from django.conf import settings
 from django.core.exceptions import PermissionDenied
-from django.contrib.contenttypes.models import ContentType
-from django.db.models import Q
-from guardian.shortcuts import assign_perm, get_users_with_perms, get_user_perms, remove_perm, get_perms
+from django.db import transaction
+from django.db.models import Q, Max, OuterRef, Subquery
+from guardian.shortcuts import get_users_with_perms, get_user_perms, get_perms
 from guardian.core import ObjectPermissionChecker
+from taggit.models import Tag
 from rest_framework import generics, filters
 from rest_framework.response import Response
-from rest_framework.pagination import PageNumberPagination
+from rest_framework.exceptions import ValidationError
+from rest_framework.pagination import PageNumberPagination, CursorPagination
 from rest_framework.decorators import api_view, permission_classes
 from rest_framework.decorators import action
 from rest_framework.reverse import reverse
@@ -18,13 +17,17 @@ from rest_framework.permissions import DjangoObjectPermissions, DjangoModelPermi
     DjangoModelPermissionsOrAnonReadOnly, IsAuthenticated
 from rest_framework import viewsets
 from rest_framework import status
-from .models import Project, Process, Task, FileManager, Achievement
+from .models import Project, Process, Task, FileManager, Achievement, ChunkedUpload
 from .serializers import ProjectSerializer, ProcessSerializer, TaskSerializer, FileManagerSerializer, \
-    AchievementSerializer
+    AchievementSerializer, ChunkedUploadSerializer
 from ..accounts.utils import RoleChoices
-from .utils import ProjectStatusChoices, AchievementStateChoices
+from .utils import ProjectStatusChoices, AchievementStateChoices, ChunkedUploadStatusChoices
 from .flow import AchievementProcessHandlerFirstStage, ActionHandler
+from .perms import bulk_assign_model_perms, bulk_assign_perms, reconcile_achievement_perms, user_object_perms, \
+    visible_achievements, visible_projects
+from ums.apps.core.identity import get_identity_map
 from .activation import STATUS
+from . import counters, display, downloads, inbox, uploads
 
 __all__ = (
     'ProjectViewSet',
@@ -35,6 +38,8 @@ __all__ = (
 
 )
 User = get_user_model()
+# 批量权限查询一次最多的成果数
+BULK_PERMISSIONS_LIMIT = 500
 
 
 class SmallResultsSetPagination(PageNumberPagination):
@@ -56,28 +61,89 @@ class SmallResultsSetPagination(PageNumberPagination):
         })
 
 
-class ProjectViewSet(viewsets.ModelViewSet):
+class OptionalResultsSetPagination(SmallResultsSetPagination):
+    """请求中带 page 或 page_size 时才分页，保持原有不分页接口的返回格式"""
+
+    def paginate_queryset(self, queryset, request, view=None):
+        if self.page_query_param not in request.query_params and \
+                self.page_size_query_param not in request.query_params:
+            return None
+        return super().paginate_queryset(queryset, request, view)
+
+
+class KeysetPagination(CursorPagination):
+    """
+    游标（keyset）分页，无 COUNT(*) 和 OFFSET 扫描，按视图的 cursor_ordering 排序。
+    游标只记录第一个排序字段的值，该字段须唯一（相同值时向前翻页会错位），因此各视图都按自增 id 排序。
+    count=1 时返回上限为 count_limit 的计数，超过上限时 count_is_approximate 为 True。
+    """
+    page_size = 10
+    page_size_query_param = 'page_size'
+    max_page_size = 100
+    count_query_param = 'count'
+    count_limit = 1000
+
+    def get_ordering(self, request, queryset, view):
+        return tuple(getattr(view, 'cursor_ordering', None) or ('-id',))
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.count = None
+        if request.query_params.get(self.count_query_param) in ('1', 'true'):
+            self.count = queryset.order_by()[:self.count_limit + 1].count()
+        return super().paginate_queryset(queryset, request, view)
+
+    def get_paginated_response(self, data):
+        ret = {
+            'links': {
+                'next': self.get_next_link(),
+                'previous': self.get_previous_link()
+            },
+        }
+        if self.count is not None:
+            ret['count'] = min(self.count, self.count_limit)
+            ret['count_is_approximate'] = self.count > self.count_limit
+        ret['results'] = data
+        return Response(ret)
+
+
+class KeysetPaginationMixin:
+    """
+    请求中带 cursor 参数时（首页传 cursor= 空值）使用游标分页，否则保持视图原有分页方式。
+    """
+    cursor_ordering = ('-id',)
+
+    @property
+    def paginator(self):
+        if not hasattr(self, '_paginator') and \
+                KeysetPagination.cursor_query_param in self.request.query_params:
+            self._paginator = KeysetPagination()
+        return super().paginator
+
+
+class ProjectViewSet(KeysetPaginationMixin, viewsets.ModelViewSet):
     queryset = Project.objects.all()
     serializer_class = ProjectSerializer
     pagination_class = SmallResultsSetPagination
     # 秘书、管理员可以创建、修改、删除，其他用户可以查看
     permission_classes = [DjangoModelPermissionsOrAnonReadOnly]
+    # project_created 为创建时间，可能相同；按自增 id 排序与创建顺序一致
+    cursor_ordering = ('-id',)
+
+    def get_queryset(self):
+        queryset = super().get_queryset()
+        if self.action == 'list':
+            # 列表只返回当前用户可见的项目
+            queryset = visible_projects(self.request.user, queryset)
+        return queryset
 
     def perform_create(self, serializer):
+        # 成员、负责人、审批人的查看权限由 m2m_changed 同步（signals.sync_project_membership）
         instance = serializer.save()
-        # add permissions to project members
-        # step1. members exists
-        members = instance.project_members
-        if members.count() > 0:
-            # assign view project permissions to all members
-            for user in members.all():
-                # assign view project permission to associated user
-                # todo: may change to all user
-                assign_perm('view_project', user, instance)
-                # assign add achievement permission to user
-                # todo: may change to all users
-                assign_perm('project.add_achievement', user)
-                assign_perm('project.add_filemanager', user)
+        members = list(instance.project_members.values_list('pk', flat=True))
+        if members:
+            # assign add achievement permission to members
+            # todo: may change to all users
+            bulk_assign_model_perms(['project.add_achievement', 'project.add_filemanager'], members)
         else:
             logging.error('Project-Creation: need select project Members')
 
@@ -94,10 +160,33 @@ class ProjectViewSet(viewsets.ModelViewSet):
         return Response(serializer.data)
 
 
-class AchievementViewSet(viewsets.ModelViewSet):
+class AchievementViewSet(KeysetPaginationMixin, viewsets.ModelViewSet):
     queryset = Achievement.objects.all()
     serializer_class = AchievementSerializer
     pagination_class = SmallResultsSetPagination
+    # created 可为空，按自增 id 排序与创建顺序一致
+    cursor_ordering = ('-id',)
+
+    def get_queryset(self):
+        queryset = super().get_queryset()
+        if self.action in ('list', 'get_achievements_by_projectid'):
+            # 列表只返回当前用户可见的成果
+            queryset = visible_achievements(self.request.user, queryset)
+            queryset = AchievementSerializer.setup_eager_loading(queryset)
+        return queryset
+
+    def _include_perms(self):
+        include = self.request.query_params.get('include', '')
+        return self.action in ('list', 'get_achievements_by_projectid') and 'perms' in include.split(',')
+
+    def get_serializer(self, *args, **kwargs):
+        # ?include=perms: 当前页的用户对象权限一次查询，附在每行的 perms 中
+        if kwargs.get('many') and args and self.request.user.is_authenticated and self._include_perms():
+            objs = list(args[0])
+            kwargs.setdefault('context', self.get_serializer_context())
+            kwargs['context']['user_perms'] = user_object_perms(self.request.user, objs)
+            args = (objs,) + args[1:]
+        return super().get_serializer(*args, **kwargs)
 
     @permission_classes([DjangoModelPermissionsOrAnonReadOnly])
     def create(self, request, *args, **kwargs):
@@ -116,9 +205,8 @@ class AchievementViewSet(viewsets.ModelViewSet):
     @permission_classes([DjangoObjectPermissions])
     def update(self, request, *args, **kwargs):
         partial = kwargs.pop('partial', False)
-        print(request.data)
-        print(partial, 'is partial')
         instance = self.get_object()
+        logging.debug(f'update achievement {instance.pk} (partial={partial}): {request.data}')
         serializer = self.get_serializer(instance, data=request.data, partial=partial)
         serializer.is_valid(raise_exception=True)
         self.perform_update(serializer)
@@ -137,32 +225,22 @@ class AchievementViewSet(viewsets.ModelViewSet):
             # step1. assign change_achievement, delete_achievement, view_achievement to achievement creator
             assert instance.creator == self.request.user
 
-            assign_perm('change_achievement', instance.creator, instance)
-            assign_perm('submit_achievement', instance.creator, instance)
-            assign_perm('delete_achievement', instance.creator, instance)
-            # todo: submit_achievement;
             # step2. all project members should have view achievement permission(maybe to all users)
-            project = instance.project  # Project object
-            members = project.project_members
-            for member in members.all():
-                assign_perm('view_achievement', member, instance)
+            reconcile_achievement_perms(instance)
 
             secretaries = User.objects.filter(
                 role__in=(RoleChoices.SECRETARY.value, RoleChoices.ADMIN.value, RoleChoices.DEV.value))
-            assert secretaries.count() > 0
-            for secretary in secretaries.all():
-                assign_perm('final_review_achievement', secretary, instance)
+            assert bulk_assign_perms(['final_review_achievement'], secretaries, instance) > 0
         except AssertionError:
             # only write to log system.
             logging.error(
                 f"""{instance.id} permission assignment not finish! May caused by no leader or sponsor provided by project instance.""")
 
     def check_process_exists(self, instance, lv):
-        content_type_object = ContentType.objects.get(app_label=instance._meta.app_label,
-                                                      model=instance._meta.model.__name__)
+        content_type_object = get_identity_map().content_type(instance)
         if Process.objects.filter(~Q(status__in=[STATUS.DONE, STATUS.ERROR, STATUS.CANCELED, STATUS.DENY]),  # 完成，错误，撤销
-                                  data__activation='approval', artifact_content_type=content_type_object,
-                                  artifact_object_id=instance.pk, data__stage=lv
+                                  activation='approval', artifact_content_type=content_type_object,
+                                  artifact_object_id=instance.pk, stage=lv
                                   ).exists():
             # 同时间只能有一个进行中的状态
             logging.critical('Process already exists!')
@@ -181,8 +259,9 @@ class AchievementViewSet(viewsets.ModelViewSet):
         instance = self.get_object()
         stage = request.data.get('level', 1)
         data = {'state': AchievementStateChoices.SUB.value}
-        print(request.data, kwargs, args)
-        if request.data.get('level', 1) == 1 and request.user not in instance.project.project_sponsor.all():
+        sponsor_ids = get_identity_map().related_ids(instance.project, 'project_sponsor')
+        logging.debug(f'submit achievement {instance.pk}: {request.data}')
+        if request.data.get('level', 1) == 1 and request.user.id not in sponsor_ids:
             # lv1 approval process
             if self.check_process_exists(instance, 1):
                 return Response({'msg': '流程已存在，请勿重复提交!'}, status=400)
@@ -192,7 +271,7 @@ class AchievementViewSet(viewsets.ModelViewSet):
             # lv2 approval process
             try:
                 if instance.status1 != STATUS.DONE:  # 必须通过一级审批
-                    assert request.user in instance.project.project_sponsor.all()
+                    assert request.user.id in sponsor_ids
                     # 如果是负责人自己提交
                     data['status1'] = STATUS.DONE
             except AssertionError:
@@ -211,48 +290,37 @@ class AchievementViewSet(viewsets.ModelViewSet):
             )
             logging.warning(f'user permissions are {get_user_perms(request.user, instance)}')
             raise PermissionDenied()
+        # 审批人 id 统一转为整数（请求中可能是字符串）
+        try:
+            approvers = [dict(item, id=int(item['id'])) for item in request.data.get('required_approver')]
+        except (TypeError, ValueError, KeyError):
+            return Response({'msg': '审批人无效。'}, status=status.HTTP_400_BAD_REQUEST)
         # when achievement creator is sponsor
         serializer = self.get_serializer(instance, data=data, partial=True)
         serializer.is_valid(raise_exception=True)
-        self.perform_submit(serializer, stage)
+        self.perform_submit(serializer, stage, approvers)
         return Response(serializer.data)
 
-    def perform_submit(self, serializer, stage):
+    def perform_submit(self, serializer, stage, approvers):
         user = self.request.user
-        instance = serializer.save()
-        perm = 'approve_achievement_lv1'
-        if stage == 2:
-            perm = 'approve_achievement_lv2'
-        # 提交后回收提交者的 提交、修改、删除权限。赋予相关用户审核权限, 并赋予提交者撤销权限
-        uid = self.request.data.get('required_approver')
-        try:
-            approver = User.objects.filter(pk__in=[u.get('id') for u in uid])
-            print(approver, instance.project.project_approver.all())
-            for a in approver:
-                print(a)
-                if stage == 1:
-                    assert a in instance.project.project_sponsor.all()
-
-                else:
-                    assert a in instance.project.project_approver.all()
-                    assert instance.status1 == STATUS.DONE
-                assign_perm(perm, a, instance)
-        except AssertionError:
-            raise Exception('Error')
-        except:
-            raise Exception('Error')
-
-        remove_perm('submit_achievement', user, instance)
-        remove_perm('delete_achievement', user, instance)
-        remove_perm('change_achievement', user, instance)
-        #
-        assign_perm('withdraw_achievement', user, instance)
-        data = self.request.data
-        data['user'] = user
-        AchievementProcessHandlerFirstStage.create_process(
-            instance=instance,
-            **data
-        )
+        identity_map = get_identity_map()
+        approver_ids = {item['id'] for item in approvers}
+        # 状态变更与 process 在同一事务中，审批人无效或建流程失败时成果不会停留在已提交状态
+        with transaction.atomic():
+            instance = serializer.save()
+            eligible = identity_map.related_ids(
+                instance.project, 'project_sponsor' if stage == 1 else 'project_approver')
+            if not approver_ids <= eligible or (stage != 1 and instance.status1 != STATUS.DONE):
+                raise ValidationError({'msg': '审批人无效。'})
+            data = dict(self.request.data, required_approver=approvers, user=user)
+            # 负责人直接提交时 stage 为 2，process 与审批人权限保持一致
+            data['level'] = stage
+            AchievementProcessHandlerFirstStage.create_process(
+                instance=instance,
+                **data
+            )
+            # 提交后回收提交者的 提交、修改、删除权限，审批人权限由新建的 process 推导
+            reconcile_achievement_perms(instance)
         logging.warning(f'after user permissions are {get_user_perms(self.request.user, instance)}')
 
     @action(detail=True, methods=['put'])
@@ -267,24 +335,13 @@ class AchievementViewSet(viewsets.ModelViewSet):
         instance = self.get_object()
         user = request.user
         checker = ObjectPermissionChecker(user)
-        print(request.data)
+        logging.debug(f'withdraw achievement {instance.pk}: {request.data}')
         if checker.has_perm('withdraw_achievement', instance):
             # 用户有撤销权限
             # step 1: add task withdraw
             # step 2: process => cancel
             withdraw_handler = ActionHandler(instance)
             withdraw_handler.withdraw(comments=request.data.get('comments', ''))
-            remove_perm('withdraw_achievement', user, instance)
-            assign_perm('submit_achievement', user, instance)
-            assign_perm('change_achievement', user, instance)
-            assign_perm('delete_achievement', user, instance)
-            # remove approval permissions from sponsor and leaders
-            for a in instance.project.project_sponsor.all():
-                if 'approve_achievement_lv1' in get_perms(a, instance):
-                    remove_perm('approve_achievement_lv1', a, instance)
-            for a in instance.project.project_approver.all():
-                if 'approve_achievement_lv2' in get_perms(a, instance):
-                    remove_perm('approve_achievement_lv2', a, instance)
         else:
             raise PermissionDenied()
         # 更新为 撤销、new、new
@@ -292,6 +349,8 @@ class AchievementViewSet(viewsets.ModelViewSet):
         serializer = self.get_serializer(instance, data=data, partial=True)
         serializer.is_valid(raise_exception=True)
         self.perform_update(serializer)
+        # 撤销人恢复修改、提交、删除权限，回收审批人权限
+        reconcile_achievement_perms(instance)
 
         if getattr(instance, '_prefetched_objects_cache', None):
             # If 'prefetch_related' has been applied to a queryset, we need to
@@ -339,53 +398,12 @@ class AchievementViewSet(viewsets.ModelViewSet):
             return Response(
                 {'msg': 'already done'}, status=405
             )
-        # create API
-        result = {
-            "result_id": instance.id,
-            "contract_number": instance.name,
-            "pro_id": instance.project.id,
-            "pro_name": instance.project.project_title,
-            "pro_type": instance.project.get_project_type_display(),
-            "pro_cls": instance.project.get_project_cate_display(),
-            "file_list": [
-                {
-                    "file_id": file.id,
-                    "file_name": file.name,
-                    "file_url": f"{request.scheme}://{request.get_host()}{file.file.url}",
-                    "file_tags": [i.name for i in file.tags.all()]
-                } for file in
-                instance.files.all()
-            ]
-        }
-        # send to
-        print(result)
-        logging.warning(result)
-        headers = {'Content-type': 'application/json'}
-
-        # return Response(result, status=200)
-        res = requests.post(settings.DISPLAY_URL, data=json.dumps(result),headers=headers)
-        if 200 <= res.status_code <= 299:
-            instance.is_reviewed = True
-            instance.save()
-            print(res.json())
-            # todo: 更新文件地址
-            data = res.json()
-
-            for file in data.get('file_list'):
-                try:
-                    file_obj = FileManager.objects.get(pk=file.get('file_id'))
-                    file_obj.file_link = file.get('file_link')
-                    file_obj.save()
-                except FileManager.DoesNotExist:
-                    logging.error(f"file {file} does not exist")
-                    continue
-            return Response({
-                'msg': '上传展示平台成功'
-            }, status=200)
-        else:
-            return Response(
-                {'msg', '展示平台报错'}, status=res.status_code
-            )
+        # 写入发送队列，由 send_display_outbox 命令异步推送并回写文件展示链接
+        push, created = display.enqueue(instance, f"{request.scheme}://{request.get_host()}")
+        return Response({
+            'msg': '已加入展示平台发送队列' if created else '已在展示平台发送队列中',
+            'push_id': push.id,
+        }, status=status.HTTP_202_ACCEPTED)
 
     @action(detail=True, methods=['put'])
     @permission_classes([IsAuthenticated])
@@ -395,9 +413,7 @@ class AchievementViewSet(viewsets.ModelViewSet):
         instance = self.get_object()
         user = request.user
         checker = ObjectPermissionChecker(user)
-        print("approve task")
-        print(request.data)
-        print(request.data.get('comments', ''))
+        logging.debug(f'approve achievement {instance.pk} by {user.pk}: {request.data}')
         if checker.has_perm('approve_achievement_lv1', instance) or checker.has_perm('approve_achievement_lv2',
                                                                                      instance):
             # 如果有1级或者2级权限
@@ -408,7 +424,7 @@ class AchievementViewSet(viewsets.ModelViewSet):
             process = approval_handler.approve(request.data.get('comments', ''), user)
             # 通过后=>如果是1级审批=>
         else:
-            print('no permission')
+            logging.warning(f'{user.name} has no approve permission on achievement {instance.pk}')
             raise PermissionDenied()
         serializer = self.get_serializer(instance)
         return Response(serializer.data)
@@ -428,7 +444,7 @@ class AchievementViewSet(viewsets.ModelViewSet):
             deny_handler = ActionHandler(instance)
             process = deny_handler.deny(request.data.get('comments', ''), user)
         else:
-            print('no permission')
+            logging.warning(f'{user.name} has no approve permission on achievement {instance.pk}')
             raise PermissionDenied()
         logging.warning(get_perms(user, instance))
         serializer = self.get_serializer(instance)
@@ -447,6 +463,28 @@ class AchievementViewSet(viewsets.ModelViewSet):
         serializer = self.get_serializer(queryset, many=True)
         return Response(serializer.data)
 
+    @action(detail=False, methods=['post'], url_path='bulk-permissions')
+    @permission_classes([IsAuthenticated])
+    def get_bulk_user_permissions(self, request, *args, **kwargs):
+        """
+        批量查询当前用户在多个成果上的对象权限，ids 最多 BULK_PERMISSIONS_LIMIT 个，一条查询完成。
+        返回 [{'id': id, 'perms': [...]}]，顺序与 ids 一致
+        """
+        if not request.user.is_authenticated:
+            raise PermissionDenied()
+        ids = request.data.get('ids')
+        # 字符串也可迭代，"123" 会被拆成 1、2、3，必须是列表
+        if not isinstance(ids, list):
+            return Response({'msg': 'ids 须为成果 id 列表。'}, status=status.HTTP_400_BAD_REQUEST)
+        try:
+            ids = list(dict.fromkeys(int(i) for i in ids))
+        except (TypeError, ValueError):
+            return Response({'msg': 'ids 须为成果 id 列表。'}, status=status.HTTP_400_BAD_REQUEST)
+        if len(ids) > BULK_PERMISSIONS_LIMIT:
+            return Response({'msg': f'ids 不能超过 {BULK_PERMISSIONS_LIMIT} 个。'}, status=status.HTTP_400_BAD_REQUEST)
+        perms = user_object_perms(request.user, ids, model=Achievement)
+        return Response([{'id': pk, 'perms': perms.get(pk, [])} for pk in ids])
+
     @action(detail=True)
     def get_request_user_permissions(self, request, *args, **kwargs):
         user = request.user
@@ -462,13 +500,21 @@ class AchievementViewSet(viewsets.ModelViewSet):
         return Response(permissions)
 
 
-class FileManagerViewSet(viewsets.ModelViewSet):
+class FileManagerViewSet(KeysetPaginationMixin, viewsets.ModelViewSet):
     queryset = FileManager.objects.all()
     serializer_class = FileManagerSerializer
     pagination_class = SmallResultsSetPagination
+    cursor_ordering = ('-id',)
+
+    def get_queryset(self):
+        queryset = super().get_queryset()
+        if self.action == 'download':
+            # ETag 取自 blob，权限检查用到 achievement
+            queryset = queryset.select_related('blob', 'achievement')
+        return queryset
 
     def create(self, request, *args, **kwargs):
-        print(request.user)
+        logging.debug(f'create file by {request.user}: {request.data}')
         serializer = self.get_serializer(data=request.data)
         serializer.is_valid(raise_exception=True)
         self.perform_create(serializer)
@@ -484,16 +530,7 @@ class FileManagerViewSet(viewsets.ModelViewSet):
         :return:
         """
         if self.request.user.is_authenticated:
-            # check if user id in project team
-            achievement = serializer.validated_data.get('achievement')
-
-            if self.request.user in achievement.project.project_members.all():
-                logging.info("Current user in project team!")
-            elif self.request.user.role == RoleChoices.ADMIN.value or self.request.user.role == RoleChoices.DEV.value:
-                logging.info("Admin user or Developer creating file!")
-            else:
-                logging.warning("request user is not in project members!")
-                raise PermissionDenied()
+            self._check_upload_permission(serializer.validated_data.get('achievement'))
             instance = serializer.save()
             logging.warning(
                 f"""Bind file {instance.id} to {self.request.user.name}, user role is {self.request.user.get_role_display()}""")
@@ -504,24 +541,102 @@ class FileManagerViewSet(viewsets.ModelViewSet):
         else:
             raise PermissionDenied()
 
+    def _check_upload_permission(self, achievement):
+        if not self.request.user.is_authenticated:
+            raise PermissionDenied()
+        # check if user id in project team
+        if self.request.user.id in get_identity_map().related_ids(achievement.project, 'project_members'):
+            logging.info("Current user in project team!")
+        elif self.request.user.role == RoleChoices.ADMIN.value or self.request.user.role == RoleChoices.DEV.value:
+            logging.info("Admin user or Developer creating file!")
+        else:
+            logging.warning("request user is not in project members!")
+            raise PermissionDenied()
+
+    def _get_upload(self, upload_id):
+        # 仅上传人可以继续上传
+        if not self.request.user.is_authenticated:
+            return None
+        try:
+            return ChunkedUpload.objects.select_related('achievement').get(pk=upload_id, creator=self.request.user)
+        except (ChunkedUpload.DoesNotExist, ValueError):
+            return None
+
+    def _upload_status(self, upload):
+        data = ChunkedUploadSerializer(upload).data
+        data['received_chunks'] = uploads.received_chunks(upload)
+        return data
+
+    @action(detail=False, methods=['post'], url_path='uploads',
+            permission_classes=[IsAuthenticated])
+    def initiate_upload(self, request):
+        """
+        分片上传第一步，登记文件信息：achievement, filename, name, tags, total_size, chunk_size, checksum(sha256)
+        """
+        serializer = ChunkedUploadSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        self._check_upload_permission(serializer.validated_data['achievement'])
+        upload = serializer.save(creator=request.user)
+        return Response(self._upload_status(upload), status=status.HTTP_201_CREATED)
+
+    @action(detail=False, methods=['get', 'delete'], url_path=r'uploads/(?P<upload_id>[0-9a-f-]+)',
+            permission_classes=[IsAuthenticated])
+    def upload_status(self, request, upload_id=None):
+        """查询已接收的分片，用于断点续传；DELETE 放弃上传"""
+        upload = self._get_upload(upload_id)
+        if upload is None:
+            return Response({'msg': '上传不存在。'}, status=status.HTTP_404_NOT_FOUND)
+        if request.method == 'DELETE':
+            if upload.status == ChunkedUploadStatusChoices.COMPLETE.value:
+                return Response({'msg': '上传已完成。'}, status=status.HTTP_409_CONFLICT)
+            uploads.discard(upload)
+            return Response(status=status.HTTP_204_NO_CONTENT)
+        return Response(self._upload_status(upload))
+
+    @action(detail=False, methods=['put'], url_path=r'uploads/(?P<upload_id>[0-9a-f-]+)/chunks/(?P<index>\d+)',
+            permission_classes=[IsAuthenticated])
+    def upload_chunk(self, request, upload_id=None, index=None):
+        """
+        请求体为分片原始字节（application/octet-stream），X-Chunk-Checksum 为分片 sha256，可选
+        """
+        upload = self._get_upload(upload_id)
+        if upload is None:
+            return Response({'msg': '上传不存在。'}, status=status.HTTP_404_NOT_FOUND)
+        try:
+            checksum = uploads.write_chunk(
+                upload, int(index), request.stream, request.headers.get('X-Chunk-Checksum')
+            )
+        except uploads.UploadError as e:
+            return Response({'msg': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        return Response({'index': int(index), 'checksum': checksum})
+
+    @action(detail=False, methods=['post'], url_path=r'uploads/(?P<upload_id>[0-9a-f-]+)/complete',
+            permission_classes=[IsAuthenticated])
+    def complete_upload(self, request, upload_id=None):
+        """全部分片到齐后拼接、校验，创建 FileManager"""
+        if self._get_upload(upload_id) is None:
+            return Response({'msg': '上传不存在。'}, status=status.HTTP_404_NOT_FOUND)
+        try:
+            with transaction.atomic():
+                upload = ChunkedUpload.objects.select_for_update().select_related('achievement').get(pk=upload_id)
+                instance = uploads.complete(upload)
+        except uploads.UploadError as e:
+            return Response({'msg': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        logging.warning(
+            f"""Bind file {instance.id} to {request.user.name}, user role is {request.user.get_role_display()}""")
+        return Response(FileManagerSerializer(instance).data, status=status.HTTP_201_CREATED)
+
     @action(detail=False)
     def get_latest_tags(self, request):
-        # return latest 10 tags
-        tag_set = set()
-        for obj in self.queryset.order_by('-created'):
-            if len(tag_set) >= 10:
-                break
-            else:
-                if obj.tags.count() > 0:
-                    for n in obj.tags.names():
-                        tag_set.add(n)
-        res = []
-        if tag_set:
-            for i in tag_set:
-                res.append(
-                    {'label': i, 'value': i}
-                )
-        return Response(res)
+        # return latest 10 tags，按标签最近一次被文件使用的时间排序，单条聚合查询
+        try:
+            limit = min(int(request.query_params.get('limit', 10)), 50)
+        except ValueError:
+            return Response({'msg': '请求错误。'}, status=status.HTTP_400_BAD_REQUEST)
+        tags = Tag.objects.annotate(
+            last_used=Max('project_taggedfile_items__content_object__created')
+        ).filter(last_used__isnull=False).order_by('-last_used').values_list('name', flat=True)[:limit]
+        return Response([{'label': name, 'value': name} for name in tags])
 
     @action(detail=False)
     def get_files_by_achievement_id(self, request):
@@ -538,8 +653,7 @@ class FileManagerViewSet(viewsets.ModelViewSet):
         serializer = self.get_serializer(queryset, many=True)
         return Response(serializer.data)
 
-    @action(detail=True)
-    @permission_classes([IsAuthenticated])
+    @action(detail=True, permission_classes=[IsAuthenticated])
     def get_file_url(self, request, *args, **kwargs):
         instance = self.get_object()
         # user should have change_achievement or approve_achievement permissions
@@ -548,12 +662,24 @@ class FileManagerViewSet(viewsets.ModelViewSet):
         checker = ObjectPermissionChecker(user)
         if not self._download_permission_check(user, checker, achievement):
             raise PermissionDenied()
-        serializer = self.get_serializer(instance)
-        print(serializer.data)
+        # 返回鉴权下载地址，不再暴露 media 下的公开路径
+        download_url = reverse('file-download', args=[instance.pk], request=request)
         return Response(
-            {'id': instance.pk, 'file_url': instance.file.url}, status=200
+            {'id': instance.pk, 'file_url': download_url, 'download_url': download_url}, status=200
         )
 
+    @action(detail=True, permission_classes=[IsAuthenticated])
+    def download(self, request, *args, **kwargs):
+        """鉴权后下载文件，支持 Range 和 ETag 条件请求"""
+        instance = self.get_object()
+        user = request.user
+        checker = ObjectPermissionChecker(user)
+        if not self._download_permission_check(user, checker, instance.achievement):
+            raise PermissionDenied()
+        if not instance.file:
+            return Response({'msg': '文件不存在。'}, status=status.HTTP_404_NOT_FOUND)
+        return downloads.serve_file(request, instance)
+
     def _download_permission_check(self, user, checker, achievement):
         if checker.has_perm('approve_achievement_lv1', achievement) or checker.has_perm('change_achievement',
                                                                                         achievement) or checker.has_perm(
@@ -568,18 +694,26 @@ class FileManagerViewSet(viewsets.ModelViewSet):
         return False
 
 
-class ProcessViewSet(viewsets.ModelViewSet):
+class ProcessViewSet(KeysetPaginationMixin, viewsets.ModelViewSet):
     queryset = Process.objects.all()
     serializer_class = ProcessSerializer
+    # 与项目相同，按自增 id 代替创建时间
+    cursor_ordering = ('-id',)
+
+    def get_queryset(self):
+        queryset = super().get_queryset()
+        if self.action == 'list':
+            queryset = ProcessSerializer.setup_eager_loading(queryset)
+        return queryset
 
     @action(detail=False, url_path='get-process-by-achievement', methods=['post'])
     def get_process_by_achievement(self, request, *args, **kwargs):
-        content_type_object = ContentType.objects.get(app_label=Achievement._meta.app_label,
-                                                      model=Achievement._meta.model_name)
+        content_type_object = get_identity_map().content_type(Achievement)
         achievement_id = request.data.get('achievement_id', 0)
-        print(achievement_id)
-        queryset = Process.objects.filter(artifact_content_type=content_type_object, artifact_object_id=achievement_id)
-        print(queryset)
+        logging.debug(f'processes of achievement {achievement_id}')
+        queryset = ProcessSerializer.setup_eager_loading(
+            Process.objects.filter(artifact_content_type=content_type_object, artifact_object_id=achievement_id)
+        )
         page = self.paginate_queryset(queryset)
         if page is not None:
             serializer = self.get_serializer(page, many=True)
@@ -587,62 +721,62 @@ class ProcessViewSet(viewsets.ModelViewSet):
         serializer = self.get_serializer(queryset, many=True)
         return Response(serializer.data)
 
-    @action(detail=False, url_path='get-issued-jobs')
+    @action(detail=False, url_path='get-issued-jobs', pagination_class=OptionalResultsSetPagination)
     @permission_classes([IsAuthenticated])
     def get_issued_processes(self, request, *args, **kwargs):
+        """
+        用户提交的每个成果只返回最新的一个 process，单条 SQL 完成（相关子查询），
+        传入 page/page_size 时在 SQL 中分页。
+        """
         user = request.user
-        queryset = Process.objects.filter(
+        issued = Process.objects.filter(
             # ~Q(status__in=[STATUS.DONE, STATUS.ERROR, STATUS.CANCELED, STATUS.DENY]),  # 执行中的任务
-            data__owner__id=user.id,
+            owner=user,
             created__isnull=False
         )
-        zip = []
-        if queryset:
-            achievement_ids = set([i.artifact.id for i in queryset])
-            print(achievement_ids)
-
-            for i in achievement_ids:
-                q = Process.objects.filter(
-                    # ~Q(status__in=[STATUS.DONE, STATUS.ERROR, STATUS.CANCELED, STATUS.DENY]),  # 执行中的任务
-                    data__owner__id=user.id,
-                    created__isnull=False,
-                    artifact_object_id=i,
-                ).latest('created')
-                zip.append(q)
-
-        page = self.paginate_queryset(zip)
+        latest = issued.filter(
+            artifact_content_type=OuterRef('artifact_content_type'),
+            artifact_object_id=OuterRef('artifact_object_id'),
+        ).order_by('-created', '-id').values('id')[:1]
+        queryset = ProcessSerializer.setup_eager_loading(
+            issued.filter(id=Subquery(latest)).order_by('-created', '-id')
+        )
+
+        page = self.paginate_queryset(queryset)
         if page is not None:
             serializer = self.get_serializer(page, many=True)
             return self.get_paginated_response(serializer.data)
 
-        serializer = self.get_serializer(zip, many=True)
+        serializer = self.get_serializer(queryset, many=True)
         return Response(serializer.data)
 
     @action(detail=False, url_path='get-issued-jobs-count')
     @permission_classes([IsAuthenticated])
     def get_issued_processes_count(self, request, *args, **kwargs):
-        user = request.user
-        queryset = Process.objects.filter(
-            ~Q(status__in=[STATUS.DONE, STATUS.ERROR, STATUS.CANCELED, STATUS.DENY]),  # 执行中的任务
-            data__owner__id=user.id
-        )
+        # 读取 UserCounter，由 flow 维护
+        return Response({'count': counters.get_counter(request.user)['open_processes']}, status=200)
 
-        return Response({'count': queryset.count()}, status=200)
 
-
-class TaskViewSet(viewsets.ModelViewSet):
+class TaskViewSet(KeysetPaginationMixin, viewsets.ModelViewSet):
     queryset = Task.objects.all()
     serializer_class = TaskSerializer
+    cursor_ordering = ('id',)
+
+    def get_queryset(self):
+        queryset = super().get_queryset()
+        if self.action == 'list':
+            queryset = TaskSerializer.setup_eager_loading(queryset)
+        return queryset
 
     #
     @action(detail=False, url_path='get-user-tasks')
     @permission_classes([IsAuthenticated])
     def get_user_tasks(self, request, *args, **kwargs):
         user = request.user
-        queryset = Task.objects.filter(
+        queryset = TaskSerializer.setup_eager_loading(Task.objects.filter(
             status=STATUS.ASSIGNED,
             owner=user.id,
-        )
+        ))
         page = self.paginate_queryset(queryset)
         if page is not None:
             serializer = self.get_serializer(page, many=True)
@@ -657,14 +791,14 @@ class TaskViewSet(viewsets.ModelViewSet):
         user = request.user
         processes = Process.objects.filter(
             ~Q(status__in=[STATUS.DONE, STATUS.ERROR, STATUS.CANCELED, STATUS.DENY]),  # 执行中的任务
-            data__owner__id=user.id
+            owner=user
         )
 
-        queryset = Task.objects.filter(
+        queryset = TaskSerializer.setup_eager_loading(Task.objects.filter(
             process__in=processes,
-            data__is_first=1,
+            is_first=True,
             owner=user
-        )
+        ))
         page = self.paginate_queryset(queryset)
         if page is not None:
             serializer = self.get_serializer(page, many=True)
@@ -676,9 +810,33 @@ class TaskViewSet(viewsets.ModelViewSet):
     @action(detail=False, url_path='user-has-missions')
     @permission_classes([IsAuthenticated])
     def user_has_missions(self, request, *args, **kwargs):
+        count = counters.get_counter(request.user)['assigned_tasks']
+        return Response({'exists': count > 0, 'count': count}, status=200)
+
+    @action(detail=False, url_path='inbox')
+    @permission_classes([IsAuthenticated])
+    def get_inbox_events(self, request, *args, **kwargs):
+        """
+        SSE（INBOX_STREAM_PATH）不可用时的轮询：立即返回 after 之后的待办事件，不在 WSGI worker 中等待；
+        不传 after 时只返回当前 last_event_id。实时推送请使用 SSE。
+        返回中包含 INBOX_EVENT_GRACE 秒内晚提交的、id 不大于 after 的事件，客户端按 id 去重
+        """
+        if not request.user.is_authenticated:
+            raise PermissionDenied()
         user = request.user
-        exists = Task.objects.filter(
-            status=STATUS.ASSIGNED,
-            owner=user.id,
-        )
-        return Response({'exists': exists.exists() == 1, 'count': exists.count()}, status=200)
+        try:
+            after = request.query_params.get('after')
+            after = int(after) if after is not None else None
+        except ValueError:
+            return Response({'msg': '请求错误。'}, status=status.HTTP_400_BAD_REQUEST)
+        events = []
+        if after is None:
+            last_id = inbox.latest_event_id(user.id)
+        else:
+            events = inbox.events_after(user.id, after)
+            last_id = max([after] + [event['id'] for event in events])
+        return Response({
+            'events': events,
+            'last_event_id': last_id,
+            'counter': counters.get_counter(user),
+        })
@@ -13,4 +13,15 @@ from django.core.asgi import get_asgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'ums.settings')
 
-application = get_asgi_application()
+django_application = get_asgi_application()
+
+# 需在 django 初始化之后导入
+from django.conf import settings  # noqa: E402
+from ums.apps.project.sse import inbox_stream  # noqa: E402
+
+
+async def application(scope, receive, send):
+    # 待办 SSE 长连接不经过 django 视图，避免占用线程池
+    if scope['type'] == 'http' and scope['path'] == settings.INBOX_STREAM_PATH:
+        return await inbox_stream(scope, receive, send)
+    return await django_application(scope, receive, send)
@@ -22,6 +22,7 @@ INSTALLED_APPS = [
     'django.contrib.messages',
     'django.contrib.staticfiles',
     'rest_framework',
+    'django_filters',
     "corsheaders",
     'rest_framework_swagger',
     'guardian',
@@ -42,6 +43,7 @@ MIDDLEWARE = [
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
+    'ums.apps.core.middleware.IdentityMapMiddleware',
 
 ]
 
@@ -109,7 +111,7 @@ AUTH_PASSWORD_VALIDATORS = [
 
 REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': [
-        'rest_framework_simplejwt.authentication.JWTAuthentication',
+        'ums.apps.accounts.authentication.CachedJWTAuthentication',
         # 'rest_framework_simplejwt.authentication.JWTStatelessUserAuthentication',
     ],
 }
@@ -177,5 +179,40 @@ DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 AUTH_USER_MODEL = "accounts.OCTUser"
 MEDIA_URL = '/media/'
 MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
-
-DISPLAY_URL='http://172.25.118.154:8081/PM_system/resultAction/inputData'
\ No newline at end of file
+# 分片上传的临时目录，不要放在 MEDIA_ROOT 下
+CHUNKED_UPLOAD_ROOT = os.path.join(BASE_DIR, 'chunked_uploads')
+CHUNKED_UPLOAD_MAX_CHUNK_SIZE = 16 * 1024 * 1024
+# 单个文件的最大字节数；未完成的上传由 prune_chunked_uploads 命令按天数清理
+CHUNKED_UPLOAD_MAX_SIZE = 2 * 1024 * 1024 * 1024
+# 文件下载：django 由 Django 传输；nginx 使用 X-Accel-Redirect；sendfile 使用 X-Sendfile（apache/lighttpd）
+FILE_DOWNLOAD_BACKEND = 'django'
+FILE_DOWNLOAD_ACCEL_PREFIX = '/protected/'
+# 待办 SSE 推送（ums/asgi.py），其他进程产生的事件按此间隔（秒）轮询。
+# 每个 SSE 连接每个间隔查询一次数据库；CONN_MAX_AGE=0 时每次查询都新建连接，
+# 即 连接数 / INBOX_POLL_INTERVAL 次每秒的建连和查询，连接多时应调大间隔或设置 CONN_MAX_AGE。
+INBOX_STREAM_PATH = '/api/v1/project-system/inbox/stream/'
+INBOX_POLL_INTERVAL = 5
+# 回扫最近多少秒内创建的事件，须大于 flow 事务的最长耗时（事件 id 在事务中分配，可能晚于更大的 id 提交）
+INBOX_EVENT_GRACE = 60
+# 角色目录、用户搜索索引、JWT 认证用户都缓存在 CACHES 中，由 accounts.signals 在用户修改时失效。
+# 本地内存缓存的失效只作用于当前进程，其他 worker 要等下面的过期时间后才更新（旧 ETag、已停用用户仍可认证），
+# 多进程/多机部署必须改为共享缓存，例如：
+# CACHES = {'default': {'BACKEND': 'django.core.cache.backends.redis.RedisCache', 'LOCATION': 'redis://127.0.0.1:6379/1'}}
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    }
+}
+# 选人控件角色目录缓存的兜底过期时间（秒）
+ROLE_DIRECTORY_CACHE_TIMEOUT = 300
+USER_SEARCH_INDEX_TIMEOUT = 300
+# JWT 认证用户缓存时间（秒），用户修改时由 signals 失效
+JWT_USER_CACHE_TIMEOUT = 60
+
+DISPLAY_URL='http://172.25.118.154:8081/PM_system/resultAction/inputData'
+# 展示平台推送：(连接, 读取) 超时秒数、最大尝试次数、重试退避基数（秒，指数增长）
+DISPLAY_TIMEOUT = (3.05, 30)
+DISPLAY_MAX_ATTEMPTS = 8
+DISPLAY_RETRY_BACKOFF = 30
+# sync_display 命令推送时文件地址的前缀（接口推送使用请求的 host）
+DISPLAY_FILE_BASE_URL = ''